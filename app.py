@@ -10,15 +10,14 @@ sys.path.insert(0, project_root)
 sys.path.insert(0, runtime_path)
 os.environ['PATH'] = runtime_path + os.pathsep + os.environ['PATH']
 
+import time
+_module_started = time.perf_counter()
+
 import yaml
-import gradio as gr
-from models import create_model
-from rag.vectorstore import VectorStore
-from rag.indexer import DocumentIndexer
-from tree_kb.tree_builder import KnowledgeTreeBuilder
-from ui.chat import create_chat_ui
-from ui.kb_manager import create_kb_manager_ui
-from ui.settings import create_settings_ui
+from utils.startup import StartupStatus, StartupProfiler
+
+# gradio、知识库组件和各界面模块较重，在首次使用它们的函数中才导入，
+# 使 import app 以及不需要界面的入口保持轻量
 
 # 加载配置
 def load_config():
@@ -26,98 +25,107 @@ def load_config():
         return yaml.safe_load(f)
 
 config = load_config()
+# 模块导入和读取配置的耗时，计入启动剖析的第一阶段
+_module_seconds = time.perf_counter() - _module_started
 
 # 初始化模型
 def init_model():
-    model_config = config["model"]
-    return create_model(
-        provider=model_config["provider"],
-        model_name=model_config["name"],
-        api_key=model_config.get("api_key", ""),
-        api_base=model_config.get("api_base", ""),
-        temperature=model_config.get("temperature", 0.7)
-    )
-
-def load_model():
-    """加载模型"""
-    try:
-        # 读取配置
-        with open("config.yaml", "r", encoding="utf-8") as f:
-            config = yaml.safe_load(f)
-
-        model_config = config.get("model", {})
-
-        # 打印模型配置
-        print("模型配置:")
-        print(f"- 提供者: {model_config.get('provider', 'N/A')}")
-        print(f"- 模型名称: {model_config.get('name', 'N/A')}")
-        print(f"- API基础URL: {model_config.get('api_base', 'N/A')}")
-        print(f"- API密钥设置: {'是' if model_config.get('api_key') else '否'}")
-
-        # 从配置创建模型
-        model = create_model(
-            provider=model_config.get("provider", ""),
-            model_name=model_config.get("name", ""),
-            api_key=model_config.get("api_key", ""),
-            api_base=model_config.get("api_base", ""),
-            temperature=float(model_config.get("temperature", 0.7))
-        )
-
-        return model
-    except Exception as e:
-        print(f"加载模型失败: {e}")
-        raise e
+    from service.core import init_model as create
+    return create(config)
 
 # 初始化知识库
 def init_knowledge_base():
-    kb_config = config["knowledge_base"]
-    vector_store = VectorStore(
-        embedding_model=kb_config["embedding_model"],
-        vector_dir=kb_config["vector_dir"]
-    )
-    indexer = DocumentIndexer(vector_store)
-    
-    # 如果配置为自动索引，则索引文档目录
-    if kb_config.get("auto_index", False):
-        # 使用增量索引
-        incremental = kb_config.get("incremental_index", True)
-        indexer.index_directory(kb_config["documents_dir"], incremental=incremental)
-    
-    # 初始化树状知识库
-    tree_builder = KnowledgeTreeBuilder(
-        documents_dir=kb_config["documents_dir"],
-        tree_index_path=kb_config["tree_index_path"]
-    )
-    
-    if kb_config.get("auto_build_tree", False):
-        tree_builder.build_tree()
-        
-    return {
-        "vector_store": vector_store,
-        "indexer": indexer,
-        "tree_builder": tree_builder
-    }
+    from service.core import init_knowledge_base as create
+    return create(config)
+
+def start_background_warmup(kb):
+    """在后台依次加载嵌入模型、增量索引新文档、重建知识树"""
+    from service.core import start_background_warmup as start
+    return start(config, kb)
 
 # 创建Gradio应用
-def create_app():
+def create_app(profiler: StartupProfiler = None):
+    """创建Gradio应用
+
+    Args:
+        profiler: 启动剖析器，传入时记录各阶段耗时
+    """
+    profiler = profiler or StartupProfiler()
+
     # 初始化模型和知识库
-    model = init_model()
-    kb = init_knowledge_base()
-    
+    with profiler.phase("初始化模型"):
+        from models.holder import ModelHolder
+        from service.core import (wrap_response_cache, create_history_manager, configure_tracing,
+                                  configure_logging, start_metrics_server)
+        # 日志级别在创建模型之前设置，连接器的日志按配置过滤
+        configure_logging(config)
+        model = init_model()
+
+    with profiler.phase("初始化知识库"):
+        kb = init_knowledge_base()
+
+    with profiler.phase("组装对话服务"):
+        # 每轮对话各阶段耗时的环形缓冲区和可选的JSON日志
+        configure_tracing(config)
+
+        # 可选的回复缓存，知识库索引版本变化后旧回复自动失效
+        model = wrap_response_cache(config, model, kb)
+
+        # 对话和设置页共享的模型持有者，切换模型时整体替换实例
+        ui_config = config.get("ui", {})
+        model_holder = ModelHolder(model, event_concurrency=ui_config.get("chat_concurrency", 4))
+
+        # 按模型上下文大小限制每轮发送的对话历史
+        history_manager = create_history_manager(config, model)
+
+    with profiler.phase("导入界面模块"):
+        import gradio as gr
+        from ui.chat import create_chat_ui
+        from ui.kb_manager import create_kb_manager_ui
+        from ui.settings import create_settings_ui
+
     # 创建Gradio界面
-    with gr.Blocks(theme=gr.themes.Soft(), title="AI助手") as app:
-        with gr.Tab("对话"):
-            create_chat_ui(model, kb)
-        
-        with gr.Tab("知识库管理"):
-            create_kb_manager_ui(kb)
-            
-        with gr.Tab("设置 (记得要“保存配置”)"):
-            create_settings_ui(config, model)
+    with profiler.phase("构建界面"):
+        with gr.Blocks(theme=gr.themes.Soft(), title="AI助手") as app:
+            with gr.Tab("对话"):
+                create_chat_ui(model_holder, kb, history_manager)
+
+            with gr.Tab("知识库管理"):
+                create_kb_manager_ui(kb)
+
+            with gr.Tab("设置 (记得要“保存配置”)"):
+                create_settings_ui(config, model_holder)
+
+    with profiler.phase("队列与后台任务"):
+        # 流式回复依赖Gradio的队列；对话处理函数是异步的，多个对话可在同一进程中并发进行，
+        # 每个模型后端的并发对话数由 model_holder 限制，排队请求数超过 max_queue_size 时拒绝新请求
+        app.queue(
+            concurrency_count=int(ui_config.get("concurrency_count", 16)),
+            max_size=ui_config.get("max_queue_size", 64)
+        )
+
+        # 界面已就绪，耗时的初始化工作交给后台线程
+        start_background_warmup(kb)
+
+        # 可选的 Prometheus 指标服务
+        start_metrics_server(config)
 
     return app
 
 # 运行应用
 if __name__ == "__main__":
-    app = create_app()
-    app.launch(server_name="127.0.0.1", server_port=7860, share=False)
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="MarkTreeChat")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="输出启动过程各阶段的耗时")
+    args = parser.parse_args()
+
+    profiler = StartupProfiler()
+    profiler.record("导入与读取配置", _module_seconds)
+    app = create_app(profiler)
+    with profiler.phase("启动服务器"):
+        app.launch(server_name="127.0.0.1", server_port=7860, share=False, prevent_thread_lock=True)
+    if args.profile_startup:
+        print("启动耗时:")
+        print(profiler.report())
+    app.block_thread()
@@ -0,0 +1,105 @@
+"""批量检索基准测试
+
+比较逐个调用 Retriever.retrieve 与一次调用 Retriever.retrieve_batch 的吞吐量（查询/秒），
+并检查两者返回的结果一致。嵌入使用确定性的随机向量，测得的是打分和选取的开销；
+--embed-latency-ms 可模拟每次调用嵌入模型的固定延迟。
+
+用法: python -m benchmarks.bench_retrieval_batch --docs 100000 --queries 1000
+"""
+import os
+import sys
+import time
+import zlib
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rag.vectorstore import VectorStore
+from rag.retriever import Retriever
+
+
+class RandomEmbeddingStore(VectorStore):
+    """由文本哈希决定的随机嵌入，不加载任何嵌入模型"""
+
+    def __init__(self, vector_dir: str, dim: int, latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+        self.embed_calls = 0
+        super().__init__(embedding_model="random", vector_dir=vector_dir)
+
+    def _vector(self, text: str) -> np.ndarray:
+        rng = np.random.default_rng(zlib.crc32(text.encode("utf-8")))
+        return rng.standard_normal(self.dim).astype(np.float32)
+
+    def get_embedding(self, text: str) -> np.ndarray:
+        self.embed_calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self._vector(text)
+
+    def get_embeddings(self, texts, batch_size: int = 64) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        # 每批模拟一次模型调用的延迟
+        calls = (len(texts) + batch_size - 1) // batch_size
+        self.embed_calls += calls
+        if self.latency:
+            time.sleep(self.latency * calls)
+        return np.stack([self._vector(text) for text in texts])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比较逐个检索与批量检索的吞吐量")
+    parser.add_argument("--docs", type=int, default=100000, help="文档块数量")
+    parser.add_argument("--dim", type=int, default=384, help="嵌入维度")
+    parser.add_argument("--queries", type=int, default=1000, help="查询数量")
+    parser.add_argument("--top-k", type=int, default=5, help="每个查询返回的文档数量")
+    parser.add_argument("--batch-size", type=int, default=256, help="每次 retrieve_batch 的查询数")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="模拟每次嵌入调用的延迟（毫秒）")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = RandomEmbeddingStore(os.path.join(tmp, "vectors"), args.dim)
+        store.autosave = False
+        print(f"生成 {args.docs} 个 {args.dim} 维文档块...")
+        store.add_documents([(f"doc_{i}", f"文档 {i}", {"source": f"file_{i // 20}.md", "chunk_index": i % 20})
+                             for i in range(args.docs)])
+        store.get_matrix()  # 归一化矩阵只计算一次，不计入检索耗时
+        store.latency = args.embed_latency_ms / 1000
+
+        retriever = Retriever(store)
+        queries = [f"查询 {i}" for i in range(args.queries)]
+
+        store.embed_calls = 0
+        start = time.perf_counter()
+        single = [retriever.retrieve(query, top_k=args.top_k) for query in queries]
+        single_seconds = time.perf_counter() - start
+        single_calls = store.embed_calls
+
+        store.embed_calls = 0
+        start = time.perf_counter()
+        batched = []
+        for offset in range(0, len(queries), args.batch_size):
+            batched.extend(retriever.retrieve_batch(queries[offset:offset + args.batch_size], top_k=args.top_k))
+        batch_seconds = time.perf_counter() - start
+        batch_calls = store.embed_calls
+
+    mismatches = sum(1 for a, b in zip(single, batched)
+                     if [r["metadata"]["chunk_index"] for r in a] != [r["metadata"]["chunk_index"] for r in b]
+                     or [r["metadata"]["source"] for r in a] != [r["metadata"]["source"] for r in b])
+
+    print("\n方式          查询数    耗时(秒)    查询/秒    嵌入调用    加速比")
+    for name, seconds, calls in [("逐个", single_seconds, single_calls), ("批量", batch_seconds, batch_calls)]:
+        qps = args.queries / seconds if seconds else 0.0
+        speedup = single_seconds / seconds if seconds else 0.0
+        print(f"{name:<10}{args.queries:>10}{seconds:>12.3f}{qps:>11.0f}{calls:>12}{speedup:>9.2f}x")
+    print(f"\n结果不一致的查询: {mismatches}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
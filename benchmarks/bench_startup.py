@@ -0,0 +1,114 @@
+"""启动耗时基准测试
+
+在子进程中以 python -X importtime 导入入口模块，统计导入耗时并检查预算，
+同时确认重型依赖没有在导入阶段被加载。加 --create-app 时还会构建完整的
+Gradio应用并输出各阶段耗时（需要安装gradio）。
+
+用法: python -m benchmarks.bench_startup --budget-ms 300
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# import app 时不应加载的重型依赖，它们只在首次使用时导入
+HEAVY_MODULES = [
+    "gradio", "openai", "networkx", "numpy", "httpx", "requests",
+    "tiktoken", "sentence_transformers", "torch",
+]
+
+
+def parse_importtime(stderr: str):
+    """解析 -X importtime 的输出
+
+    Returns:
+        (总耗时毫秒, {模块名: 累计耗时毫秒})
+    """
+    modules = {}
+    total_us = 0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        # 格式: "import time: <自身微秒> | <累计微秒> | <缩进的模块名>"
+        _, cumulative_us, name = line.split(":", 1)[1].split("|")
+        name = name[1:].rstrip()
+        cumulative = int(cumulative_us)
+        # 没有缩进的是顶层导入，它们的累计耗时之和即为总导入耗时
+        if not name.startswith(" "):
+            total_us += cumulative
+        modules[name.strip()] = cumulative / 1000
+    return total_us / 1000, modules
+
+
+def measure_import(module: str):
+    """在新的解释器中导入模块，返回 (总耗时毫秒, 各模块耗时)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def profile_create_app():
+    """在子进程中构建完整应用并输出各阶段耗时"""
+    code = (
+        "import app\n"
+        "profiler = app.StartupProfiler()\n"
+        "profiler.record('导入与读取配置', app._module_seconds)\n"
+        "app.create_app(profiler)\n"
+        "print(profiler.report())\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=PROJECT_ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"构建应用失败:\n{result.stderr[-2000:]}")
+    return result.stdout
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量入口模块的导入耗时并检查预算")
+    parser.add_argument("--module", default="app", help="要测量的入口模块")
+    parser.add_argument("--runs", type=int, default=5, help="重复次数，取中位数")
+    parser.add_argument("--budget-ms", type=float, default=300.0, help="导入耗时预算（毫秒）")
+    parser.add_argument("--top", type=int, default=10, help="列出耗时最多的模块数量")
+    parser.add_argument("--create-app", action="store_true", help="同时构建完整应用并输出各阶段耗时")
+    args = parser.parse_args()
+
+    totals = []
+    modules = {}
+    for _ in range(args.runs):
+        total, modules = measure_import(args.module)
+        totals.append(total)
+    median = statistics.median(totals)
+
+    print(f"import {args.module}: 中位数 {median:.1f} 毫秒（{args.runs} 次: "
+          f"{', '.join(f'{t:.1f}' for t in totals)}）")
+    print(f"\n累计耗时最多的 {args.top} 个模块:")
+    for name, ms in sorted(modules.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {ms:>9.1f} 毫秒  {name}")
+
+    failures = []
+    if median > args.budget_ms:
+        failures.append(f"导入耗时 {median:.1f} 毫秒超出预算 {args.budget_ms:.1f} 毫秒")
+    eager = [name for name in HEAVY_MODULES if name in modules]
+    if eager:
+        failures.append(f"导入阶段加载了重型依赖: {', '.join(eager)}")
+
+    if args.create_app:
+        print("\n构建应用各阶段耗时:")
+        print(profile_create_app())
+
+    if failures:
+        print("\n检查未通过:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("\n检查通过")
+
+
+if __name__ == "__main__":
+    main()
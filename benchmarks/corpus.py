@@ -0,0 +1,129 @@
+import os
+import random
+from typing import List
+
+# 合成语料的词表：中文术语、英文术语和数学公式片段
+CJK_TERMS = [
+    "极限", "导数", "积分", "级数", "定理", "刚体", "矩阵", "向量", "特征值", "行列式",
+    "微分方程", "傅里叶变换", "拉格朗日", "动量", "角动量", "电场", "磁场", "热力学", "熵", "概率",
+    "期望", "方差", "随机变量", "收敛", "连续", "可导", "偏导数", "梯度", "散度", "旋度",
+    "复数", "多项式", "线性空间", "基底", "正交", "投影", "内积", "范数", "群", "环",
+]
+LATIN_TERMS = [
+    "limit", "derivative", "integral", "series", "theorem", "rigid", "matrix", "vector", "eigenvalue",
+    "determinant", "equation", "fourier", "lagrangian", "momentum", "field", "entropy", "probability",
+    "expectation", "variance", "random", "convergence", "continuous", "gradient", "divergence", "curl",
+    "complex", "polynomial", "linear", "basis", "orthogonal", "projection", "norm", "group", "ring",
+    "proof", "lemma", "corollary", "definition", "example", "exercise",
+]
+INLINE_MATH = [
+    r"$\lim_{x \to 0} \frac{\sin x}{x} = 1$",
+    r"$\int_a^b f(x)\,dx$",
+    r"$\sum_{n=1}^{\infty} \frac{1}{n^2} = \frac{\pi^2}{6}$",
+    r"$\nabla \cdot \mathbf{E} = \frac{\rho}{\varepsilon_0}$",
+    r"$A\mathbf{x} = \lambda \mathbf{x}$",
+    r"$e^{i\pi} + 1 = 0$",
+]
+DISPLAY_MATH = [
+    "$$\n\\frac{d}{dt}\\frac{\\partial L}{\\partial \\dot q} - \\frac{\\partial L}{\\partial q} = 0\n$$",
+    "$$\n\\det(A - \\lambda I) = 0\n$$",
+    "$$\nf(x) = \\sum_{n=0}^{\\infty} \\frac{f^{(n)}(a)}{n!}(x-a)^n\n$$",
+]
+
+
+def _dir_parts(dir_index: int, depth: int, dirs_per_dir: int) -> List[str]:
+    """第 dir_index 个叶子目录的相对路径，depth 为目录层数"""
+    if depth <= 1:
+        return [f"dir_{dir_index:04d}"]
+    parts = []
+    for level in range(depth):
+        span = dirs_per_dir ** (depth - 1 - level)
+        parts.append(f"d{level}_{(dir_index // span) % dirs_per_dir:03d}")
+    return parts
+
+
+def _words(rng: random.Random, count: int, cjk_ratio: float, topic: List[str]) -> str:
+    """生成一段按比例混合中英文术语的文本，约三分之一的词取自文件主题"""
+    words = []
+    for _ in range(count):
+        if rng.random() < 0.3:
+            words.append(rng.choice(topic))
+        elif rng.random() < cjk_ratio:
+            words.append(rng.choice(CJK_TERMS))
+        else:
+            words.append(rng.choice(LATIN_TERMS))
+    return " ".join(words)
+
+
+def generate_corpus(root: str, files: int = 1000, files_per_dir: int = 50,
+                    headers_per_file: int = 8, paragraphs_per_header: int = 3,
+                    seed: int = 0, depth: int = 1, dirs_per_dir: int = 8,
+                    max_header_level: int = 3, words_per_paragraph: int = 20,
+                    cjk_ratio: float = 0.6, math_ratio: float = 0.0,
+                    link_ratio: float = 0.0) -> int:
+    """生成用于基准测试的合成Markdown语料
+
+    Args:
+        root: 输出目录
+        files: 文件数量
+        files_per_dir: 每个目录中的文件数量
+        headers_per_file: 每个文件中的标题数量
+        paragraphs_per_header: 每个标题下的段落数量
+        seed: 随机种子，相同参数生成相同语料
+        depth: 目录层数
+        dirs_per_dir: 多层目录时每个目录下的子目录数量
+        max_header_level: 最深的标题级别（1~6）
+        words_per_paragraph: 每个段落的词数
+        cjk_ratio: 中文术语所占比例，其余为英文术语
+        math_ratio: 段落中包含数学公式的比例，其中约四分之一为行间公式
+        link_ratio: 段落中包含指向其他文件的Markdown链接的比例
+
+    Returns:
+        生成的文件数量
+    """
+    rng = random.Random(seed)
+    levels = list(range(2, max(2, min(max_header_level, 6)) + 1))
+    paths = [os.path.join(*_dir_parts(i // files_per_dir, depth, dirs_per_dir), f"note_{i:06d}.md")
+             for i in range(files)]
+
+    for i, rel_path in enumerate(paths):
+        file_path = os.path.join(root, rel_path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        # 每个文件有几个主题词，使检索有可区分的目标
+        topic = rng.sample(CJK_TERMS, 2) + rng.sample(LATIN_TERMS, 2)
+
+        lines = []
+        for h in range(headers_per_file):
+            level = 1 if h == 0 else rng.choice(levels)
+            lines.append(f"{'#' * level} 标题 {i}-{h} {topic[h % len(topic)]}")
+            lines.append("")
+            for _ in range(paragraphs_per_header):
+                paragraph = _words(rng, words_per_paragraph, cjk_ratio, topic)
+                if rng.random() < math_ratio:
+                    if rng.random() < 0.25:
+                        paragraph += "\n\n" + rng.choice(DISPLAY_MATH)
+                    else:
+                        paragraph += " " + rng.choice(INLINE_MATH)
+                if files > 1 and rng.random() < link_ratio:
+                    target = paths[rng.randrange(files)]
+                    link = os.path.relpath(os.path.join(root, target), os.path.dirname(file_path))
+                    paragraph += f" 参见 [{os.path.basename(target)}]({link.replace(os.sep, '/')})"
+                lines.append(paragraph)
+                lines.append("")
+
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+
+    return files
+
+
+def generate_queries(count: int, seed: int = 0, cjk_ratio: float = 0.6,
+                     words_per_query: int = 3) -> List[str]:
+    """生成与合成语料同词表的检索问题"""
+    rng = random.Random(seed + 1)
+    queries = []
+    for _ in range(count):
+        words = [rng.choice(CJK_TERMS) if rng.random() < cjk_ratio else rng.choice(LATIN_TERMS)
+                 for _ in range(words_per_query)]
+        queries.append(" ".join(words))
+    return queries
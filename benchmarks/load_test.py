@@ -0,0 +1,225 @@
+"""模型连接器压测
+
+用 models/ 中真实的连接器（经过共享连接池、异步客户端和并发信号量）同时进行多轮对话，
+统计首字延迟（TTFT）和完整回复耗时的 p50/p95/p99、吞吐量和错误率。
+默认在进程内启动 benchmarks.mock_llm_server，也可以用 --api-base 指向已运行的服务。
+
+用法: python -m benchmarks.load_test --provider lmstudio --mode async --conversations 50 --turns 3 --concurrency 16
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import create_model, http_pool, async_http
+from benchmarks.suite import percentile
+from benchmarks.mock_llm_server import MockLLMServer, add_settings_arguments, settings_from_args
+
+# moonshot 连接器的 api_base 固定为官方地址，无法指向模拟服务
+PROVIDERS = ["lmstudio", "openai", "deepseek", "ollama"]
+
+
+def provider_api_base(provider: str, server_url: str) -> str:
+    """模拟服务地址对应的连接器 api_base，Ollama 不带 /v1 前缀"""
+    return server_url if provider == "ollama" else f"{server_url}/v1"
+
+
+def user_message(conversation: int, turn: int) -> str:
+    return f"第 {conversation} 个对话的第 {turn} 轮 question {conversation} {turn}"
+
+
+class Recorder:
+    """收集每次请求的耗时，线程和协程中都只做追加"""
+
+    def __init__(self):
+        self.ttft: List[float] = []
+        self.latency: List[float] = []
+        self.deltas = 0
+        self.chars = 0
+        self.errors: Dict[str, int] = {}
+
+    def success(self, ttft: float, latency: float, deltas: int, chars: int):
+        self.ttft.append(ttft)
+        self.latency.append(latency)
+        self.deltas += deltas
+        self.chars += chars
+
+    def failure(self, error: Exception):
+        key = type(error).__name__
+        self.errors[key] = self.errors.get(key, 0) + 1
+
+    def summary(self, wall_seconds: float) -> Dict[str, Any]:
+        succeeded = len(self.latency)
+        failed = sum(self.errors.values())
+        total = succeeded + failed
+
+        def stats(samples):
+            return {f"p{p}_ms": percentile(samples, p) * 1000 for p in (50, 95, 99)}
+
+        return {
+            "requests": total,
+            "succeeded": succeeded,
+            "failed": failed,
+            "error_rate": failed / total if total else 0.0,
+            "errors": self.errors,
+            "wall_seconds": wall_seconds,
+            "requests_per_sec": succeeded / wall_seconds if wall_seconds else 0.0,
+            "deltas_per_sec": self.deltas / wall_seconds if wall_seconds else 0.0,
+            "chars_per_sec": self.chars / wall_seconds if wall_seconds else 0.0,
+            "ttft": stats(self.ttft),
+            "latency": stats(self.latency),
+        }
+
+
+def run_threads(model, args, recorder: Recorder):
+    """每个对话占用一个线程，调用同步的 stream_chat / chat"""
+
+    def conversation(index: int):
+        messages = []
+        for turn in range(args.turns):
+            messages.append({"role": "user", "content": user_message(index, turn)})
+            start = time.perf_counter()
+            ttft = None
+            deltas = 0
+            parts = []
+            try:
+                if args.no_stream:
+                    parts.append(model.chat(messages, args.system_prompt))
+                    ttft = time.perf_counter() - start
+                    deltas = 1
+                else:
+                    for delta in model.stream_chat(messages, args.system_prompt):
+                        if ttft is None:
+                            ttft = time.perf_counter() - start
+                        deltas += 1
+                        parts.append(delta)
+            except Exception as e:
+                recorder.failure(e)
+                messages.pop()
+                continue
+            latency = time.perf_counter() - start
+            reply = "".join(parts)
+            recorder.success(ttft if ttft is not None else latency, latency, deltas, len(reply))
+            messages.append({"role": "assistant", "content": reply})
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(conversation, range(args.conversations)))
+
+
+async def run_async(model, args, recorder: Recorder):
+    """所有对话在一个事件循环中并发，调用 astream_chat / achat"""
+    limit = asyncio.Semaphore(args.concurrency)
+
+    async def conversation(index: int):
+        async with limit:
+            messages = []
+            for turn in range(args.turns):
+                messages.append({"role": "user", "content": user_message(index, turn)})
+                start = time.perf_counter()
+                ttft = None
+                deltas = 0
+                parts = []
+                try:
+                    if args.no_stream:
+                        parts.append(await model.achat(messages, args.system_prompt))
+                        ttft = time.perf_counter() - start
+                        deltas = 1
+                    else:
+                        async for delta in model.astream_chat(messages, args.system_prompt):
+                            if ttft is None:
+                                ttft = time.perf_counter() - start
+                            deltas += 1
+                            parts.append(delta)
+                except Exception as e:
+                    recorder.failure(e)
+                    messages.pop()
+                    continue
+                latency = time.perf_counter() - start
+                reply = "".join(parts)
+                recorder.success(ttft if ttft is not None else latency, latency, deltas, len(reply))
+                messages.append({"role": "assistant", "content": reply})
+
+    await asyncio.gather(*(conversation(i) for i in range(args.conversations)))
+
+
+def print_summary(summary: Dict[str, Any]):
+    print(f"\n请求: {summary['requests']}  成功: {summary['succeeded']}  失败: {summary['failed']}"
+          f"  错误率: {summary['error_rate']:.2%}")
+    if summary["errors"]:
+        print("错误类型: " + ", ".join(f"{name} x{count}" for name, count in summary["errors"].items()))
+    print(f"总耗时: {summary['wall_seconds']:.2f}s  请求/秒: {summary['requests_per_sec']:.1f}"
+          f"  片段/秒: {summary['deltas_per_sec']:.0f}  字符/秒: {summary['chars_per_sec']:.0f}")
+    print("\n指标          p50(ms)    p95(ms)    p99(ms)")
+    for name, key in [("首字延迟", "ttft"), ("完整回复", "latency")]:
+        s = summary[key]
+        print(f"{name:<10}{s['p50_ms']:>11.1f}{s['p95_ms']:>11.1f}{s['p99_ms']:>11.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用真实的模型连接器压测对话请求")
+    parser.add_argument("--provider", choices=PROVIDERS, default="lmstudio", help="使用的连接器")
+    parser.add_argument("--api-base", default=None, help="已运行服务的 api_base，不指定则启动进程内模拟服务")
+    parser.add_argument("--api-key", default="mock", help="API密钥")
+    parser.add_argument("--model", default="mock-model", help="模型名称")
+    parser.add_argument("--mode", choices=["async", "thread"], default="async",
+                        help="async 使用 astream_chat，thread 在线程池中使用 stream_chat")
+    parser.add_argument("--no-stream", action="store_true", help="使用非流式的 chat / achat")
+    parser.add_argument("--conversations", type=int, default=50, help="对话数量")
+    parser.add_argument("--turns", type=int, default=3, help="每个对话的轮数，历史随轮数增长")
+    parser.add_argument("--concurrency", type=int, default=16, help="同时进行的对话数")
+    parser.add_argument("--max-concurrency", type=int, default=None,
+                        help="异步客户端每个提供商的并发上限，默认等于 --concurrency")
+    parser.add_argument("--pool-size", type=int, default=None, help="连接池大小，默认等于 --concurrency")
+    parser.add_argument("--system-prompt", default=None, help="系统提示")
+    parser.add_argument("--output", default=None, help="结果写入的JSON文件")
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    server = None
+    api_base = args.api_base
+    if api_base is None:
+        server = MockLLMServer(("127.0.0.1", 0), settings_from_args(args))
+        server.start()
+        api_base = provider_api_base(args.provider, server.url)
+
+    http_pool.configure(pool_size=args.pool_size or args.concurrency)
+    async_http.configure(max_concurrency=args.max_concurrency or args.concurrency)
+    model = create_model(args.provider, args.model, args.api_key, api_base, 0.7)
+
+    print(f"{args.conversations} 个对话 x {args.turns} 轮，并发 {args.concurrency}，"
+          f"模式 {args.mode}{'（非流式）' if args.no_stream else ''}")
+    recorder = Recorder()
+    start = time.perf_counter()
+    if args.mode == "async":
+        asyncio.run(run_async(model, args, recorder))
+    else:
+        run_threads(model, args, recorder)
+    wall_seconds = time.perf_counter() - start
+
+    summary = recorder.summary(wall_seconds)
+    print_summary(summary)
+
+    report = {
+        "params": {k: v for k, v in vars(args).items() if k != "api_key"},
+        "api_base": api_base,
+        "results": summary,
+        "pool": http_pool.get_pool_stats(),
+    }
+    if server is not None:
+        report["mock"] = dict(server.stats)
+        server.shutdown()
+        server.server_close()
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""本地模拟大模型服务
+
+兼容 OpenAI 接口（/v1/chat/completions 流式与非流式、/v1/models、/v1/embeddings）和
+Ollama 接口（/api/chat、/api/tags），可配置首字延迟、输出速度和错误注入，
+用于在不消耗API额度、不占用本地推理机器的情况下压测对话链路。
+GET /mock/stats 返回各接口的请求数和注入的错误数。
+
+用法: python -m benchmarks.mock_llm_server --port 8765 --latency-ms 200 --tokens-per-sec 50 --error-rate 0.02
+连接器配置: lmstudio / openai 的 api_base 为 http://127.0.0.1:8765/v1，ollama 为 http://127.0.0.1:8765
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.offline import hash_embedding
+
+
+class MockSettings:
+    """模拟服务的行为参数，运行中修改立即生效"""
+
+    def __init__(self, latency: float = 0.2, jitter: float = 0.0, tokens_per_sec: float = 50.0,
+                 reply_tokens: int = 64, error_rate: float = 0.0, error_status: int = 500,
+                 stream_error_rate: float = 0.0, embedding_dim: int = 256,
+                 models: Optional[List[str]] = None, seed: Optional[int] = None):
+        """
+        Args:
+            latency: 收到请求到第一个token的延迟（秒）
+            jitter: 延迟的随机波动幅度（秒），实际延迟在 latency ± jitter 之间
+            tokens_per_sec: 输出速度，0表示不限
+            reply_tokens: 每次回复的token数
+            error_rate: 直接返回错误状态码的请求比例
+            error_status: 注入错误时的状态码
+            stream_error_rate: 流式回复中途断开连接的比例
+            embedding_dim: /v1/embeddings 返回的向量维度
+            models: 模型列表接口返回的模型名称
+            seed: 随机种子，相同种子下注入的错误序列相同
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_sec = tokens_per_sec
+        self.reply_tokens = reply_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stream_error_rate = stream_error_rate
+        self.embedding_dim = embedding_dim
+        self.models = models or ["mock-model"]
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+
+    def roll(self, rate: float) -> bool:
+        if rate <= 0:
+            return False
+        with self.rng_lock:
+            return self.rng.random() < rate
+
+    def first_token_delay(self) -> float:
+        if not self.jitter:
+            return self.latency
+        with self.rng_lock:
+            return max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], settings: Optional[MockSettings] = None):
+        super().__init__(address, MockRequestHandler)
+        self.settings = settings or MockSettings()
+        self.stats = Counter()
+        self._stats_lock = threading.Lock()
+
+    def count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> threading.Thread:
+        """在后台线程中运行，供压测脚本在同一进程中使用"""
+        thread = threading.Thread(target=self.serve_forever, name="mock-llm", daemon=True)
+        thread.start()
+        return thread
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 使连接可以复用，流式回复使用分块传输编码
+    protocol_version = "HTTP/1.1"
+    server_version = "MockLLM"
+    # 逐块写出的小数据包不等待合并，否则延迟确认会给每个请求多加几十毫秒
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def settings(self) -> MockSettings:
+        return self.server.settings
+
+    def _send_json(self, status: int, payload: Dict[str, Any]):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _reply_tokens(self, messages: List[Dict[str, str]]) -> List[str]:
+        """回复复述最后一条用户消息中的词，便于检查请求内容"""
+        last = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        words = last.split() or ["mock"]
+        return [words[i % len(words)] + " " for i in range(self.settings.reply_tokens)]
+
+    def _wait_first_token(self):
+        delay = self.settings.first_token_delay()
+        if delay:
+            time.sleep(delay)
+
+    def _wait_token(self):
+        if self.settings.tokens_per_sec:
+            time.sleep(1 / self.settings.tokens_per_sec)
+
+    def _inject_error(self) -> bool:
+        if self.settings.roll(self.settings.error_rate):
+            self.server.count("injected_errors")
+            self._send_json(self.settings.error_status, {"error": {"message": "injected error", "type": "mock"}})
+            return True
+        return False
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _stream(self, content_type: str, chunks):
+        """以分块传输编码流式返回，按设置中途断开连接"""
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        abort_at = None
+        if self.settings.roll(self.settings.stream_error_rate):
+            self.server.count("injected_stream_aborts")
+            abort_at = self.settings.reply_tokens // 2
+        try:
+            for i, chunk in enumerate(chunks):
+                if abort_at is not None and i >= abort_at:
+                    # 不发送结束块直接关闭连接，客户端看到不完整的响应
+                    self.close_connection = True
+                    return
+                self._write_chunk(chunk)
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            self.server.count("client_disconnects")
+            self.close_connection = True
+
+    def do_GET(self):
+        self.server.count(f"GET {self.path}")
+        if self.path in ("/v1/models", "/models"):
+            self._send_json(200, {"object": "list", "data": [
+                {"id": name, "object": "model", "owned_by": "mock"} for name in self.settings.models]})
+        elif self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": name, "model": name} for name in self.settings.models]})
+        elif self.path == "/mock/stats":
+            self._send_json(200, dict(self.server.stats))
+        else:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        self.server.count(f"POST {self.path}")
+        try:
+            data = self._read_json()
+        except ValueError:
+            self._send_json(400, {"error": "invalid json"})
+            return
+        routes = {
+            "/v1/chat/completions": self._openai_chat,
+            "/chat/completions": self._openai_chat,
+            "/v1/embeddings": self._embeddings,
+            "/embeddings": self._embeddings,
+            "/api/chat": self._ollama_chat,
+        }
+        handler = routes.get(self.path)
+        if handler is None:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+            return
+        if self._inject_error():
+            return
+        handler(data)
+
+    def _openai_chat(self, data: Dict[str, Any]):
+        model = data.get("model") or self.settings.models[0]
+        tokens = self._reply_tokens(data.get("messages", []))
+        created = int(time.time())
+        completion_id = f"chatcmpl-mock-{created}"
+        self._wait_first_token()
+
+        if not data.get("stream"):
+            for _ in tokens[1:]:
+                self._wait_token()
+            self._send_json(200, {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+            })
+            return
+
+        def chunks():
+            for i, token in enumerate(tokens):
+                if i:
+                    self._wait_token()
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                         "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8")
+            final = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            yield f"data: {json.dumps(final)}\n\n".encode("utf-8")
+            yield b"data: [DONE]\n\n"
+
+        self._stream("text/event-stream", chunks())
+
+    def _ollama_chat(self, data: Dict[str, Any]):
+        model = data.get("model") or self.settings.models[0]
+        tokens = self._reply_tokens(data.get("messages", []))
+        self._wait_first_token()
+
+        # Ollama 的 /api/chat 默认流式
+        if data.get("stream") is False:
+            for _ in tokens[1:]:
+                self._wait_token()
+            self._send_json(200, {"model": model, "message": {"role": "assistant", "content": "".join(tokens)},
+                                  "done": True, "eval_count": len(tokens)})
+            return
+
+        def chunks():
+            for i, token in enumerate(tokens):
+                if i:
+                    self._wait_token()
+                line = {"model": model, "message": {"role": "assistant", "content": token}, "done": False}
+                yield (json.dumps(line, ensure_ascii=False) + "\n").encode("utf-8")
+            yield (json.dumps({"model": model, "message": {"role": "assistant", "content": ""},
+                               "done": True, "eval_count": len(tokens)}) + "\n").encode("utf-8")
+
+        self._stream("application/x-ndjson", chunks())
+
+    def _embeddings(self, data: Dict[str, Any]):
+        inputs = data.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        self._wait_first_token()
+        self._send_json(200, {
+            "object": "list",
+            "model": data.get("model") or "mock-embedding",
+            "data": [{"object": "embedding", "index": i,
+                      "embedding": hash_embedding(str(text), self.settings.embedding_dim).tolist()}
+                     for i, text in enumerate(inputs)],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        })
+
+
+def add_settings_arguments(parser: argparse.ArgumentParser):
+    """模拟服务行为参数的命令行选项，压测脚本复用"""
+    group = parser.add_argument_group("模拟服务")
+    group.add_argument("--latency-ms", type=float, default=200.0, help="首个token的延迟（毫秒）")
+    group.add_argument("--jitter-ms", type=float, default=0.0, help="延迟的随机波动（毫秒）")
+    group.add_argument("--tokens-per-sec", type=float, default=50.0, help="输出速度，0表示不限")
+    group.add_argument("--reply-tokens", type=int, default=64, help="每次回复的token数")
+    group.add_argument("--error-rate", type=float, default=0.0, help="直接返回错误的请求比例")
+    group.add_argument("--error-status", type=int, default=500, help="注入错误的状态码")
+    group.add_argument("--stream-error-rate", type=float, default=0.0, help="流式回复中途断开的比例")
+    group.add_argument("--seed", type=int, default=None, help="错误注入的随机种子")
+
+
+def settings_from_args(args) -> MockSettings:
+    return MockSettings(
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        tokens_per_sec=args.tokens_per_sec,
+        reply_tokens=args.reply_tokens,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        stream_error_rate=args.stream_error_rate,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI / Ollama 兼容的本地模拟大模型服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8765, help="监听端口")
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockLLMServer((args.host, args.port), settings_from_args(args))
+    print(f"模拟服务已启动: {server.url}（OpenAI 接口 {server.url}/v1，Ollama 接口 {server.url}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""基准测试使用的离线组件：确定性的哈希嵌入和回显模型，不下载模型、不访问网络"""
+import re
+import time
+import zlib
+import asyncio
+from typing import List, Dict, Optional, Iterator, AsyncIterator
+
+import numpy as np
+
+from rag.vectorstore import VectorStore
+from models.base import BaseModel
+
+_LATIN_TOKEN = re.compile(r"[a-z0-9]+")
+_CJK_RUN = re.compile(r"[一-鿿]+")
+
+
+def hash_tokens(text: str) -> List[str]:
+    """英文按单词、中文按单字和相邻两字切分"""
+    text = text.lower()
+    tokens = _LATIN_TOKEN.findall(text)
+    for run in _CJK_RUN.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def hash_embedding(text: str, dim: int = 256) -> np.ndarray:
+    """特征哈希嵌入：每个词用 crc32 映射到一个维度并带正负号，最后归一化"""
+    vector = np.zeros(dim, dtype=np.float32)
+    for token in hash_tokens(text):
+        h = zlib.crc32(token.encode("utf-8"))
+        vector[h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class HashingEmbeddingStore(VectorStore):
+    """用 hash_embedding 计算嵌入的向量存储
+
+    相同文本在任何进程中得到相同的向量，相关文本共享维度，检索结果有意义。
+    """
+
+    def __init__(self, vector_dir: str, dim: int = 256, latency: float = 0.0):
+        """
+        Args:
+            vector_dir: 向量目录
+            dim: 嵌入维度
+            latency: 每次嵌入调用模拟的延迟（秒）
+        """
+        self.dim = dim
+        self.latency = latency
+        self.embed_calls = 0
+        super().__init__(embedding_model=f"hashing-{dim}", vector_dir=vector_dir)
+
+    def sibling(self, vector_dir: str) -> "HashingEmbeddingStore":
+        return HashingEmbeddingStore(vector_dir, self.dim, self.latency)
+
+    def _vector(self, text: str) -> np.ndarray:
+        return hash_embedding(text, self.dim)
+
+    def get_embedding(self, text: str) -> np.ndarray:
+        self.embed_calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self._vector(text)
+
+    def get_embeddings(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        # 每批模拟一次模型调用的延迟
+        calls = (len(texts) + batch_size - 1) // batch_size
+        self.embed_calls += calls
+        if self.latency:
+            time.sleep(self.latency * calls)
+        return np.stack([self._vector(text) for text in texts])
+
+    def warm_up(self):
+        pass
+
+
+class EchoModel(BaseModel):
+    """复述用户问题的模型，按固定速度逐词流式输出，用于测量对话流程本身的开销"""
+
+    def __init__(self, reply_tokens: int = 50, tokens_per_sec: float = 0.0):
+        """
+        Args:
+            reply_tokens: 每次回复的片段数
+            tokens_per_sec: 输出速度，0表示不等待
+        """
+        super().__init__("echo")
+        self.reply_tokens = reply_tokens
+        self.tokens_per_sec = tokens_per_sec
+
+    def _pieces(self, messages: List[Dict[str, str]]) -> List[str]:
+        words = (messages[-1]["content"] if messages else "").split() or ["echo"]
+        return [words[i % len(words)] + " " for i in range(self.reply_tokens)]
+
+    def chat(self, messages: List[Dict[str, str]], system_prompt: Optional[str] = None,
+             temperature: Optional[float] = None) -> str:
+        return "".join(self._pieces(messages))
+
+    def stream_chat(self, messages: List[Dict[str, str]], system_prompt: Optional[str] = None,
+                    temperature: Optional[float] = None) -> Iterator[str]:
+        for piece in self._pieces(messages):
+            if self.tokens_per_sec:
+                time.sleep(1 / self.tokens_per_sec)
+            yield piece
+
+    async def achat(self, messages: List[Dict[str, str]], system_prompt: Optional[str] = None,
+                    temperature: Optional[float] = None) -> str:
+        return self.chat(messages, system_prompt, temperature)
+
+    async def astream_chat(self, messages: List[Dict[str, str]], system_prompt: Optional[str] = None,
+                           temperature: Optional[float] = None) -> AsyncIterator[str]:
+        for piece in self._pieces(messages):
+            if self.tokens_per_sec:
+                await asyncio.sleep(1 / self.tokens_per_sec)
+            yield piece
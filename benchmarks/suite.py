@@ -0,0 +1,285 @@
+"""端到端基准测试套件
+
+生成合成语料，依次测量索引、重建、向量检索、批量检索、知识树构建、知识树搜索和完整的
+对话流程，结果输出为JSON，可与之前的结果比较。嵌入和模型均为离线的确定性实现。
+
+用法:
+    python -m benchmarks.suite --files 500 --output result.json
+    python -m benchmarks.suite --files 500 --compare baseline.json --fail-on-regression
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+from datetime import datetime
+from typing import Dict, Any, List, Callable
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpus import generate_corpus, generate_queries
+from benchmarks.offline import HashingEmbeddingStore, EchoModel
+
+SCHEMA_VERSION = 1
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def latency_stats(samples: List[float]) -> Dict[str, float]:
+    """每次调用耗时（秒）的汇总，单位毫秒"""
+    total = sum(samples)
+    return {
+        "calls": len(samples),
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "mean_ms": total / len(samples) * 1000 if samples else 0.0,
+        "per_sec": len(samples) / total if total else 0.0,
+    }
+
+
+def timed(fn: Callable, quiet: bool = True):
+    """执行并计时，quiet 时屏蔽被测代码的输出（逐文件的日志会影响耗时）"""
+    with open(os.devnull, "w") as devnull, \
+            (contextlib.redirect_stdout(devnull) if quiet else contextlib.nullcontext()):
+        start = time.perf_counter()
+        result = fn()
+        return result, time.perf_counter() - start
+
+
+def run_suite(args, workdir: str) -> Dict[str, Any]:
+    from rag.indexer import DocumentIndexer
+    from tree_kb.tree_builder import KnowledgeTreeBuilder
+    from tree_kb.navigator import KnowledgeNavigator
+    from models.holder import ModelHolder
+    from utils.history import HistoryManager
+    from service.core import ChatService
+
+    quiet = not args.verbose
+    results = {}
+    docs_dir = os.path.join(workdir, "docs")
+
+    def stage(name: str, metrics: Dict[str, Any]):
+        results[name] = metrics
+        shown = ", ".join(f"{k}={v:.2f}" if isinstance(v, float) else f"{k}={v}" for k, v in metrics.items())
+        print(f"[{name}] {shown}", flush=True)
+
+    # 语料
+    _, seconds = timed(lambda: generate_corpus(
+        docs_dir, files=args.files, files_per_dir=args.files_per_dir, headers_per_file=args.headers,
+        paragraphs_per_header=args.paragraphs, seed=args.seed, depth=args.depth,
+        cjk_ratio=args.cjk_ratio, math_ratio=args.math_ratio, link_ratio=args.link_ratio
+    ))
+    corpus_bytes = sum(os.path.getsize(os.path.join(root, f))
+                       for root, _, files in os.walk(docs_dir) for f in files)
+    stage("corpus", {"files": args.files, "bytes": corpus_bytes, "seconds": seconds})
+    queries = generate_queries(args.queries, seed=args.seed, cjk_ratio=args.cjk_ratio)
+
+    # 全量索引（空索引上逐文件索引，与首次启动自动索引的路径相同）
+    store = HashingEmbeddingStore(os.path.join(workdir, "vectors"), dim=args.dim)
+    indexer = DocumentIndexer(store)
+    indexed, seconds = timed(lambda: indexer.index_directory(docs_dir, incremental=False), quiet)
+    chunks = sum(len(ids) for ids in indexed.values())
+    stage("index_directory", {"files": len(indexed), "chunks": chunks, "seconds": seconds,
+                              "files_per_sec": len(indexed) / seconds if seconds else 0.0})
+
+    # 没有文件变化时的增量索引（启动时的索引追赶）
+    _, seconds = timed(lambda: indexer.index_directory(docs_dir, incremental=True), quiet)
+    stage("index_incremental_noop", {"files": args.files, "seconds": seconds})
+
+    # 影子目录中的完整重建
+    _, seconds = timed(lambda: indexer.reindex(docs_dir), quiet)
+    stage("reindex", {"chunks": len(store.documents), "seconds": seconds,
+                      "files_per_sec": args.files / seconds if seconds else 0.0})
+
+    # 单查询向量检索（嵌入预先计算，只计打分和选取）
+    store.get_matrix()
+    query_embeddings = store.get_embeddings(queries)
+    samples = []
+    for embedding in query_embeddings:
+        start = time.perf_counter()
+        store.similarity_search(embedding, args.top_k)
+        samples.append(time.perf_counter() - start)
+    stage("similarity_search", {"chunks": len(store.documents), **latency_stats(samples)})
+
+    # 批量检索（含嵌入、过滤和结果格式化）
+    retriever = indexer.retriever
+    _, seconds = timed(lambda: retriever.retrieve_batch(queries, top_k=args.top_k), quiet)
+    stage("retrieve_batch", {"queries": len(queries), "seconds": seconds,
+                             "per_sec": len(queries) / seconds if seconds else 0.0})
+
+    # 知识树构建
+    tree_builder = KnowledgeTreeBuilder(docs_dir, os.path.join(workdir, "tree.json"),
+                                        max_workers=args.tree_workers)
+    _, seconds = timed(tree_builder.build_tree, quiet)
+    stats = tree_builder.last_build_stats
+    stage("build_tree", {"files": stats.get("files", args.files), "nodes": tree_builder.tree.number_of_nodes(),
+                         "seconds": seconds, "files_per_sec": stats.get("files", args.files) / seconds if seconds else 0.0})
+
+    # 知识树关键词搜索
+    navigator = KnowledgeNavigator(tree_builder)
+    terms = [query.split()[0] for query in queries[:args.nav_queries]]
+    samples = []
+    for term in terms:
+        _, seconds = timed(lambda: navigator.search(term), quiet)
+        samples.append(seconds)
+    stage("navigator_search", latency_stats(samples))
+
+    # 完整对话流程：检索、上下文组装、历史整理、流式生成
+    retriever.attach_tree(tree_builder)
+    retriever.graph_expand_k = args.graph_expand_k
+    model = EchoModel(reply_tokens=args.reply_tokens)
+    kb = {"vector_store": store, "indexer": indexer, "tree_builder": tree_builder,
+          "semantic_cache": None, "status": None}
+    service = ChatService(ModelHolder(model), kb, HistoryManager(model))
+
+    async def respond_all():
+        samples = []
+        first_tokens = []
+        for query in queries[:args.respond_queries]:
+            start = time.perf_counter()
+            first = None
+            async for event in service.stream_chat(query, [], top_k=args.top_k):
+                if event["type"] == "delta" and first is None:
+                    first = time.perf_counter() - start
+            samples.append(time.perf_counter() - start)
+            first_tokens.append(first or 0.0)
+        return samples, first_tokens
+
+    (samples, first_tokens), _ = timed(lambda: asyncio.run(respond_all()), quiet)
+    stage("respond", {**latency_stats(samples), "first_token_p50_ms": percentile(first_tokens, 50) * 1000})
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def direction(metric: str) -> int:
+    """指标方向：1 越大越好，-1 越小越好，0 仅供参考"""
+    if metric.endswith("per_sec"):
+        return 1
+    if metric.endswith("_ms") or metric == "seconds":
+        return -1
+    return 0
+
+
+def stage_seconds(metrics: Dict[str, Any]) -> float:
+    """阶段的总测量时间"""
+    if "seconds" in metrics:
+        return metrics["seconds"]
+    return metrics.get("calls", 0) * metrics.get("mean_ms", 0.0) / 1000
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float,
+            min_seconds: float = 0.05) -> List[str]:
+    """打印与基准结果的对比，返回超出阈值的退化项
+
+    两次运行中总测量时间都短于 min_seconds 的阶段受计时噪声影响大，只显示不判定退化。
+    """
+    if baseline.get("params") != current.get("params"):
+        print("注意: 两次运行的参数不同，对比结果仅供参考")
+    regressions = []
+    print(f"\n{'阶段':<24}{'指标':<20}{'基准':>12}{'当前':>12}{'变化':>9}")
+    for stage, metrics in current["results"].items():
+        old_metrics = baseline.get("results", {}).get(stage, {})
+        significant = max(stage_seconds(metrics), stage_seconds(old_metrics)) >= min_seconds
+        for metric, value in metrics.items():
+            sign = direction(metric)
+            old = old_metrics.get(metric)
+            if not sign or not isinstance(old, (int, float)) or not old:
+                continue
+            change = (value - old) / old
+            worse = -change * sign
+            mark = " !" if significant and worse > threshold else ""
+            print(f"{stage:<24}{metric:<20}{old:>12.2f}{value:>12.2f}{change * 100:>8.1f}%{mark}")
+            if mark:
+                regressions.append(f"{stage}.{metric}: {old:.2f} -> {value:.2f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端基准测试，输出可比较的JSON结果")
+    corpus = parser.add_argument_group("语料")
+    corpus.add_argument("--files", type=int, default=200, help="文件数量")
+    corpus.add_argument("--files-per-dir", type=int, default=50, help="每个目录中的文件数量")
+    corpus.add_argument("--depth", type=int, default=2, help="目录层数")
+    corpus.add_argument("--headers", type=int, default=8, help="每个文件的标题数量")
+    corpus.add_argument("--paragraphs", type=int, default=3, help="每个标题下的段落数量")
+    corpus.add_argument("--cjk-ratio", type=float, default=0.6, help="中文术语所占比例")
+    corpus.add_argument("--math-ratio", type=float, default=0.2, help="包含数学公式的段落比例")
+    corpus.add_argument("--link-ratio", type=float, default=0.05, help="包含文件链接的段落比例")
+    corpus.add_argument("--seed", type=int, default=0, help="随机种子")
+    workload = parser.add_argument_group("负载")
+    workload.add_argument("--queries", type=int, default=200, help="检索问题数量")
+    workload.add_argument("--nav-queries", type=int, default=50, help="知识树搜索次数")
+    workload.add_argument("--respond-queries", type=int, default=50, help="完整对话流程的轮数")
+    workload.add_argument("--top-k", type=int, default=5, help="检索文档数量")
+    workload.add_argument("--dim", type=int, default=256, help="哈希嵌入维度")
+    workload.add_argument("--tree-workers", type=int, default=None, help="构建知识树的并行工作者数量")
+    workload.add_argument("--graph-expand-k", type=int, default=0, help="对话流程中的图扩展数量")
+    workload.add_argument("--reply-tokens", type=int, default=50, help="回显模型每次回复的片段数")
+    parser.add_argument("--output", default=None, help="结果JSON文件路径")
+    parser.add_argument("--compare", default=None, help="与之前的结果JSON比较")
+    parser.add_argument("--threshold", type=float, default=0.10, help="判定为退化的相对变化")
+    parser.add_argument("--min-seconds", type=float, default=0.05,
+                        help="总测量时间短于该值的阶段不判定退化")
+    parser.add_argument("--fail-on-regression", action="store_true", help="存在退化时以非零状态退出")
+    parser.add_argument("--workdir", default=None, help="工作目录，默认使用临时目录")
+    parser.add_argument("--verbose", action="store_true", help="显示被测代码的输出")
+    args = parser.parse_args()
+
+    params = {key: value for key, value in vars(args).items()
+              if key not in ("output", "compare", "threshold", "min_seconds", "fail_on_regression",
+                              "workdir", "verbose")}
+    started = time.time()
+    with tempfile.TemporaryDirectory() as tmp:
+        results = run_suite(args, args.workdir or tmp)
+
+    report = {
+        "schema": SCHEMA_VERSION,
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.fromtimestamp(started).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "total_seconds": time.time() - started,
+        },
+        "params": params,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到 {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold, args.min_seconds)
+        if regressions:
+            print(f"\n超出 {args.threshold:.0%} 的退化:")
+            for item in regressions:
+                print(f"  - {item}")
+            if args.fail_on_regression:
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
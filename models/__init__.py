@@ -20,4 +20,40 @@ def create_model(provider, model_name, api_key, api_base, temperature):
         from .deepseek_model import DeepseekModel
         return DeepseekModel(model_name, api_key, api_base, temperature)
     else:
-        raise ValueError(f"不支持的模型提供商: {provider}")
\ No newline at end of file
+        raise ValueError(f"不支持的模型提供商: {provider}")
+
+
+def create_router(router_config, temperature=0.7):
+    """根据 router 配置创建多端点路由模型
+
+    Args:
+        router_config: 包含 endpoints 列表及熔断、对冲参数的配置字典
+        temperature: 端点未单独配置温度时使用的默认值
+
+    Returns:
+        RouterModel 实例
+    """
+    from .router import RouterModel
+
+    endpoints = []
+    names = []
+    for endpoint in router_config.get("endpoints", []):
+        endpoints.append(create_model(
+            provider=endpoint["provider"],
+            model_name=endpoint["name"],
+            api_key=endpoint.get("api_key", ""),
+            api_base=endpoint.get("api_base", ""),
+            temperature=float(endpoint.get("temperature", temperature))
+        ))
+        names.append(f"{endpoint['provider']}:{endpoint['name']}")
+
+    return RouterModel(
+        endpoints,
+        names=names,
+        failure_threshold=router_config.get("failure_threshold", 3),
+        error_rate_threshold=router_config.get("error_rate_threshold", 0.5),
+        cooldown=router_config.get("cooldown", 30.0),
+        hedge=router_config.get("hedge", False),
+        hedge_min_delay=router_config.get("hedge_min_delay", 1.0),
+        health_check_interval=router_config.get("health_check_interval", 0.0)
+    )
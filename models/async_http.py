@@ -0,0 +1,64 @@
+import asyncio
+import threading
+import weakref
+from typing import Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from . import http_pool
+
+# 每个提供商（主机）同时进行中的请求上限
+_settings = {"max_concurrency": 4}
+
+# 事件循环 -> {主机: 客户端 / 信号量}。asyncio对象与创建它的事件循环绑定，循环销毁后自动清理
+_clients = weakref.WeakKeyDictionary()
+_semaphores = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def configure(max_concurrency: Optional[int] = None):
+    """修改异步客户端设置，新的并发上限对之后创建的信号量生效"""
+    with _lock:
+        if max_concurrency is not None:
+            _settings["max_concurrency"] = max(1, int(max_concurrency))
+        _semaphores.clear()
+
+
+def _host(api_base: str) -> str:
+    parts = urlsplit(api_base or "")
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def get_async_client(api_base: str) -> httpx.AsyncClient:
+    """获取当前事件循环中指向 api_base 所在主机的共享异步客户端
+
+    连接池大小和超时沿用同步连接池（http_pool）的设置。
+    """
+    loop = asyncio.get_running_loop()
+    host = _host(api_base)
+    with _lock:
+        clients = _clients.setdefault(loop, {})
+        client = clients.get(host)
+        if client is None or client.is_closed:
+            settings = http_pool.get_settings()
+            client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=settings["pool_size"],
+                                    max_keepalive_connections=settings["pool_size"]),
+                timeout=httpx.Timeout(settings["read_timeout"], connect=settings["connect_timeout"])
+            )
+            clients[host] = client
+        return client
+
+
+def get_semaphore(api_base: str) -> asyncio.Semaphore:
+    """获取限制单个提供商并发请求数的信号量"""
+    loop = asyncio.get_running_loop()
+    host = _host(api_base)
+    with _lock:
+        semaphores = _semaphores.setdefault(loop, {})
+        semaphore = semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(_settings["max_concurrency"])
+            semaphores[host] = semaphore
+        return semaphore
@@ -1,15 +1,52 @@
+import time
+import asyncio
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator, AsyncIterator, Tuple
+
+from utils import metrics
+
+# 模型调用的监控指标，按提供商区分；token数由 utils.tokens 计算，未安装 tiktoken 时为估算值
+LLM_REQUESTS = metrics.counter("marktreechat_llm_requests_total", "模型请求数",
+                               ["provider", "status"])
+LLM_DURATION = metrics.histogram("marktreechat_llm_request_duration_seconds",
+                                 "模型请求从发送到回复结束的耗时", ["provider"])
+LLM_FIRST_TOKEN = metrics.histogram("marktreechat_llm_first_token_seconds",
+                                    "流式请求从发送到收到第一个片段的耗时", ["provider"])
+LLM_TOKENS = metrics.counter("marktreechat_llm_tokens_total", "模型请求的输入和输出token数",
+                             ["provider", "direction"])
 
 class BaseModel(ABC):
     """AI模型基类，所有具体模型实现需继承此类"""
 
+    # 异步调用使用的接口协议: "openai"（/chat/completions + SSE）或 "ollama"（/api/chat + NDJSON）
+    # 为None时异步方法在线程中执行同步实现
+    api_protocol = None
+    # 单个请求的超时（秒），为None时使用共享连接池和异步客户端的默认超时
+    request_timeout = None
+
     def __init__(self, model_name: str, temperature: float = 0.7):
         self.model_name = model_name
         self.temperature = temperature
         # 添加API key属性，方便子类访问
         self.api_key = ""
 
+    @property
+    def provider(self) -> str:
+        """监控指标中的提供商名称，如 LMStudioModel -> lmstudio"""
+        return type(self).__name__.replace("Model", "").lower() or "model"
+
+    def _record_request(self, status: str, start: float, messages: List[Dict[str, str]],
+                        system_prompt: Optional[str], reply: str):
+        """记录一次异步请求的结果、耗时和token数"""
+        from utils.tokens import count_tokens, count_message_tokens
+        provider = self.provider
+        LLM_REQUESTS.inc(provider=provider, status=status)
+        LLM_DURATION.observe(time.perf_counter() - start, provider=provider)
+        LLM_TOKENS.inc(count_message_tokens(messages) + count_tokens(system_prompt or ""),
+                       provider=provider, direction="in")
+        if reply:
+            LLM_TOKENS.inc(count_tokens(reply), provider=provider, direction="out")
+
     @abstractmethod
     def chat(self,
              messages: List[Dict[str, str]],
@@ -27,6 +64,137 @@ class BaseModel(ABC):
         """
         pass
 
+    @property
+    def http_session(self):
+        """指向 api_base 所在主机的共享连接池会话"""
+        from .http_pool import get_session
+        return get_session(getattr(self, "api_base", ""))
+
+    def stream_chat(self,
+                    messages: List[Dict[str, str]],
+                    system_prompt: Optional[str] = None,
+                    temperature: Optional[float] = None) -> Iterator[str]:
+        """流式处理聊天请求，逐步产出回复片段
+
+        默认实现不支持流式，一次性产出完整回复；支持流式的子类应重写此方法。
+
+        Args:
+            messages: 消息列表，格式同 chat
+            system_prompt: 系统提示词
+            temperature: 温度参数，覆盖默认值
+
+        Yields:
+            回复文本的增量片段
+        """
+        yield self.chat(messages=messages, system_prompt=system_prompt, temperature=temperature)
+
+    def _async_request(self,
+                       messages: List[Dict[str, str]],
+                       system_prompt: Optional[str],
+                       temperature: Optional[float],
+                       stream: bool) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """按 api_protocol 构建异步请求的 (URL, 请求头, 请求体)"""
+        payload = self._build_payload(messages, system_prompt, temperature)
+        headers = dict(getattr(self, "headers", {}) or {"Content-Type": "application/json"})
+        if self.api_protocol == "ollama":
+            payload["stream"] = stream
+            return f"{self.api_base}/api/chat", headers, payload
+        if stream:
+            payload["stream"] = True
+        return f"{self.api_base}/chat/completions", headers, payload
+
+    def _timeout_kwargs(self) -> Dict[str, Any]:
+        # 不能传 timeout=None：httpx 会把它当作不限时
+        return {"timeout": self.request_timeout} if self.request_timeout is not None else {}
+
+    async def achat(self,
+                    messages: List[Dict[str, str]],
+                    system_prompt: Optional[str] = None,
+                    temperature: Optional[float] = None) -> str:
+        """chat 的异步版本，同一提供商的并发请求数受信号量限制"""
+        start = time.perf_counter()
+        try:
+            reply = await self._achat(messages, system_prompt, temperature)
+        except asyncio.CancelledError:
+            self._record_request("cancelled", start, messages, system_prompt, "")
+            raise
+        except Exception:
+            self._record_request("error", start, messages, system_prompt, "")
+            raise
+        self._record_request("ok", start, messages, system_prompt, reply)
+        return reply
+
+    async def _achat(self,
+                     messages: List[Dict[str, str]],
+                     system_prompt: Optional[str],
+                     temperature: Optional[float]) -> str:
+        if self.api_protocol is None:
+            return await asyncio.to_thread(self.chat, messages, system_prompt, temperature)
+
+        from .async_http import get_async_client, get_semaphore
+        url, headers, payload = self._async_request(messages, system_prompt, temperature, stream=False)
+        async with get_semaphore(self.api_base):
+            response = await get_async_client(self.api_base).post(url, headers=headers, json=payload,
+                                                                  **self._timeout_kwargs())
+        if response.status_code != 200:
+            raise Exception(f"API请求失败: {response.status_code} {response.text}")
+
+        data = response.json()
+        if self.api_protocol == "ollama":
+            return data["message"]["content"]
+        return data["choices"][0]["message"]["content"]
+
+    async def astream_chat(self,
+                           messages: List[Dict[str, str]],
+                           system_prompt: Optional[str] = None,
+                           temperature: Optional[float] = None) -> AsyncIterator[str]:
+        """stream_chat 的异步版本，整个流式响应期间占用一个并发名额"""
+        start = time.perf_counter()
+        parts = []
+        status = "error"
+        try:
+            async for delta in self._astream_chat(messages, system_prompt, temperature):
+                if not parts:
+                    LLM_FIRST_TOKEN.observe(time.perf_counter() - start, provider=self.provider)
+                parts.append(delta)
+                yield delta
+            status = "ok"
+        except (GeneratorExit, asyncio.CancelledError):
+            # 调用方提前停止读取（如客户端断开）
+            status = "cancelled"
+            raise
+        finally:
+            self._record_request(status, start, messages, system_prompt, "".join(map(str, parts)))
+
+    async def _astream_chat(self,
+                            messages: List[Dict[str, str]],
+                            system_prompt: Optional[str],
+                            temperature: Optional[float]) -> AsyncIterator[str]:
+        if self.api_protocol is None:
+            # 在线程中逐块拉取同步生成器，避免阻塞事件循环
+            iterator = iter(self.stream_chat(messages, system_prompt, temperature))
+            done = object()
+            while True:
+                delta = await asyncio.to_thread(next, iterator, done)
+                if delta is done:
+                    break
+                yield delta
+            return
+
+        from .async_http import get_async_client, get_semaphore
+        from .streaming import aiter_sse_deltas, aiter_ndjson_deltas
+        url, headers, payload = self._async_request(messages, system_prompt, temperature, stream=True)
+        async with get_semaphore(self.api_base):
+            async with get_async_client(self.api_base).stream("POST", url, headers=headers, json=payload,
+                                                              **self._timeout_kwargs()) as response:
+                if response.status_code != 200:
+                    body = (await response.aread()).decode("utf-8", errors="replace")
+                    raise Exception(f"API请求失败: {response.status_code} {body}")
+
+                parse = aiter_ndjson_deltas if self.api_protocol == "ollama" else aiter_sse_deltas
+                async for delta in parse(response.aiter_lines()):
+                    yield delta
+
     def get_available_models(self) -> List[str]:
         """获取可用的模型列表，子类应重写此方法
 
@@ -35,6 +203,21 @@ class BaseModel(ABC):
         """
         return []
 
+    def health_check(self, timeout: float = 3.0) -> bool:
+        """轻量级健康检查：请求模型列表接口，不产生对话开销
+
+        Returns:
+            接口是否可用；未声明 api_protocol 的模型默认视为可用
+        """
+        if self.api_protocol is None:
+            return True
+        url = f"{self.api_base}/api/tags" if self.api_protocol == "ollama" else f"{self.api_base}/models"
+        try:
+            response = self.http_session.get(url, headers=getattr(self, "headers", None), timeout=timeout)
+            return response.status_code == 200
+        except Exception:
+            return False
+
     def test_connection(self) -> tuple[bool, str]:
         """测试API连接，子类可以覆盖此方法"""
         try:
@@ -45,4 +228,8 @@ class BaseModel(ABC):
             )
             return True, f"模型回复: {response}"
         except Exception as e:
-            return False, f"连接测试失败: {str(e)}"
\ No newline at end of file
+            return False, f"连接测试失败: {str(e)}"
+
+    def close(self):
+        """释放模型持有的后台资源（如健康检查线程），模型被替换后调用；默认无需处理"""
+        pass
\ No newline at end of file
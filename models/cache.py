@@ -0,0 +1,281 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from typing import List, Dict, Any, Optional, Iterator, AsyncIterator, Callable
+from .base import BaseModel
+from utils import metrics
+
+# 回复缓存和语义缓存共用，命中率 = hit / (hit + miss)
+CACHE_LOOKUPS = metrics.counter("marktreechat_cache_lookups_total", "缓存查找次数",
+                                ["cache", "result"])
+
+
+class ResponseCache:
+    """基于SQLite的模型回复精确匹配缓存
+
+    以请求参数的哈希为键保存完整回复，按最近访问时间做LRU淘汰，
+    同时限制条目数、总字节数和存活时间。命中只在内存中记下访问时间，
+    在下次写入或累计到 TOUCH_BATCH 条时批量写回，读取不触发提交。
+    """
+
+    TOUCH_BATCH = 256
+
+    def __init__(self, path: str, max_entries: int = 1000, max_bytes: int = 50 * 1024 * 1024,
+                 ttl: float = 7 * 24 * 3600):
+        """
+        Args:
+            path: SQLite数据库文件路径
+            max_entries: 最大条目数
+            max_bytes: 回复文本的最大总字节数
+            ttl: 条目存活时间（秒），小于等于0表示不过期
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # 键 -> 尚未写回数据库的最近访问时间
+        self._touches = {}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON responses(accessed)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(**parts) -> str:
+        """把请求参数序列化为稳定的哈希键"""
+        raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，命中时记下访问时间；过期条目在下次写入时清理"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.ttl > 0 and now - row[1] > self.ttl):
+                self.misses += 1
+                CACHE_LOOKUPS.inc(cache="response", result="miss")
+                return None
+            self._touches[key] = now
+            if len(self._touches) >= self.TOUCH_BATCH:
+                self._flush_touches()
+                self._conn.commit()
+            self.hits += 1
+            CACHE_LOOKUPS.inc(cache="response", result="hit")
+            return row[0]
+
+    def _flush_touches(self):
+        """把内存中的访问时间写回数据库，调用方负责提交"""
+        if self._touches:
+            self._conn.executemany("UPDATE responses SET accessed = ? WHERE key = ?",
+                                   [(accessed, key) for key, accessed in self._touches.items()])
+            self._touches.clear()
+
+    def put(self, key: str, response: str):
+        """写入缓存并按限制淘汰最久未访问的条目"""
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, response, size, now, now)
+            )
+            self._touches.pop(key, None)
+            self._flush_touches()
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        if self.ttl > 0:
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+
+        # 从最久未访问的条目开始删除，直到满足条目数和字节数限制
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            victims.append((key,))
+            count -= 1
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._touches.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": count,
+            "bytes": total,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class CachedModel(BaseModel):
+    """为任意模型连接器加上回复缓存
+
+    缓存键包含提供商、模型名称、温度、系统提示词、消息列表和知识库索引版本。
+    温度高于 max_temperature 的请求输出不确定，直接绕过缓存。
+    """
+
+    def __init__(self, model: BaseModel, cache: ResponseCache, max_temperature: float = 0.3,
+                 index_version: Optional[Callable[[], Any]] = None):
+        """
+        Args:
+            model: 被包装的模型
+            cache: 回复缓存
+            max_temperature: 允许使用缓存的最高温度
+            index_version: 返回当前知识库索引版本的函数，版本变化后旧条目不再命中
+        """
+        # 不调用父类构造函数：model_name、temperature 等属性始终取自被包装的模型
+        self.model = model
+        self.cache = cache
+        self.max_temperature = max_temperature
+        self.index_version = index_version
+        self.bypassed = 0
+
+    def __getattr__(self, name):
+        # model_name、api_base、headers 等连接器属性直接取自被包装的模型
+        if name == "model":
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    def _key(self, messages, system_prompt, temperature) -> Optional[str]:
+        """计算缓存键；温度过高时返回None表示不使用缓存"""
+        if temperature is None:
+            temperature = self.model.temperature
+        if temperature > self.max_temperature:
+            self.bypassed += 1
+            return None
+        return self.cache.make_key(
+            provider=type(self.model).__name__,
+            api_base=getattr(self.model, "api_base", ""),
+            model=self.model.model_name,
+            temperature=round(float(temperature), 3),
+            system=system_prompt or "",
+            messages=messages,
+            index_version=self.index_version() if self.index_version else None,
+        )
+
+    def chat(self,
+             messages: List[Dict[str, str]],
+             system_prompt: Optional[str] = None,
+             temperature: Optional[float] = None) -> str:
+        key = self._key(messages, system_prompt, temperature)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        reply = self.model.chat(messages=messages, system_prompt=system_prompt, temperature=temperature)
+        if key is not None and reply:
+            self.cache.put(key, reply)
+        return reply
+
+    def stream_chat(self,
+                    messages: List[Dict[str, str]],
+                    system_prompt: Optional[str] = None,
+                    temperature: Optional[float] = None) -> Iterator[str]:
+        """命中时一次性产出缓存的回复；未命中时边转发边收集，完整结束后才写入缓存"""
+        key = self._key(messages, system_prompt, temperature)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+
+        parts = []
+        for delta in self.model.stream_chat(messages, system_prompt, temperature):
+            parts.append(delta)
+            yield delta
+        if key is not None and parts:
+            self.cache.put(key, "".join(parts))
+
+    async def achat(self,
+                    messages: List[Dict[str, str]],
+                    system_prompt: Optional[str] = None,
+                    temperature: Optional[float] = None) -> str:
+        """chat 的异步版本，SQLite 读写在线程中执行，不阻塞事件循环"""
+        key = self._key(messages, system_prompt, temperature)
+        if key is not None:
+            cached = await asyncio.to_thread(self.cache.get, key)
+            if cached is not None:
+                return cached
+
+        reply = await self.model.achat(messages, system_prompt, temperature)
+        if key is not None and reply:
+            await asyncio.to_thread(self.cache.put, key, reply)
+        return reply
+
+    async def astream_chat(self,
+                           messages: List[Dict[str, str]],
+                           system_prompt: Optional[str] = None,
+                           temperature: Optional[float] = None) -> AsyncIterator[str]:
+        """stream_chat 的异步版本，SQLite 读写在线程中执行"""
+        key = self._key(messages, system_prompt, temperature)
+        if key is not None:
+            cached = await asyncio.to_thread(self.cache.get, key)
+            if cached is not None:
+                yield cached
+                return
+
+        parts = []
+        async for delta in self.model.astream_chat(messages, system_prompt, temperature):
+            parts.append(delta)
+            yield delta
+        if key is not None and parts:
+            await asyncio.to_thread(self.cache.put, key, "".join(parts))
+
+    def wrap(self, model: BaseModel) -> "CachedModel":
+        """用相同的缓存设置包装另一个模型，用于切换模型"""
+        return CachedModel(model, self.cache, self.max_temperature, self.index_version)
+
+    def get_available_models(self) -> List[str]:
+        return self.model.get_available_models()
+
+    def close(self):
+        # 缓存由切换前后的包装共享，只关闭被包装的模型
+        self.model.close()
+
+    def health_check(self, timeout: float = 3.0) -> bool:
+        return self.model.health_check(timeout)
+
+    def test_connection(self) -> tuple[bool, str]:
+        return self.model.test_connection()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.cache.stats()
+        stats["bypassed"] = self.bypassed
+        return stats
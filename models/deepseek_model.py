@@ -1,11 +1,13 @@
-from typing import List, Dict, Any, Optional
-import requests
+from typing import List, Dict, Any, Optional, Iterator
 import json
 from .base import BaseModel
+from .streaming import iter_sse_deltas
 
 class DeepseekModel(BaseModel):
     """Deepseek API模型连接器"""
 
+    api_protocol = "openai"
+
     def __init__(self, model_name: str, api_key: str, api_base: str = "https://api.deepseek.com/v1", temperature: float = 0.7):
         super().__init__(model_name, temperature)
         self.api_base = api_base
@@ -15,11 +17,11 @@ class DeepseekModel(BaseModel):
             "Authorization": f"Bearer {api_key}"
         }
 
-    def chat(self,
-             messages: List[Dict[str, str]],
-             system_prompt: Optional[str] = None,
-             temperature: Optional[float] = None) -> str:
-        """使用Deepseek API进行聊天"""
+    def _build_payload(self,
+                       messages: List[Dict[str, str]],
+                       system_prompt: Optional[str] = None,
+                       temperature: Optional[float] = None) -> Dict[str, Any]:
+        """构建聊天请求体"""
 
         # 处理系统提示
         processed_messages = []
@@ -29,27 +31,53 @@ class DeepseekModel(BaseModel):
         # 添加消息历史
         processed_messages.extend(messages)
 
-        # 准备API请求
-        payload = {
+        return {
             "model": self.model_name,
             "messages": processed_messages,
             "temperature": temperature if temperature is not None else self.temperature,
         }
 
+    def chat(self,
+             messages: List[Dict[str, str]],
+             system_prompt: Optional[str] = None,
+             temperature: Optional[float] = None) -> str:
+        """使用Deepseek API进行聊天"""
+
+        # 准备API请求
+        payload = self._build_payload(messages, system_prompt, temperature)
+
         # 调用API
-        response = requests.post(f"{self.api_base}/chat/completions",
-                                headers=self.headers,
-                                json=payload)
+        response = self.http_session.post(f"{self.api_base}/chat/completions",
+                                         headers=self.headers,
+                                         json=payload)
 
         if response.status_code != 200:
             raise Exception(f"API请求失败: {response.status_code} {response.text}")
 
         return response.json()["choices"][0]["message"]["content"]
 
+    def stream_chat(self,
+                    messages: List[Dict[str, str]],
+                    system_prompt: Optional[str] = None,
+                    temperature: Optional[float] = None) -> Iterator[str]:
+        """使用Deepseek API进行流式聊天（SSE）"""
+
+        payload = self._build_payload(messages, system_prompt, temperature)
+        payload["stream"] = True
+
+        with self.http_session.post(f"{self.api_base}/chat/completions",
+                                    headers=self.headers,
+                                    json=payload,
+                                    stream=True) as response:
+            if response.status_code != 200:
+                raise Exception(f"API请求失败: {response.status_code} {response.text}")
+
+            yield from iter_sse_deltas(response.iter_lines())
+
     def get_available_models(self) -> List[str]:
         """获取可用的Deepseek模型列表"""
         try:
-            response = requests.get(f"{self.api_base}/models", headers=self.headers)
+            response = self.http_session.get(f"{self.api_base}/models", headers=self.headers)
             if response.status_code != 200:
                 return ["deepseek-chat", "deepseek-coder"]
 
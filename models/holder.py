@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import threading
+import weakref
+from typing import Optional
+from .base import BaseModel
+from .cache import CachedModel
+
+log = logging.getLogger(__name__)
+
+
+class ModelHolder:
+    """当前模型实例的线程安全持有者
+
+    界面和对话处理函数通过 get() 取得模型引用，设置页通过 swap() 整体替换实例，
+    不再就地修改共享的模型对象。已经开始的请求继续使用它取得的旧实例直到结束。
+
+    同时为每个模型后端（提供商类型 + api_base）维护一个对话并发上限，
+    超出上限的对话事件在队列中等待，而不是同时压到同一个后端上。
+    """
+
+    def __init__(self, model: BaseModel, event_concurrency: Optional[int] = 4):
+        """
+        Args:
+            model: 初始模型
+            event_concurrency: 每个后端同时进行的对话事件数，None或0表示不限制
+        """
+        self._model = model
+        self._lock = threading.Lock()
+        self.event_concurrency = event_concurrency
+        # 事件循环 -> {后端键: 信号量}；asyncio信号量不能跨事件循环使用
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def get(self) -> BaseModel:
+        with self._lock:
+            return self._model
+
+    def swap(self, model: BaseModel) -> BaseModel:
+        """原子地替换当前模型并关闭旧实例的后台资源，返回旧实例
+
+        旧实例仍可被进行中的请求使用，close() 只停止后台任务，不中断请求。
+        """
+        with self._lock:
+            old, self._model = self._model, model
+        if old is not model:
+            old.close()
+        log.info("模型已切换: %s -> %s", getattr(old, "model_name", ""), model.model_name)
+        return old
+
+    @staticmethod
+    def backend_key(model: BaseModel) -> str:
+        # 带缓存的模型按其内部模型区分后端
+        if isinstance(model, CachedModel):
+            model = model.model
+        return f"{type(model).__name__}|{getattr(model, 'api_base', '')}"
+
+    def event_slot(self, model: BaseModel):
+        """返回限制该模型后端对话并发的异步上下文管理器"""
+        if not self.event_concurrency:
+            return _NullSlot()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            per_loop = self._semaphores.setdefault(loop, {})
+            key = self.backend_key(model)
+            if key not in per_loop:
+                per_loop[key] = asyncio.Semaphore(self.event_concurrency)
+            return per_loop[key]
+
+
+class _NullSlot:
+    """不限制并发时使用的空上下文管理器"""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
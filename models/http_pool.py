@@ -0,0 +1,136 @@
+import time
+import threading
+from collections import deque
+from typing import Dict, Any, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# 连接池默认设置，可通过 configure 修改
+_settings = {
+    "pool_size": 10,          # 每个主机保持的最大连接数
+    "connect_timeout": 5.0,   # 建立连接的超时（秒）
+    "read_timeout": 120.0,    # 两次读取数据之间的超时（秒）
+}
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+def configure(pool_size: Optional[int] = None,
+              connect_timeout: Optional[float] = None,
+              read_timeout: Optional[float] = None):
+    """修改连接池设置，已创建的会话会被重建"""
+    with _lock:
+        if pool_size is not None:
+            _settings["pool_size"] = int(pool_size)
+        if connect_timeout is not None:
+            _settings["connect_timeout"] = float(connect_timeout)
+        if read_timeout is not None:
+            _settings["read_timeout"] = float(read_timeout)
+
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def get_settings() -> Dict[str, Any]:
+    """当前的连接池设置"""
+    with _lock:
+        return dict(_settings)
+
+
+class PooledSession:
+    """带连接池和默认超时的HTTP会话，同一主机的所有模型实例共享
+
+    requests.Session 默认保持长连接，这里额外限定连接池大小、补充连接和读取超时，
+    并记录每次请求的延迟和连接复用情况。
+    """
+
+    def __init__(self, base_url: str, pool_size: int, connect_timeout: float, read_timeout: float):
+        self.base_url = base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._adapter = adapter
+
+        self._stats_lock = threading.Lock()
+        self.request_count = 0
+        self.error_count = 0
+        self.latencies = deque(maxlen=1000)  # 最近请求的延迟（到收到响应头为止，秒）
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """发送请求，未指定超时时使用连接池的默认超时"""
+        kwargs.setdefault("timeout", self.timeout)
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except Exception:
+            with self._stats_lock:
+                self.request_count += 1
+                self.error_count += 1
+            raise
+
+        with self._stats_lock:
+            self.request_count += 1
+            self.latencies.append(time.perf_counter() - start)
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def _connection_count(self) -> int:
+        """底层连接池累计新建的连接数"""
+        pools = self._adapter.poolmanager.pools
+        return sum(pools[key].num_connections for key in list(pools.keys()))
+
+    def stats(self) -> Dict[str, Any]:
+        """连接复用和延迟统计"""
+        with self._stats_lock:
+            latencies = sorted(self.latencies)
+            requests_made = self.request_count
+            errors = self.error_count
+        connections = self._connection_count()
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+
+        return {
+            "requests": requests_made,
+            "errors": errors,
+            "connections": connections,
+            "reused": max(requests_made - connections, 0),
+            "reuse_ratio": (requests_made - connections) / requests_made if requests_made else 0.0,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+        }
+
+    def close(self):
+        self.session.close()
+
+
+def get_session(api_base: str) -> PooledSession:
+    """获取指向 api_base 所在主机的共享会话"""
+    parts = urlsplit(api_base or "")
+    key = f"{parts.scheme}://{parts.netloc}"
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = PooledSession(key, **_settings)
+            _sessions[key] = session
+        return session
+
+
+def get_pool_stats() -> Dict[str, Dict[str, Any]]:
+    """所有共享会话的统计信息，按主机分组"""
+    with _lock:
+        sessions = dict(_sessions)
+    return {key: session.stats() for key, session in sessions.items()}
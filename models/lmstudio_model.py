@@ -1,11 +1,13 @@
-from typing import List, Dict, Any, Optional
-import requests
+from typing import List, Dict, Any, Optional, Iterator
 import json
 from .base import BaseModel
+from .streaming import iter_sse_deltas
 
 class LMStudioModel(BaseModel):
     """LMStudio API模型连接器"""
 
+    api_protocol = "openai"
+
     def __init__(self, model_name: str = "Local Model", api_key: str = None, api_base: str = "http://localhost:1234/v1", temperature: float = 0.7):
         super().__init__(model_name, temperature)
         self.api_base = api_base
@@ -13,11 +15,11 @@ class LMStudioModel(BaseModel):
         if api_key:
             self.headers["Authorization"] = f"Bearer {api_key}"
 
-    def chat(self,
-             messages: List[Dict[str, str]],
-             system_prompt: Optional[str] = None,
-             temperature: Optional[float] = None) -> str:
-        """使用LMStudio API进行聊天"""
+    def _build_payload(self,
+                       messages: List[Dict[str, str]],
+                       system_prompt: Optional[str] = None,
+                       temperature: Optional[float] = None) -> Dict[str, Any]:
+        """构建聊天请求体"""
 
         # 处理系统提示
         processed_messages = []
@@ -27,28 +29,54 @@ class LMStudioModel(BaseModel):
         # 添加消息历史
         processed_messages.extend(messages)
 
-        # 准备API请求
-        payload = {
+        return {
             "messages": processed_messages,
             "temperature": temperature if temperature is not None else self.temperature,
             "model": self.model_name
         }
 
+    def chat(self,
+             messages: List[Dict[str, str]],
+             system_prompt: Optional[str] = None,
+             temperature: Optional[float] = None) -> str:
+        """使用LMStudio API进行聊天"""
+
+        # 准备API请求
+        payload = self._build_payload(messages, system_prompt, temperature)
+
         # 调用API
-        response = requests.post(f"{self.api_base}/chat/completions",
-                                headers=self.headers,
-                                data=json.dumps(payload))
+        response = self.http_session.post(f"{self.api_base}/chat/completions",
+                                         headers=self.headers,
+                                         data=json.dumps(payload))
 
         if response.status_code != 200:
             raise Exception(f"API请求失败: {response.status_code} {response.text}")
 
         return response.json()["choices"][0]["message"]["content"]
 
+    def stream_chat(self,
+                    messages: List[Dict[str, str]],
+                    system_prompt: Optional[str] = None,
+                    temperature: Optional[float] = None) -> Iterator[str]:
+        """使用LMStudio API进行流式聊天（SSE）"""
+
+        payload = self._build_payload(messages, system_prompt, temperature)
+        payload["stream"] = True
+
+        with self.http_session.post(f"{self.api_base}/chat/completions",
+                                    headers=self.headers,
+                                    data=json.dumps(payload),
+                                    stream=True) as response:
+            if response.status_code != 200:
+                raise Exception(f"API请求失败: {response.status_code} {response.text}")
+
+            yield from iter_sse_deltas(response.iter_lines())
+
     def get_available_models(self) -> List[str]:
         """获取可用的LMStudio模型列表"""
         try:
             # 调用LMStudio API获取模型列表
-            response = requests.get(f"{self.api_base}/models", headers=self.headers)
+            response = self.http_session.get(f"{self.api_base}/models", headers=self.headers)
 
             if response.status_code != 200:
                 print(f"获取模型列表失败: {response.status_code} {response.text}")
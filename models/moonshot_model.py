@@ -1,7 +1,10 @@
-from typing import List, Dict, Any, Optional
-import requests
+from typing import List, Dict, Any, Optional, Iterator
 import json
+import logging
 from .base import BaseModel
+from .streaming import iter_sse_deltas
+
+log = logging.getLogger(__name__)
 
 def __init__(self, model_name: str, api_key: str, api_base: str = "https://api.moonshot.cn/v1", temperature: float = 0.7):
     # 处理model_name可能是列表的情况
@@ -17,9 +20,18 @@ def __init__(self, model_name: str, api_key: str, api_base: str = "https://api.m
         "Authorization": f"Bearer {api_key}"
     }
 
+def _preview(value: Any, limit: int = 500) -> str:
+    """日志中的请求和响应内容截断到 limit 个字符"""
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+    return text if len(text) <= limit else f"{text[:limit]}...（共 {len(text)} 字符）"
+
 class MoonshotModel(BaseModel):
     """Moonshot API模型连接器"""
 
+    api_protocol = "openai"
+    # Moonshot 请求使用固定的30秒超时，而不是共享连接池的默认读取超时
+    request_timeout = 30
+
     def __init__(self, model_name: str, api_key: str, api_base: str = "https://api.moonshot.cn/v1", temperature: float = 0.7):
         super().__init__(model_name, temperature)
         self.api_base = "https://api.moonshot.cn/v1"
@@ -29,11 +41,11 @@ class MoonshotModel(BaseModel):
             "Authorization": f"Bearer {api_key}"
         }
 
-    def chat(self,
-             messages: List[Dict[str, str]],
-             system_prompt: Optional[str] = None,
-             temperature: Optional[float] = None) -> str:
-        """使用Moonshot API进行聊天"""
+    def _build_payload(self,
+                       messages: List[Dict[str, str]],
+                       system_prompt: Optional[str] = None,
+                       temperature: Optional[float] = None) -> Dict[str, Any]:
+        """构建聊天请求体"""
 
         # 处理系统提示
         processed_messages = []
@@ -45,37 +57,43 @@ class MoonshotModel(BaseModel):
             if isinstance(msg, dict) and "role" in msg and "content" in msg:
                 processed_messages.append(msg)
 
-        # 打印请求信息以便调试
-        print(f"发送请求到Moonshot API: {processed_messages}")
-        print(f"API基础URL: {self.api_base}")
-        print(f"认证头部: Authorization: Bearer {self.api_key[:4]}...{self.api_key[-4:] if len(self.api_key) > 8 else ''}")
-        print(f"模型名称: {self.model_name}")
-
-        # 准备API请求
-        payload = {
+        return {
             "model": self.model_name,
             "messages": processed_messages,
             "temperature": temperature if temperature is not None else self.temperature,
         }
 
+    def chat(self,
+             messages: List[Dict[str, str]],
+             system_prompt: Optional[str] = None,
+             temperature: Optional[float] = None) -> str:
+        """使用Moonshot API进行聊天"""
+
+        # 准备API请求
+        payload = self._build_payload(messages, system_prompt, temperature)
+
+        # 请求内容只在调试级别输出，且不输出密钥
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(f"发送请求到 {self.api_base}，模型 {self.model_name}，"
+                      f"{len(payload['messages'])} 条消息: {_preview(payload['messages'])}")
+
         try:
             # 调用API
-            response = requests.post(
+            response = self.http_session.post(
                 f"{self.api_base}/chat/completions",
                 headers=self.headers,
                 json=payload,
-                timeout=30  # 设置超时
+                timeout=self.request_timeout
             )
 
             # 检查响应状态
             if response.status_code != 200:
-                print(f"API响应错误，状态码: {response.status_code}")
-                print(f"响应内容: {response.text}")
                 raise Exception(f"API请求失败: {response.status_code} {response.text}")
 
             # 获取并验证响应内容
             response_json = response.json()
-            print(f"API响应: {response_json}")
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("API响应: %s", _preview(response_json))
 
             if "choices" not in response_json or not response_json["choices"]:
                 raise Exception(f"API响应格式错误: {response_json}")
@@ -84,20 +102,47 @@ class MoonshotModel(BaseModel):
             return content
 
         except Exception as e:
-            print(f"Moonshot API错误: {str(e)}")
+            log.error("Moonshot API错误: %s", _preview(str(e)))
+            raise e
+
+    def stream_chat(self,
+                    messages: List[Dict[str, str]],
+                    system_prompt: Optional[str] = None,
+                    temperature: Optional[float] = None) -> Iterator[str]:
+        """使用Moonshot API进行流式聊天（SSE）"""
+
+        payload = self._build_payload(messages, system_prompt, temperature)
+        payload["stream"] = True
+
+        try:
+            with self.http_session.post(
+                f"{self.api_base}/chat/completions",
+                headers=self.headers,
+                json=payload,
+                stream=True,
+                timeout=self.request_timeout
+            ) as response:
+                if response.status_code != 200:
+                    raise Exception(f"API请求失败: {response.status_code} {response.text}")
+
+                yield from iter_sse_deltas(response.iter_lines())
+
+        except Exception as e:
+            log.error("Moonshot API流式请求错误: %s", _preview(str(e)))
             raise e
 
     def get_available_models(self) -> List[str]:
         """获取可用的Moonshot模型列表"""
         try:
-            response = requests.get(f"{self.api_base}/models", headers=self.headers)
+            response = self.http_session.get(f"{self.api_base}/models", headers=self.headers,
+                                             timeout=self.request_timeout)
             if response.status_code != 200:
                 return ["moonshot-v1-8k", "moonshot-v1-32k", "moonshot-v1-128k"]
 
             models = response.json().get("data", [])
             return [model["id"] for model in models]
         except Exception as e:
-            print(f"获取模型列表失败: {e}")
+            log.warning("获取模型列表失败: %s", e)
             return ["moonshot-v1-8k", "moonshot-v1-32k", "moonshot-v1-128k"]
 
     def test_connection(self) -> tuple[bool, str]:
@@ -110,10 +155,11 @@ class MoonshotModel(BaseModel):
                 "temperature": self.temperature
             }
 
-            response = requests.post(
+            response = self.http_session.post(
                 f"{self.api_base}/chat/completions",
                 headers=self.headers,
-                json=payload
+                json=payload,
+                timeout=self.request_timeout
             )
 
             if response.status_code != 200:
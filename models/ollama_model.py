@@ -1,15 +1,40 @@
-from typing import List, Dict, Any, Optional
-import requests
+from typing import List, Dict, Any, Optional, Iterator
 import json
 from .base import BaseModel
+from .streaming import iter_ndjson_deltas
 
 class OllamaModel(BaseModel):
     """Ollama API模型连接器"""
 
+    api_protocol = "ollama"
+
     def __init__(self, model_name: str, api_key: str = None, api_base: str = "http://localhost:11434", temperature: float = 0.7):
         super().__init__(model_name, temperature)
         self.api_base = api_base
 
+    def _build_payload(self,
+                       messages: List[Dict[str, str]],
+                       system_prompt: Optional[str] = None,
+                       temperature: Optional[float] = None,
+                       stream: bool = False) -> Dict[str, Any]:
+        """构建 /api/chat 请求体"""
+
+        # /api/chat 通过system角色的消息传递系统提示
+        processed_messages = []
+        if system_prompt:
+            processed_messages.append({"role": "system", "content": system_prompt})
+        processed_messages.extend(messages)
+
+        return {
+            "model": self.model_name,
+            "messages": processed_messages,
+            "options": {
+                "temperature": temperature if temperature is not None else self.temperature,
+            },
+            # /api/chat 默认流式返回，非流式调用需显式关闭
+            "stream": stream,
+        }
+
     def chat(self,
              messages: List[Dict[str, str]],
              system_prompt: Optional[str] = None,
@@ -17,29 +42,37 @@ class OllamaModel(BaseModel):
         """使用Ollama API进行聊天"""
 
         # 准备API请求
-        payload = {
-            "model": self.model_name,
-            "messages": messages,
-            "temperature": temperature if temperature is not None else self.temperature,
-        }
-
-        # 添加系统提示
-        if system_prompt:
-            payload["system"] = system_prompt
+        payload = self._build_payload(messages, system_prompt, temperature)
 
         # 调用API
-        response = requests.post(f"{self.api_base}/api/chat",
-                                json=payload)
+        response = self.http_session.post(f"{self.api_base}/api/chat",
+                                         json=payload)
 
         if response.status_code != 200:
             raise Exception(f"API请求失败: {response.status_code} {response.text}")
 
         return response.json()["message"]["content"]
 
+    def stream_chat(self,
+                    messages: List[Dict[str, str]],
+                    system_prompt: Optional[str] = None,
+                    temperature: Optional[float] = None) -> Iterator[str]:
+        """使用Ollama API进行流式聊天（NDJSON）"""
+
+        payload = self._build_payload(messages, system_prompt, temperature, stream=True)
+
+        with self.http_session.post(f"{self.api_base}/api/chat",
+                                    json=payload,
+                                    stream=True) as response:
+            if response.status_code != 200:
+                raise Exception(f"API请求失败: {response.status_code} {response.text}")
+
+            yield from iter_ndjson_deltas(response.iter_lines())
+
     def get_available_models(self) -> List[str]:
         """获取可用的Ollama模型列表"""
         try:
-            response = requests.get(f"{self.api_base}/api/tags")
+            response = self.http_session.get(f"{self.api_base}/api/tags")
             if response.status_code != 200:
                 return ["llama2", "mistral", "llava"]
 
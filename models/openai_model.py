@@ -1,44 +1,87 @@
 import openai
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator
 from .base import BaseModel
 
 class OpenAIModel(BaseModel):
     """OpenAI API模型连接器"""
-    
+
+    api_protocol = "openai"
+
     def __init__(self, model_name: str, api_key: str, api_base: Optional[str] = None, temperature: float = 0.7):
         super().__init__(model_name, temperature)
-        openai.api_key = api_key
-        if api_base:
-            openai.api_base = api_base
-    
-    def chat(self, 
-             messages: List[Dict[str, str]], 
-             system_prompt: Optional[str] = None,
-             temperature: Optional[float] = None) -> str:
-        """使用OpenAI API进行聊天"""
-        
-        # 处理系统提示
+        self.api_key = api_key
+        self.api_base = api_base or "https://api.openai.com/v1"
+        self.headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        }
+        self._client = None
+
+    @property
+    def client(self) -> "openai.OpenAI":
+        """首次使用时再创建客户端，未配置密钥时不影响应用启动"""
+        if self._client is None:
+            self._client = openai.OpenAI(api_key=self.api_key, base_url=self.api_base)
+        return self._client
+
+    def _build_messages(self,
+                        messages: List[Dict[str, str]],
+                        system_prompt: Optional[str] = None) -> List[Dict[str, str]]:
+        """处理系统提示并拼接消息历史"""
         processed_messages = []
         if system_prompt:
             processed_messages.append({"role": "system", "content": system_prompt})
-        
-        # 添加消息历史
         processed_messages.extend(messages)
-        
+        return processed_messages
+
+    def _build_payload(self,
+                       messages: List[Dict[str, str]],
+                       system_prompt: Optional[str] = None,
+                       temperature: Optional[float] = None) -> Dict[str, Any]:
+        """构建聊天请求体（供异步调用直接请求接口）"""
+        return {
+            "model": self.model_name,
+            "messages": self._build_messages(messages, system_prompt),
+            "temperature": temperature if temperature is not None else self.temperature,
+        }
+
+    def chat(self,
+             messages: List[Dict[str, str]],
+             system_prompt: Optional[str] = None,
+             temperature: Optional[float] = None) -> str:
+        """使用OpenAI API进行聊天"""
+
         # 调用API
-        response = openai.ChatCompletion.create(
+        response = self.client.chat.completions.create(
             model=self.model_name,
-            messages=processed_messages,
+            messages=self._build_messages(messages, system_prompt),
             temperature=temperature if temperature is not None else self.temperature
         )
-        
+
         return response.choices[0].message.content
-    
+
+    def stream_chat(self,
+                    messages: List[Dict[str, str]],
+                    system_prompt: Optional[str] = None,
+                    temperature: Optional[float] = None) -> Iterator[str]:
+        """使用OpenAI API进行流式聊天"""
+
+        stream = self.client.chat.completions.create(
+            model=self.model_name,
+            messages=self._build_messages(messages, system_prompt),
+            temperature=temperature if temperature is not None else self.temperature,
+            stream=True
+        )
+
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
     def get_available_models(self) -> List[str]:
         """获取可用的OpenAI模型列表"""
         try:
-            models = openai.Model.list()
+            models = self.client.models.list()
             return [model.id for model in models.data if "gpt" in model.id]
         except Exception as e:
             print(f"获取模型列表失败: {e}")
-            return ["gpt-3.5-turbo", "gpt-4"]
\ No newline at end of file
+            return ["gpt-3.5-turbo", "gpt-4"]
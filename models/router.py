@@ -0,0 +1,548 @@
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, Optional, Iterator, AsyncIterator
+from .base import BaseModel
+from utils import metrics
+
+log = logging.getLogger(__name__)
+ROUTER_FAILOVERS = metrics.counter("marktreechat_router_failovers_total",
+                                   "端点请求失败后转移到下一个端点的次数", ["endpoint"])
+
+
+class EndpointHealth:
+    """单个端点的滚动延迟、错误率和熔断状态
+
+    熔断器有三种状态: closed（正常）、open（熔断，暂不分配请求）、
+    half_open（冷却结束或健康检查通过，允许一个试探请求）。
+    """
+
+    def __init__(self, window: int = 50, failure_threshold: int = 3,
+                 error_rate_threshold: float = 0.5, cooldown: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.cooldown = cooldown
+        self.latencies = deque(maxlen=window)   # 成功请求的延迟（秒）
+        self.outcomes = deque(maxlen=window)    # 最近请求是否成功
+        self.consecutive_failures = 0
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.trial_started = 0.0
+        self._lock = threading.Lock()
+
+    def record_success(self, latency: float):
+        with self._lock:
+            self.latencies.append(latency)
+            self.outcomes.append(True)
+            self.consecutive_failures = 0
+            self.state = "closed"
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.outcomes.append(False)
+            self.consecutive_failures += 1
+            self.trial_in_flight = False
+            # 半开状态下试探失败、连续失败过多或错误率过高时熔断
+            if (self.state == "half_open"
+                    or self.consecutive_failures >= self.failure_threshold
+                    or (len(self.outcomes) >= 10 and self.error_rate() > self.error_rate_threshold)):
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def half_open(self):
+        """健康检查通过后允许试探请求"""
+        with self._lock:
+            if self.state == "open":
+                self.state = "half_open"
+
+    def acquire(self, allow_trial: bool = True) -> str:
+        """判断当前是否可以向该端点分配请求
+
+        Returns:
+            "closed" 表示正常可用，"trial" 表示获得了半开状态下的试探名额，"" 表示不可用
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self.state == "open" and now - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+            if self.state == "closed":
+                return "closed"
+            # 试探请求被中途放弃时不会回报结果，超过冷却时间后允许重新试探
+            trial_free = not self.trial_in_flight or now - self.trial_started >= self.cooldown
+            if self.state == "half_open" and allow_trial and trial_free:
+                self.trial_in_flight = True
+                self.trial_started = now
+                return "trial"
+            return ""
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return 1.0 - sum(self.outcomes) / len(self.outcomes)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            latencies = sorted(self.latencies)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+    def stats(self) -> Dict[str, Any]:
+        p50 = self.percentile(0.5)
+        p95 = self.percentile(0.95)
+        return {
+            "state": self.state,
+            "requests": len(self.outcomes),
+            "error_rate": self.error_rate(),
+            "p50_ms": p50 * 1000 if p50 is not None else None,
+            "p95_ms": p95 * 1000 if p95 is not None else None,
+        }
+
+
+class RouterModel(BaseModel):
+    """在多个模型端点之间按延迟路由，带熔断、故障转移和可选的对冲请求
+
+    每个请求发往当前最快的健康端点；失败时依次尝试下一个。开启对冲后，如果主请求
+    在其历史p95延迟内没有返回（流式请求以首个片段为准）或提前失败，会向次优端点再发
+    一个备份请求，取先完成的结果。同步的流式对冲中落选的请求无法中断，会在收到首个
+    片段或失败后才关闭。
+    """
+
+    def __init__(self,
+                 endpoints: List[BaseModel],
+                 names: Optional[List[str]] = None,
+                 failure_threshold: int = 3,
+                 error_rate_threshold: float = 0.5,
+                 cooldown: float = 30.0,
+                 window: int = 50,
+                 hedge: bool = False,
+                 hedge_min_delay: float = 1.0,
+                 health_check_interval: float = 0.0):
+        if not endpoints:
+            raise ValueError("RouterModel至少需要一个端点")
+        super().__init__(endpoints[0].model_name, endpoints[0].temperature)
+        self.endpoints = list(endpoints)
+        self.names = names or [f"{type(m).__name__}:{m.model_name}" for m in endpoints]
+        self.health = [EndpointHealth(window, failure_threshold, error_rate_threshold, cooldown)
+                       for _ in endpoints]
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.model_name = " | ".join(self.names)
+
+        # 后台健康检查：探测处于熔断状态的端点，恢复后提前进入半开状态；close() 后停止
+        self.health_check_interval = health_check_interval
+        self._stop = threading.Event()
+        if health_check_interval > 0:
+            threading.Thread(target=self._health_check_loop, daemon=True).start()
+
+    def _health_check_loop(self):
+        while not self._stop.wait(self.health_check_interval):
+            for endpoint, health in zip(self.endpoints, self.health):
+                if health.state == "open":
+                    try:
+                        if endpoint.health_check():
+                            health.half_open()
+                    except Exception as e:
+                        log.warning("端点健康检查失败: %s", e)
+
+    @staticmethod
+    def _submit(fn, *args) -> Future:
+        """在独立线程中执行同步的对冲请求
+
+        每个请求使用自己的线程而不是共享线程池，并发的同步调用不会排队等待工作线程，
+        对冲的备份请求总能立即发出。
+        """
+        future = Future()
+
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, daemon=True).start()
+        return future
+
+    def _ranked(self) -> List[int]:
+        """按延迟排序的可用端点下标；全部熔断时按熔断时间先后全部返回，尽力而为
+
+        每个请求最多携带一个半开端点的试探名额，且该端点排在最前，保证试探一定被执行。
+        """
+        trial = None
+        available = []
+        for i, health in enumerate(self.health):
+            state = health.acquire(allow_trial=trial is None)
+            if state == "trial":
+                trial = i
+            elif state == "closed":
+                available.append(i)
+
+        if trial is None and not available:
+            return sorted(range(len(self.endpoints)), key=lambda i: self.health[i].opened_at)
+
+        def latency_key(i):
+            # 没有历史数据的端点优先尝试，以便尽快获得延迟样本
+            p50 = self.health[i].percentile(0.5)
+            return p50 if p50 is not None else 0.0
+
+        ranked = sorted(available, key=latency_key)
+        return [trial] + ranked if trial is not None else ranked
+
+    def _hedge_delay(self, index: int) -> float:
+        p95 = self.health[index].percentile(0.95)
+        return max(self.hedge_min_delay, p95 or 0.0)
+
+    def _failover(self, index: int, error: Exception):
+        ROUTER_FAILOVERS.inc(endpoint=self.names[index])
+        log.warning("端点 %s 请求失败，尝试下一个: %s", self.names[index], error,
+                    extra={"rate_key": f"failover:{self.names[index]}"})
+
+    def _call(self, index: int, messages, system_prompt, temperature) -> str:
+        start = time.perf_counter()
+        try:
+            reply = self.endpoints[index].chat(messages=messages, system_prompt=system_prompt,
+                                               temperature=temperature)
+        except Exception:
+            self.health[index].record_failure()
+            raise
+        self.health[index].record_success(time.perf_counter() - start)
+        return reply
+
+    def chat(self,
+             messages: List[Dict[str, str]],
+             system_prompt: Optional[str] = None,
+             temperature: Optional[float] = None) -> str:
+        """路由聊天请求，失败时转移到下一个端点"""
+        ranked = self._ranked()
+        last_error = None
+
+        if self.hedge and len(ranked) > 1:
+            tried = []
+            try:
+                return self._hedged_chat(ranked, messages, system_prompt, temperature, tried)
+            except Exception as e:
+                last_error = e
+            # 对冲失败后，继续尝试还没有被调用过的端点
+            ranked = [i for i in ranked if i not in tried]
+
+        for index in ranked:
+            try:
+                return self._call(index, messages, system_prompt, temperature)
+            except Exception as e:
+                self._failover(index, e)
+                last_error = e
+        raise Exception(f"所有模型端点均不可用: {last_error}")
+
+    def _hedged_chat(self, ranked: List[int], messages, system_prompt, temperature,
+                     tried: List[int]) -> str:
+        """主请求超过p95延迟仍未返回或提前失败时，向次优端点发出备份请求
+
+        Args:
+            tried: 实际发出请求的端点下标会追加到此列表，供调用方在失败后跳过
+        """
+        primary, backup = ranked[0], ranked[1]
+        futures = {self._submit(self._call, primary, messages, system_prompt, temperature): primary}
+        tried.append(primary)
+        done, pending = wait(futures, timeout=self._hedge_delay(primary))
+        if not done or next(iter(done)).exception() is not None:
+            futures[self._submit(self._call, backup, messages, system_prompt, temperature)] = backup
+            tried.append(backup)
+            pending = set(futures) - done
+
+        last_error = None
+        while True:
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                last_error = future.exception()
+                self._failover(futures[future], last_error)
+            if not pending:
+                raise last_error
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+    def _open_stream(self, index: int, messages, system_prompt, temperature):
+        """发起流式请求并等到第一个片段
+
+        Returns:
+            (片段迭代器, 第一个片段, 开始时间)，没有任何片段时第一个片段为 None
+        """
+        start = time.perf_counter()
+        stream = iter(self.endpoints[index].stream_chat(messages, system_prompt, temperature))
+        try:
+            first = next(stream, None)
+        except Exception:
+            self.health[index].record_failure()
+            raise
+        return stream, first, start
+
+    @staticmethod
+    def _close_stream(future):
+        """关闭落选的流式请求"""
+        if not future.cancelled() and future.exception() is None:
+            stream = future.result()[0]
+            if hasattr(stream, "close"):
+                stream.close()
+
+    def _hedged_open(self, ranked: List[int], messages, system_prompt, temperature, tried: List[int]):
+        """流式请求的对冲：主请求在p95延迟内没有产出首个片段或提前失败时，向次优端点发出备份请求
+
+        Returns:
+            (端点下标, 片段迭代器, 第一个片段, 开始时间)，取先产出首个片段的端点
+        """
+        primary, backup = ranked[0], ranked[1]
+        futures = {self._submit(self._open_stream, primary, messages, system_prompt, temperature): primary}
+        tried.append(primary)
+        done, pending = wait(futures, timeout=self._hedge_delay(primary))
+        if not done or next(iter(done)).exception() is not None:
+            futures[self._submit(self._open_stream, backup, messages, system_prompt, temperature)] = backup
+            tried.append(backup)
+            pending = set(futures) - done
+
+        winner = None
+        last_error = None
+        while winner is None:
+            for future in done:
+                if future.exception() is not None:
+                    last_error = future.exception()
+                    self._failover(futures[future], last_error)
+                elif winner is None:
+                    winner = future
+                else:
+                    self._close_stream(future)
+            if winner is None and not pending:
+                raise last_error
+            if winner is None:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+        for future in pending:
+            future.add_done_callback(self._close_stream)
+        return (futures[winner],) + winner.result()
+
+    def _finish_stream(self, index: int, stream, first, start) -> Iterator[str]:
+        """产出对冲胜出的流式请求的剩余片段"""
+        try:
+            if first is not None:
+                yield first
+                for delta in stream:
+                    yield delta
+        except Exception:
+            self.health[index].record_failure()
+            raise
+        finally:
+            if hasattr(stream, "close"):
+                stream.close()
+        self.health[index].record_success(time.perf_counter() - start)
+
+    def stream_chat(self,
+                    messages: List[Dict[str, str]],
+                    system_prompt: Optional[str] = None,
+                    temperature: Optional[float] = None) -> Iterator[str]:
+        """流式路由，只在产出第一个片段之前进行故障转移"""
+        ranked = self._ranked()
+        last_error = None
+
+        if self.hedge and len(ranked) > 1:
+            tried = []
+            try:
+                opened = self._hedged_open(ranked, messages, system_prompt, temperature, tried)
+            except Exception as e:
+                last_error = e
+                ranked = [i for i in ranked if i not in tried]
+            else:
+                yield from self._finish_stream(*opened)
+                return
+
+        for index in ranked:
+            start = time.perf_counter()
+            started = False
+            try:
+                for delta in self.endpoints[index].stream_chat(messages, system_prompt, temperature):
+                    started = True
+                    yield delta
+            except Exception as e:
+                self.health[index].record_failure()
+                if started:
+                    raise
+                self._failover(index, e)
+                last_error = e
+                continue
+            self.health[index].record_success(time.perf_counter() - start)
+            return
+        raise Exception(f"所有模型端点均不可用: {last_error}")
+
+    async def _acall(self, index: int, messages, system_prompt, temperature) -> str:
+        start = time.perf_counter()
+        try:
+            reply = await self.endpoints[index].achat(messages, system_prompt, temperature)
+        except Exception:
+            self.health[index].record_failure()
+            raise
+        self.health[index].record_success(time.perf_counter() - start)
+        return reply
+
+    async def _ahedged_chat(self, ranked: List[int], messages, system_prompt, temperature,
+                            tried: List[int]) -> str:
+        """_hedged_chat 的异步版本，备份请求使用任务，先完成的结果返回后取消其余任务"""
+        primary, backup = ranked[0], ranked[1]
+        tasks = {asyncio.ensure_future(self._acall(primary, messages, system_prompt, temperature)): primary}
+        tried.append(primary)
+        done, pending = await asyncio.wait(tasks, timeout=self._hedge_delay(primary))
+        if not done or next(iter(done)).exception() is not None:
+            tasks[asyncio.ensure_future(self._acall(backup, messages, system_prompt, temperature))] = backup
+            tried.append(backup)
+            pending = set(tasks) - done
+
+        last_error = None
+        try:
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                    self._failover(tasks[task], last_error)
+                if not pending:
+                    raise last_error
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _aopen_stream(self, index: int, messages, system_prompt, temperature):
+        """_open_stream 的异步版本"""
+        start = time.perf_counter()
+        stream = self.endpoints[index].astream_chat(messages, system_prompt, temperature)
+        try:
+            first = await stream.__anext__()
+        except StopAsyncIteration:
+            first = None
+        except Exception:
+            self.health[index].record_failure()
+            raise
+        return stream, first, start
+
+    async def _ahedged_open(self, ranked: List[int], messages, system_prompt, temperature, tried: List[int]):
+        """_hedged_open 的异步版本，落选的请求直接取消"""
+        primary, backup = ranked[0], ranked[1]
+        tasks = {asyncio.ensure_future(self._aopen_stream(primary, messages, system_prompt, temperature)): primary}
+        tried.append(primary)
+        done, pending = await asyncio.wait(tasks, timeout=self._hedge_delay(primary))
+        if not done or next(iter(done)).exception() is not None:
+            tasks[asyncio.ensure_future(self._aopen_stream(backup, messages, system_prompt, temperature))] = backup
+            tried.append(backup)
+            pending = set(tasks) - done
+
+        winner = None
+        last_error = None
+        try:
+            while winner is None:
+                for task in done:
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                        self._failover(tasks[task], last_error)
+                    elif winner is None:
+                        winner = task
+                    else:
+                        await task.result()[0].aclose()
+                if winner is None and not pending:
+                    raise last_error
+                if winner is None:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+        return (tasks[winner],) + winner.result()
+
+    async def achat(self,
+                    messages: List[Dict[str, str]],
+                    system_prompt: Optional[str] = None,
+                    temperature: Optional[float] = None) -> str:
+        """chat 的异步版本，对冲请求使用任务而不是线程"""
+        ranked = self._ranked()
+        last_error = None
+
+        if self.hedge and len(ranked) > 1:
+            tried = []
+            try:
+                return await self._ahedged_chat(ranked, messages, system_prompt, temperature, tried)
+            except Exception as e:
+                last_error = e
+            ranked = [i for i in ranked if i not in tried]
+
+        for index in ranked:
+            try:
+                return await self._acall(index, messages, system_prompt, temperature)
+            except Exception as e:
+                self._failover(index, e)
+                last_error = e
+        raise Exception(f"所有模型端点均不可用: {last_error}")
+
+    async def astream_chat(self,
+                           messages: List[Dict[str, str]],
+                           system_prompt: Optional[str] = None,
+                           temperature: Optional[float] = None) -> AsyncIterator[str]:
+        """stream_chat 的异步版本"""
+        ranked = self._ranked()
+        last_error = None
+
+        if self.hedge and len(ranked) > 1:
+            tried = []
+            try:
+                index, stream, first, start = await self._ahedged_open(ranked, messages, system_prompt,
+                                                                       temperature, tried)
+            except Exception as e:
+                last_error = e
+                ranked = [i for i in ranked if i not in tried]
+            else:
+                try:
+                    if first is not None:
+                        yield first
+                        async for delta in stream:
+                            yield delta
+                except Exception:
+                    self.health[index].record_failure()
+                    raise
+                finally:
+                    await stream.aclose()
+                self.health[index].record_success(time.perf_counter() - start)
+                return
+
+        for index in ranked:
+            start = time.perf_counter()
+            started = False
+            try:
+                async for delta in self.endpoints[index].astream_chat(messages, system_prompt, temperature):
+                    started = True
+                    yield delta
+            except Exception as e:
+                self.health[index].record_failure()
+                if started:
+                    raise
+                self._failover(index, e)
+                last_error = e
+                continue
+            self.health[index].record_success(time.perf_counter() - start)
+            return
+        raise Exception(f"所有模型端点均不可用: {last_error}")
+
+    def get_available_models(self) -> List[str]:
+        return list(self.names)
+
+    def close(self):
+        """停止后台健康检查并关闭各端点；已经开始的请求不受影响"""
+        self._stop.set()
+        for endpoint in self.endpoints:
+            endpoint.close()
+
+    def health_check(self, timeout: float = 3.0) -> bool:
+        return any(endpoint.health_check(timeout) for endpoint in self.endpoints)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各端点的延迟、错误率和熔断状态"""
+        return {name: health.stats() for name, health in zip(self.names, self.health)}
@@ -0,0 +1,109 @@
+import json
+from typing import Iterable, Iterator, AsyncIterable, AsyncIterator, Union
+
+# 流结束标记
+_DONE = object()
+
+
+def _decode(line: Union[bytes, str]) -> str:
+    """将响应行统一解码为UTF-8文本（不依赖响应头中的编码声明）"""
+    if isinstance(line, bytes):
+        line = line.decode("utf-8", errors="replace")
+    return line.rstrip("\r")
+
+
+def parse_sse_line(line: Union[bytes, str]):
+    """解析OpenAI兼容接口SSE流中的一行
+
+    Returns:
+        增量文本；无内容时返回None；流结束时返回 _DONE
+    """
+    line = _decode(line)
+    # 空行分隔事件，冒号开头为注释（心跳）
+    if not line or line.startswith(":") or not line.startswith("data:"):
+        return None
+
+    data = line[len("data:"):].strip()
+    if data == "[DONE]":
+        return _DONE
+
+    chunk = json.loads(data)
+    if "error" in chunk:
+        raise Exception(f"API流式响应错误: {chunk['error']}")
+
+    choices = chunk.get("choices") or []
+    if not choices:
+        return None
+    return (choices[0].get("delta") or {}).get("content") or None
+
+
+def parse_ndjson_line(line: Union[bytes, str]):
+    """解析Ollama /api/chat NDJSON流中的一行
+
+    Returns:
+        (增量文本或None, 是否结束)
+    """
+    line = _decode(line)
+    if not line.strip():
+        return None, False
+
+    chunk = json.loads(line)
+    if "error" in chunk:
+        raise Exception(f"API流式响应错误: {chunk['error']}")
+
+    content = (chunk.get("message") or {}).get("content") or None
+    return content, bool(chunk.get("done"))
+
+
+def iter_sse_deltas(lines: Iterable[Union[bytes, str]]) -> Iterator[str]:
+    """解析OpenAI兼容接口的SSE流，逐个产出增量文本
+
+    Args:
+        lines: 响应的逐行内容，例如 response.iter_lines()
+
+    Yields:
+        每个数据块中 choices[0].delta.content 的文本
+    """
+    for line in lines:
+        content = parse_sse_line(line)
+        if content is _DONE:
+            break
+        if content:
+            yield content
+
+
+def iter_ndjson_deltas(lines: Iterable[Union[bytes, str]]) -> Iterator[str]:
+    """解析Ollama /api/chat 的NDJSON流，逐个产出增量文本
+
+    Args:
+        lines: 响应的逐行内容，每行一个JSON对象
+
+    Yields:
+        每个对象中 message.content 的文本
+    """
+    for line in lines:
+        content, done = parse_ndjson_line(line)
+        if content:
+            yield content
+        if done:
+            break
+
+
+async def aiter_sse_deltas(lines: AsyncIterable[Union[bytes, str]]) -> AsyncIterator[str]:
+    """iter_sse_deltas 的异步版本，用于 httpx 的 response.aiter_lines()"""
+    async for line in lines:
+        content = parse_sse_line(line)
+        if content is _DONE:
+            break
+        if content:
+            yield content
+
+
+async def aiter_ndjson_deltas(lines: AsyncIterable[Union[bytes, str]]) -> AsyncIterator[str]:
+    """iter_ndjson_deltas 的异步版本，用于 httpx 的 response.aiter_lines()"""
+    async for line in lines:
+        content, done = parse_ndjson_line(line)
+        if content:
+            yield content
+        if done:
+            break
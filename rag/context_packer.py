@@ -0,0 +1,118 @@
+from typing import List, Dict, Any, Optional
+from utils.tokens import count_tokens, truncate_to_tokens
+
+
+class ContextPacker:
+    """在token预算内组装检索上下文
+
+    按相关度从高到低装入文档块，放不下的块跳过（剩余预算足够时截断装入）；
+    同一文件中相邻的块合并为一段并去掉首尾重叠的文本，减少重复的来源标注。
+    """
+
+    def __init__(self, max_tokens: Optional[int] = 1500, min_partial_tokens: int = 128,
+                 max_overlap_chars: int = 400):
+        """
+        Args:
+            max_tokens: 上下文的token预算，None表示不限制
+            min_partial_tokens: 剩余预算不少于该值时，放不下的块截断后装入
+            max_overlap_chars: 合并相邻块时检测的最长重叠字符数
+        """
+        self.max_tokens = max_tokens
+        self.min_partial_tokens = min_partial_tokens
+        self.max_overlap_chars = max_overlap_chars
+
+    @staticmethod
+    def _header(index: int, source: str) -> str:
+        return f"[文档 {index} (来源: {source})]\n"
+
+    @staticmethod
+    def _token_count(result: Dict[str, Any]) -> int:
+        """优先使用索引时保存的token数，旧索引没有时现场计算"""
+        token_count = result["metadata"].get("token_count")
+        if token_count is None:
+            token_count = count_tokens(result["content"])
+        return token_count
+
+    def _trim_overlap(self, previous: str, current: str) -> str:
+        """去掉 current 开头与 previous 结尾重复的部分"""
+        limit = min(len(previous), len(current), self.max_overlap_chars)
+        for size in range(limit, 0, -1):
+            if previous.endswith(current[:size]):
+                return current[size:]
+        return current
+
+    def pack(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """把检索结果装入预算
+
+        Args:
+            results: Retriever.retrieve 返回的结果列表
+
+        Returns:
+            字典，包含 context（上下文文本）、used_tokens（实际使用的token数）、
+            skipped_tokens（因预算被丢弃的token数）、included / skipped（装入与跳过的块数）
+            以及 sources（装入内容的来源列表）
+        """
+        header_cost = count_tokens(self._header(1, "")) + 1
+        remaining = self.max_tokens if self.max_tokens is not None else float("inf")
+        selected = []
+        skipped = 0
+        skipped_tokens = 0
+
+        for order, result in enumerate(sorted(results, key=lambda r: r["score"], reverse=True)):
+            source = result["metadata"].get("source", "未知来源")
+            tokens = self._token_count(result)
+            cost = tokens + header_cost + count_tokens(source)
+            content = result["content"]
+            if cost > remaining:
+                partial = int(remaining - (cost - tokens))
+                if partial < self.min_partial_tokens:
+                    skipped += 1
+                    skipped_tokens += tokens
+                    continue
+                content = truncate_to_tokens(content, partial)
+                skipped_tokens += tokens - partial
+                cost = remaining
+            remaining -= cost
+            selected.append((order, result, content))
+
+        # 同一文件中块序号连续的结果合并为一段
+        blocks = []
+        by_position = sorted(selected, key=lambda s: (s[1]["metadata"].get("source", ""),
+                                                      s[1]["metadata"].get("chunk_index", 0)))
+        for order, result, content in by_position:
+            metadata = result["metadata"]
+            source = metadata.get("source", "未知来源")
+            chunk_index = metadata.get("chunk_index")
+            last = blocks[-1] if blocks else None
+            if (last is not None and last["source"] == source and chunk_index is not None
+                    and last["last_chunk"] is not None and chunk_index == last["last_chunk"] + 1):
+                last["parts"].append(self._trim_overlap(last["parts"][-1], content))
+                last["last_chunk"] = chunk_index
+                last["order"] = min(last["order"], order)
+            else:
+                blocks.append({"source": source, "parts": [content], "last_chunk": chunk_index, "order": order})
+
+        # 合并后的段落仍按其中最相关块的排名输出
+        blocks.sort(key=lambda b: b["order"])
+        context_parts = [f"{self._header(i, b['source'])}{''.join(self._join(b['parts']))}\n"
+                         for i, b in enumerate(blocks, 1)]
+        context = "\n".join(context_parts)
+
+        return {
+            "context": context,
+            "used_tokens": count_tokens(context),
+            "skipped_tokens": skipped_tokens,
+            "included": len(selected),
+            "skipped": skipped,
+            "sources": [b["source"] for b in blocks],
+        }
+
+    @staticmethod
+    def _join(parts: List[str]) -> List[str]:
+        """相邻块原本以换行分隔，合并时补回换行"""
+        joined = [parts[0]]
+        for part in parts[1:]:
+            if part and not joined[-1].endswith("\n") and not part.startswith("\n"):
+                joined.append("\n")
+            joined.append(part)
+        return joined
@@ -0,0 +1,254 @@
+import os
+import threading
+import numpy as np
+from typing import List, Dict, Any, Tuple, Optional
+from .vectorstore import VectorStore, VectorSnapshot
+
+
+class _HierarchyNode:
+    """层级索引中的一个节点（目录、文件或段落）"""
+
+    __slots__ = ("key", "kind", "start", "end", "children", "index")
+
+    def __init__(self, key: Tuple[str, ...], kind: str, start: int):
+        self.key = key          # 从根到该节点的路径分量
+        self.kind = kind        # root / directory / file / section
+        self.start = start      # 在重排后矩阵中的起始行（含）
+        self.end = start        # 结束行（不含）
+        self.children = []
+        self.index = -1         # 在质心矩阵中的行号
+
+
+class _HierarchyState:
+    """某个向量存储版本上构建完成的层级索引，发布后不再修改"""
+
+    __slots__ = ("version", "doc_ids", "matrix", "nodes", "centroids", "root", "lookup")
+
+    def __init__(self, version, doc_ids, matrix, nodes, centroids, root, lookup):
+        self.version = version
+        self.doc_ids = doc_ids        # 重排后的文档ID
+        self.matrix = matrix          # 重排后的归一化嵌入矩阵
+        self.nodes = nodes            # 全部节点，下标即 node.index
+        self.centroids = centroids    # 节点质心矩阵
+        self.root = root
+        self.lookup = lookup          # 路径分量元组 -> 节点
+
+    def resolve(self, nodes: List[_HierarchyNode]) -> List[_HierarchyNode]:
+        """把其他版本构建的节点映射为本版本中路径相同的节点"""
+        resolved = []
+        for node in nodes:
+            if 0 <= node.index < len(self.nodes) and self.nodes[node.index] is node:
+                resolved.append(node)
+            elif node.key in self.lookup:
+                resolved.append(self.lookup[node.key])
+        return resolved
+
+
+class HierarchicalIndex:
+    """目录 → 文件 → 段落的层级向量索引
+
+    将文档块按来源路径和段落排序，使每个目录、文件、段落都对应重排后嵌入矩阵中的
+    一段连续行，并为每个节点保存归一化的质心向量。检索时先在质心上做束搜索选出
+    最相关的若干分支，再只对这些分支内的文档块打分。
+
+    索引基于向量存储的一个快照构建，构建完成后整体发布；检索过程中固定使用同一份
+    状态，不会因为并发的重建而读到不一致的矩阵和节点。
+    """
+
+    def __init__(self, vector_store: VectorStore):
+        self.vector_store = vector_store
+        self._state = None
+        self._build_lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self._state.version if self._state else None
+
+    @property
+    def doc_ids(self) -> List[str]:
+        return self._state.doc_ids if self._state else []
+
+    @property
+    def root(self) -> Optional[_HierarchyNode]:
+        return self._state.root if self._state else None
+
+    @property
+    def lookup(self) -> Dict[Tuple[str, ...], _HierarchyNode]:
+        return self._state.lookup if self._state else {}
+
+    @staticmethod
+    def _path_parts(source: str) -> List[str]:
+        """把文档来源路径拆成路径分量"""
+        normalized = os.path.normpath(source.replace("\\", "/"))
+        return [p for p in normalized.split(os.sep) if p not in ("", ".")]
+
+    def _sort_key(self, documents: Dict[str, Any], doc_id: str) -> Tuple[str, ...]:
+        doc = documents.get(doc_id) or {}
+        metadata = doc.get("metadata", {})
+        chunk_index = metadata.get("chunk_index", 0)
+        # 旧索引没有段落信息时，每个块视为独立段落
+        section_index = metadata.get("section_index", chunk_index)
+        parts = self._path_parts(metadata.get("source", doc_id))
+        return tuple(parts) + (f"{section_index:08d}", f"{chunk_index:08d}")
+
+    def build(self, snapshot: Optional[VectorSnapshot] = None) -> _HierarchyState:
+        """根据向量存储的快照（默认为当前快照）构建层级索引
+
+        只有不比已发布状态旧的结果才会发布，为旧快照构建的状态仅返回给调用方。
+        """
+        snapshot = snapshot or self.vector_store.snapshot()
+        doc_ids, matrix = snapshot.matrix()
+
+        keys = [self._sort_key(snapshot.documents, doc_id) for doc_id in doc_ids]
+        order = sorted(range(len(doc_ids)), key=lambda i: keys[i])
+
+        doc_ids = [doc_ids[i] for i in order]
+        matrix = matrix[order] if doc_ids else matrix
+        root = _HierarchyNode((), "root", 0)
+        nodes = [root]
+
+        # 排序保证共享前缀的行相邻，逐行沿路径创建或延伸节点
+        lookup = {(): root}
+        for row, i in enumerate(order):
+            key = keys[i]
+            path_len = len(key) - 2  # 去掉段落和块序号后的路径长度
+            parent = root
+            parent.end = row + 1
+            # 最后一个路径分量是文件，其后是段落
+            for depth in range(1, path_len + 2):
+                node_key = key[:depth]
+                node = lookup.get(node_key)
+                if node is None:
+                    if depth <= path_len - 1:
+                        kind = "directory"
+                    elif depth == path_len:
+                        kind = "file"
+                    else:
+                        kind = "section"
+                    node = _HierarchyNode(node_key, kind, row)
+                    lookup[node_key] = node
+                    parent.children.append(node)
+                    nodes.append(node)
+                node.end = row + 1
+                parent = node
+
+        # 用前缀和一次性计算所有节点的质心
+        for idx, node in enumerate(nodes):
+            node.index = idx
+        if len(doc_ids) > 0:
+            prefix = np.vstack([np.zeros((1, matrix.shape[1]), dtype=np.float64),
+                                np.cumsum(matrix, axis=0, dtype=np.float64)])
+            starts = np.array([n.start for n in nodes])
+            ends = np.array([n.end for n in nodes])
+            sums = prefix[ends] - prefix[starts]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = np.divide(sums, norms, out=np.zeros_like(sums), where=norms > 0).astype(np.float32)
+        else:
+            centroids = np.zeros((len(nodes), 0), dtype=np.float32)
+
+        state = _HierarchyState(snapshot.version, doc_ids, matrix, nodes, centroids, root, lookup)
+        if self._state is None or state.version >= self._state.version:
+            self._state = state
+        return state
+
+    def ensure_current(self, snapshot: Optional[VectorSnapshot] = None) -> _HierarchyState:
+        """返回与快照（默认为当前快照）版本一致的状态，版本不同时重建"""
+        snapshot = snapshot or self.vector_store.snapshot()
+        state = self._state
+        if state is not None and state.version == snapshot.version:
+            return state
+        # 避免多个检索线程同时重建
+        with self._build_lock:
+            state = self._state
+            if state is None or state.version != snapshot.version:
+                state = self.build(snapshot)
+            return state
+
+    def search(self, query_embedding: np.ndarray, top_k: int = 5, beam_width: int = 4,
+               roots: Optional[List[_HierarchyNode]] = None,
+               snapshot: Optional[VectorSnapshot] = None) -> List[Tuple[str, float]]:
+        """由粗到细的束搜索
+
+        Args:
+            query_embedding: 查询向量
+            top_k: 返回的最大文档数量
+            beam_width: 每一层保留的分支数量
+            roots: 束搜索的起点节点，用于限定检索范围，默认为根节点
+            snapshot: 检索的向量存储快照，默认为当前快照
+
+        Returns:
+            (文档ID, 相似度) 列表，按相似度降序排列
+        """
+        state = self.ensure_current(snapshot)
+        query_norm = np.linalg.norm(query_embedding)
+        if not state.doc_ids or query_norm == 0 or top_k <= 0:
+            return []
+        query = query_embedding.astype(np.float32) / query_norm
+
+        # 束搜索：不断把非叶子节点替换为其子节点，只保留得分最高的beam_width个
+        frontier = state.resolve(roots) if roots else [state.root]
+        while any(node.children for node in frontier):
+            candidates = []
+            for node in frontier:
+                candidates.extend(node.children if node.children else [node])
+            if len(candidates) > beam_width:
+                scores = state.centroids[[n.index for n in candidates]] @ query
+                keep = np.argsort(-scores)[:beam_width]
+                candidates = [candidates[i] for i in keep]
+            frontier = candidates
+
+        # 只对选中段落内的文档块打分
+        return self._search_rows(state, query, top_k, self._rows_for(frontier))
+
+    def search_within(self, query_embedding: np.ndarray, top_k: int, nodes: List[_HierarchyNode],
+                      snapshot: Optional[VectorSnapshot] = None) -> List[Tuple[str, float]]:
+        """在给定节点对应的行范围内做全量检索"""
+        state = self.ensure_current(snapshot)
+        query_norm = np.linalg.norm(query_embedding)
+        if not state.doc_ids or query_norm == 0 or top_k <= 0:
+            return []
+        query = query_embedding.astype(np.float32) / query_norm
+        return self._search_rows(state, query, top_k, self._rows_for(state.resolve(nodes)))
+
+    @staticmethod
+    def _rows_for(nodes: List[_HierarchyNode]) -> np.ndarray:
+        """合并节点的行区间（去掉嵌套和重叠部分）并展开为行号数组"""
+        intervals = sorted((n.start, n.end) for n in nodes if n.end > n.start)
+        merged = []
+        for start, end in intervals:
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        if not merged:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([np.arange(start, end) for start, end in merged])
+
+    @staticmethod
+    def _search_rows(state: _HierarchyState, query: np.ndarray, top_k: int,
+                     rows: np.ndarray) -> List[Tuple[str, float]]:
+        """对指定行打分并返回前top_k个结果"""
+        if len(rows) == 0:
+            return []
+        scores = state.matrix[rows] @ query
+        k = min(top_k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(state.doc_ids[rows[i]], float(scores[i])) for i in top]
+
+    def node_for_path(self, path: str, snapshot: Optional[VectorSnapshot] = None) -> Optional[_HierarchyNode]:
+        """按文件或目录路径查找节点"""
+        return self.ensure_current(snapshot).lookup.get(tuple(self._path_parts(path)))
+
+    def best_in_node(self, node: _HierarchyNode, query_embedding: np.ndarray,
+                     snapshot: Optional[VectorSnapshot] = None) -> Optional[Tuple[str, float]]:
+        """返回节点范围内与查询最相似的文档块"""
+        state = self.ensure_current(snapshot)
+        resolved = state.resolve([node])
+        query_norm = np.linalg.norm(query_embedding)
+        if not resolved or resolved[0].end <= resolved[0].start or query_norm == 0:
+            return None
+        node = resolved[0]
+        scores = state.matrix[node.start:node.end] @ (query_embedding.astype(np.float32) / query_norm)
+        best = int(np.argmax(scores))
+        return state.doc_ids[node.start + best], float(scores[best])
@@ -1,9 +1,16 @@
 import os
 import uuid
+import shutil
+import numpy as np
 from typing import List, Dict, Any, Optional
 import re
 from .vectorstore import VectorStore
 from .retriever import Retriever
+from utils import metrics
+from utils.tokens import count_tokens
+
+INDEXED_FILES = metrics.counter("marktreechat_index_files_total", "索引的文件数", ["result"])
+INDEXED_CHUNKS = metrics.counter("marktreechat_index_chunks_total", "写入向量存储的文档块数")
 
 class DocumentIndexer:
     """文档索引器，用于索引和管理知识库文档"""
@@ -83,25 +90,44 @@ class DocumentIndexer:
                 "last_modified": last_modified  # 添加最后修改时间
             }
             
-            # 为每个块创建索引
+            # 为每个块创建索引，整个文件一次性发布到向量存储
             doc_ids = []
+            items = []
+            section_index = 0
+            section_title = ""
             for i, chunk in enumerate(chunks):
                 doc_id = f"{file_path}_{i}"
                 
+                # 以标题开头的块开启新段落，否则延续上一个段落（超长段落会被拆成多块）
+                header_match = re.match(r'^(#{1,6})\s+(.*?)\s*$', chunk.split('\n', 1)[0])
+                if header_match and i > 0:
+                    section_index += 1
+                if header_match:
+                    section_title = header_match.group(2)
+                
                 # 为块添加额外元数据
                 chunk_metadata = metadata.copy()
                 chunk_metadata["chunk_index"] = i
                 chunk_metadata["total_chunks"] = len(chunks)
+                chunk_metadata["section_index"] = section_index
+                chunk_metadata["section"] = section_title
+                # 保存token数，组装上下文时无需重新分词
+                chunk_metadata["token_count"] = count_tokens(chunk)
                 
-                # 将文档添加到向量存储
-                self.vector_store.add_document(doc_id, chunk, chunk_metadata)
+                items.append((doc_id, chunk, chunk_metadata))
                 doc_ids.append(doc_id)
             
+            # 将文档添加到向量存储
+            self.vector_store.add_documents(items)
+            
             print(f"已索引文件 {file_path}，共 {len(chunks)} 个块")
+            INDEXED_FILES.inc(result="indexed")
+            INDEXED_CHUNKS.inc(len(chunks))
             return doc_ids
         
         except Exception as e:
             print(f"索引文件 {file_path} 失败: {e}")
+            INDEXED_FILES.inc(result="failed")
             return []
 
     def index_directory(self, directory_path: str, incremental: bool = True) -> Dict[str, List[str]]:
@@ -169,16 +195,17 @@ class DocumentIndexer:
             if doc_data["metadata"].get("source") == file_path:
                 to_remove.append(doc_id)
         
-        # 移除文档
-        success = True
-        for doc_id in to_remove:
-            if not self.vector_store.delete_document(doc_id):
-                success = False
+        # 移除文档（一次发布新快照）
+        removed = self.vector_store.delete_documents(to_remove)
         
-        return success and len(to_remove) > 0
+        return removed == len(to_remove) and removed > 0
     
     def reindex(self, directory_path: str) -> Dict[str, List[str]]:
-        """重新索引目录
+        """重新索引目录（影子重建，不中断检索）
+        
+        先把整个目录索引到 vector_dir 旁边的影子目录，校验通过后再整体切换；
+        重建期间检索继续使用旧索引，上一代索引保留在 vector_dir + ".prev" 中，
+        可以用 rollback() 恢复。重建期间对旧索引的增量修改会在切换后被新索引取代。
         
         Args:
             directory_path: 要重新索引的目录路径
@@ -186,13 +213,63 @@ class DocumentIndexer:
         Returns:
             文件路径到文档ID列表的映射
         """
-        # 清空现有索引
-        self.vector_store.documents = {}
-        self.vector_store.embeddings = {}
-        self.vector_store._save_to_disk()
+        vector_dir = self.vector_store.vector_dir.rstrip("/\\")
+        shadow_dir = vector_dir + ".shadow"
+        if os.path.exists(shadow_dir):
+            shutil.rmtree(shadow_dir)
+        
+        # 在影子目录中全量索引，结束时只写一次磁盘
+        shadow_store = self.vector_store.sibling(shadow_dir)
+        shadow_store.autosave = False
+        indexed = DocumentIndexer(shadow_store).index_directory(directory_path, incremental=False)
+        shadow_store.save()
+        
+        try:
+            snapshot = self._verify_shadow(shadow_store, directory_path, indexed)
+        except Exception:
+            shutil.rmtree(shadow_dir, ignore_errors=True)
+            raise
+        
+        version = self.vector_store.swap_in(shadow_dir, vector_dir + ".prev", snapshot)
+        print(f"影子索引校验通过并已切换，共 {len(snapshot.documents)} 个文档块，索引版本 {version}")
+        return indexed
+    
+    @staticmethod
+    def _verify_shadow(shadow_store: VectorStore, directory_path: str,
+                       indexed: Dict[str, List[str]]):
+        """校验影子索引：所有文件均已索引，磁盘内容可读且与内存一致，嵌入维度一致且有限
         
-        # 重新索引
-        return self.index_directory(directory_path)
+        Returns:
+            从磁盘重新读取的快照
+        """
+        expected = sum(1 for _, _, files in os.walk(directory_path) for f in files if f.endswith('.md'))
+        if len(indexed) != expected:
+            raise Exception(f"影子索引不完整: {expected} 个文件中只有 {len(indexed)} 个索引成功")
+        
+        snapshot = VectorStore.read_snapshot(shadow_store.vector_dir)
+        doc_ids = set(snapshot.documents)
+        if doc_ids != set(shadow_store.documents) or doc_ids != set(snapshot.embeddings):
+            raise Exception("影子索引校验失败: 磁盘上的文档与嵌入不一致")
+        
+        dims = {embedding.shape for embedding in snapshot.embeddings.values()}
+        if len(dims) > 1:
+            raise Exception(f"影子索引校验失败: 嵌入维度不一致 {dims}")
+        if any(not np.all(np.isfinite(embedding)) for embedding in snapshot.embeddings.values()):
+            raise Exception("影子索引校验失败: 嵌入包含非有限值")
+        return snapshot
+    
+    def rollback(self) -> bool:
+        """切换回上一代索引（当前索引转为上一代，可再次回滚）
+        
+        Returns:
+            是否存在可回滚的索引
+        """
+        prev_dir = self.vector_store.vector_dir.rstrip("/\\") + ".prev"
+        if not os.path.exists(prev_dir):
+            return False
+        version = self.vector_store.swap_in(prev_dir, prev_dir)
+        print(f"已回滚到上一代索引，索引版本 {version}")
+        return True
     
     def get_document_count(self) -> int:
         """获取已索引的文档数量"""
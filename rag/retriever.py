@@ -1,59 +1,338 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import os
 import json
-from .vectorstore import VectorStore
+import time
+from .vectorstore import VectorStore, VectorSnapshot
+from .hierarchy import HierarchicalIndex
+from .context_packer import ContextPacker
+from utils import metrics
+from utils.tracing import span
+
+# 检索耗时（含查询嵌入），批量检索按整批计一次
+RETRIEVAL_DURATION = metrics.histogram("marktreechat_retrieval_duration_seconds",
+                                       "知识库检索耗时", ["mode", "kind"])
+RETRIEVAL_QUERIES = metrics.counter("marktreechat_retrieval_queries_total", "检索的查询数", ["mode"])
 
 class Retriever:
     """文档检索器，用于从向量数据库中检索相关文档"""
     
-    def __init__(self, vector_store: VectorStore):
+    def __init__(self, vector_store: VectorStore, mode: str = "flat", beam_width: int = 4):
         self.vector_store = vector_store
+        # 检索模式: flat 为全量检索，hierarchical 为按知识树由粗到细检索
+        self.mode = mode
+        self.beam_width = beam_width
+        self.hierarchy = HierarchicalIndex(vector_store)
+        # 图扩展：基于知识树和文档链接的个性化PageRank，graph_expand_k 为 0 时关闭
+        self.tree_builder = None
+        self.graph = None
+        self.graph_expand_k = 0
+        self.ppr_damping = 0.85
+        self.ppr_iterations = 10
+        # 自适应top-k：低于 min_score 或低于最高分 relative_cutoff 倍的结果被丢弃，None表示不限制
+        self.min_score = None
+        self.relative_cutoff = None
+        # 检索上下文的token预算
+        self.context_packer = ContextPacker()
+        
+    def attach_tree(self, tree_builder):
+        """关联知识树，启用图扩展"""
+        from tree_kb.graph import LinkGraph
+        self.tree_builder = tree_builder
+        self.graph = LinkGraph(tree_builder)
+        
+    def _resolve_scope(self, scope: Optional[List[str]], snapshot: VectorSnapshot):
+        """将知识树节点ID转换为层级索引中的节点，None表示不限范围
+        
+        目录和文件节点直接对应一段连续的文档块；标题节点按其所属文件处理。
+        """
+        if not scope or self.tree_builder is None:
+            return None
+        documents_dir = self.tree_builder.documents_dir
+        tree = self.tree_builder.get_tree()
+        
+        nodes = []
+        for node_id in scope:
+            if node_id == "root":
+                return None
+            data = tree.nodes[node_id] if tree.has_node(node_id) else {}
+            rel_path = data.get("file_path") if data.get("type") == "header" else data.get("path")
+            if not rel_path:
+                continue
+            node = self.hierarchy.node_for_path(os.path.join(documents_dir, rel_path), snapshot)
+            if node is not None:
+                nodes.append(node)
+        return nodes
         
-    def retrieve(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+    def _search(self, query_embedding, top_k: int, mode: str, snapshot: VectorSnapshot, scope_nodes=None):
+        """按指定模式在给定快照上执行向量检索"""
+        if mode == "hierarchical":
+            return self.hierarchy.search(query_embedding, top_k, beam_width=self.beam_width, roots=scope_nodes,
+                                         snapshot=snapshot)
+        if scope_nodes is not None:
+            return self.hierarchy.search_within(query_embedding, top_k, scope_nodes, snapshot)
+        return self.vector_store.similarity_search(query_embedding, top_k, snapshot=snapshot)
+        
+    def _apply_cutoffs(self, results: List[Tuple[str, float]]) -> Tuple[List[Tuple[str, float]], Dict[str, Any]]:
+        """按绝对阈值和相对最高分的比例过滤检索结果，使返回数量随查询自适应"""
+        info = {
+            "candidates": len(results),
+            "top_score": results[0][1] if results else None,
+            "below_min_score": 0,
+            "below_relative_cutoff": 0,
+        }
+        kept = results
+        if self.min_score is not None:
+            kept = [r for r in kept if r[1] >= self.min_score]
+            info["below_min_score"] = len(results) - len(kept)
+        if self.relative_cutoff is not None and kept:
+            floor = kept[0][1] * self.relative_cutoff
+            before = len(kept)
+            kept = [r for r in kept if r[1] >= floor]
+            info["below_relative_cutoff"] = before - len(kept)
+        info["kept"] = len(kept)
+        return kept, info
+    
+    def retrieve(self, query: str, top_k: int = 5, mode: Optional[str] = None,
+                 scope: Optional[List[str]] = None) -> List[Dict[str, Any]]:
         """检索与查询最相关的文档
         
         Args:
             query: 用户查询
             top_k: 返回的最大文档数量
+            mode: 检索模式，默认使用 self.mode
+            scope: 限定检索范围的知识树节点ID列表（目录、文件或标题），None表示全部
             
         Returns:
             相关文档列表，每个文档包含内容、路径、相关度分数等
         """
-        # 获取查询的向量表示
-        query_embedding = self.vector_store.get_embedding(query)
+        return self._retrieve(query, top_k, mode, scope)[0]
+    
+    def _retrieve(self, query: str, top_k: int, mode: Optional[str],
+                  scope: Optional[List[str]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """retrieve 的实现，额外返回自适应过滤的决策信息"""
+        mode = mode or self.mode
+        RETRIEVAL_QUERIES.inc(mode=mode)
+        with RETRIEVAL_DURATION.time(mode=mode, kind="single"):
+            # 获取查询的向量表示
+            with span("embed_query"):
+                query_embedding = self.vector_store.get_embedding(query)
+            
+            # 检索、补全文档内容和图扩展固定使用同一个快照，不受并发索引的影响
+            snapshot = self.vector_store.snapshot()
+            scope_nodes = self._resolve_scope(scope, snapshot)
+            if scope_nodes is not None and not scope_nodes:
+                return [], self._empty_info()
+            with span("similarity_search"):
+                results = self._search(query_embedding, top_k, mode, snapshot, scope_nodes)
+            with span("format_results"):
+                return self._format_results(results, query_embedding, snapshot, scope_nodes)
+    
+    def retrieve_batch(self, queries: List[str], top_k: int = 5, mode: Optional[str] = None,
+                       scope: Optional[List[str]] = None) -> List[List[Dict[str, Any]]]:
+        """批量检索多个查询
+        
+        所有查询一次批量编码；全量检索时用一次矩阵乘法同时为所有查询打分，
+        层级检索和限定范围的检索复用批量编码的结果逐个查询。
         
-        # 从向量数据库检索相似文档
-        results = self.vector_store.similarity_search(query_embedding, top_k)
+        Args:
+            queries: 查询列表
+            top_k: 每个查询返回的最大文档数量
+            mode: 检索模式，默认使用 self.mode
+            scope: 限定检索范围的知识树节点ID列表，对所有查询生效
+            
+        Returns:
+            每个查询的检索结果（格式同 retrieve），顺序与输入一致
+        """
+        return [results for results, _ in self._retrieve_batch(queries, top_k, mode, scope)]
+    
+    def _retrieve_batch(self, queries: List[str], top_k: int, mode: Optional[str],
+                        scope: Optional[List[str]]) -> List[Tuple[List[Dict[str, Any]], Dict[str, Any]]]:
+        """retrieve_batch 的实现，每个查询额外返回自适应过滤的决策信息"""
+        if not queries:
+            return []
+        mode = mode or self.mode
+        RETRIEVAL_QUERIES.inc(len(queries), mode=mode)
+        with RETRIEVAL_DURATION.time(mode=mode, kind="batch"):
+            snapshot = self.vector_store.snapshot()
+            scope_nodes = self._resolve_scope(scope, snapshot)
+            if scope_nodes is not None and not scope_nodes:
+                return [([], self._empty_info()) for _ in queries]
+            
+            with span("embed_query"):
+                query_embeddings = self.vector_store.get_embeddings(list(queries))
+            with span("similarity_search"):
+                if mode == "flat" and scope_nodes is None:
+                    batch = self.vector_store.similarity_search_batch(query_embeddings, top_k, snapshot=snapshot)
+                else:
+                    batch = [self._search(embedding, top_k, mode, snapshot, scope_nodes)
+                             for embedding in query_embeddings]
+            with span("format_results"):
+                return [self._format_results(results, embedding, snapshot, scope_nodes)
+                        for results, embedding in zip(batch, query_embeddings)]
+    
+    @staticmethod
+    def _empty_info() -> Dict[str, Any]:
+        return {"candidates": 0, "kept": 0, "top_score": None,
+                "below_min_score": 0, "below_relative_cutoff": 0}
+    
+    def _format_results(self, results: List[Tuple[str, float]], query_embedding, snapshot: VectorSnapshot,
+                        scope_nodes=None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """对 (文档ID, 分数) 结果应用自适应过滤、补全文档内容并沿知识图扩展"""
+        results, info = self._apply_cutoffs(results)
         
         # 格式化返回结果
         formatted_results = []
         for doc_id, score in results:
-            doc_data = self.vector_store.get_document(doc_id)
+            doc_data = snapshot.documents.get(doc_id)
             if doc_data:
                 formatted_results.append({
                     "content": doc_data["content"],
                     "metadata": doc_data["metadata"],
                     "score": float(score)
                 })
+        
+        # 沿知识图扩展检索结果
+        if self.graph is not None and self.graph_expand_k > 0 and formatted_results:
+            formatted_results.extend(self._expand_with_graph(formatted_results, query_embedding, snapshot,
+                                                             scope_nodes))
+        info["graph_expanded"] = sum(1 for r in formatted_results if r.get("via") == "graph")
                 
-        return formatted_results
+        return formatted_results, info
+    
+    def _expand_with_graph(self, results: List[Dict[str, Any]], query_embedding, snapshot: VectorSnapshot,
+                           scope_nodes=None) -> List[Dict[str, Any]]:
+        """以稠密检索命中的文件为种子运行个性化PageRank，补充关联文件中的最佳文档块"""
+        documents_dir = self.tree_builder.documents_dir
+        tree = self.tree_builder.get_tree()
+        
+        seeds = {}
+        seen_files = set()
+        for result in results:
+            source = result["metadata"].get("source")
+            if not source:
+                continue
+            rel_path = os.path.normpath(os.path.relpath(source, documents_dir))
+            seen_files.add(rel_path)
+            file_id = f"file:{rel_path}"
+            seeds[file_id] = seeds.get(file_id, 0.0) + max(result["score"], 0.0)
+        
+        ranked = self.graph.personalized_pagerank(seeds, damping=self.ppr_damping,
+                                                  iterations=self.ppr_iterations)
+        
+        # 将标题节点的得分汇总到所属文件
+        file_scores = {}
+        for node_id, score in ranked:
+            data = tree.nodes[node_id] if tree.has_node(node_id) else {}
+            if data.get("type") == "file":
+                rel_path = data.get("path")
+            elif data.get("type") == "header":
+                rel_path = data.get("file_path")
+            else:
+                continue
+            if rel_path and rel_path not in seen_files:
+                file_scores[rel_path] = file_scores.get(rel_path, 0.0) + score
+        
+        expanded = []
+        for rel_path, graph_score in sorted(file_scores.items(), key=lambda x: x[1], reverse=True):
+            node = self.hierarchy.node_for_path(os.path.join(documents_dir, rel_path), snapshot)
+            if node is None:
+                continue
+            # 限定范围时只扩展范围内的文件
+            if scope_nodes is not None and not any(s.start <= node.start and node.end <= s.end
+                                                   for s in scope_nodes):
+                continue
+            best = self.hierarchy.best_in_node(node, query_embedding, snapshot)
+            doc_data = snapshot.documents.get(best[0]) if best else None
+            if doc_data:
+                expanded.append({
+                    "content": doc_data["content"],
+                    "metadata": doc_data["metadata"],
+                    "score": best[1],
+                    "graph_score": graph_score,
+                    "via": "graph"
+                })
+            if len(expanded) >= self.graph_expand_k:
+                break
+        return expanded
+    
+    def build_context(self, query: str, top_k: int = 5, scope: Optional[List[str]] = None) -> Dict[str, Any]:
+        """检索并在token预算内组装上下文
+        
+        Args:
+            query: 用户查询
+            top_k: 返回的最大文档数量
+            scope: 限定检索范围的知识树节点ID列表，None表示全部
+            
+        Returns:
+            ContextPacker.pack 的结果，包含上下文文本和使用、跳过的token数；
+            retrieval 字段记录自适应过滤的决策，没有结果通过阈值时 skipped 为True且上下文为空
+        """
+        return self._pack(*self._retrieve(query, top_k, None, scope), top_k)
+    
+    def build_context_batch(self, queries: List[str], top_k: int = 5,
+                            scope: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """批量检索并组装上下文，结果与逐个调用 build_context 相同，顺序与输入一致"""
+        return [self._pack(results, info, top_k)
+                for results, info in self._retrieve_batch(queries, top_k, None, scope)]
     
-    def get_retrieval_context(self, query: str, top_k: int = 5) -> str:
+    def _pack(self, results: List[Dict[str, Any]], info: Dict[str, Any], top_k: int) -> Dict[str, Any]:
+        with span("pack_context"):
+            packed = self.context_packer.pack(results)
+        info["top_k"] = top_k
+        info["skipped"] = not results
+        packed["retrieval"] = info
+        return packed
+    
+    def get_retrieval_context(self, query: str, top_k: int = 5, scope: Optional[List[str]] = None) -> str:
         """获取检索上下文作为字符串
         
         Args:
             query: 用户查询
             top_k: 返回的最大文档数量
+            scope: 限定检索范围的知识树节点ID列表，None表示全部
             
         Returns:
             合并后的上下文字符串
         """
-        results = self.retrieve(query, top_k)
+        return self.build_context(query, top_k, scope=scope)["context"]
+    
+    def evaluate_recall(self, queries: List[str], top_k: int = 5) -> Dict[str, Any]:
+        """以全量检索为基准，评估层级检索的召回率和耗时
+        
+        Args:
+            queries: 评估用的查询列表
+            top_k: 每个查询返回的文档数量
+            
+        Returns:
+            包含平均召回率和两种模式平均耗时（毫秒）的字典
+        """
+        # 先构建层级索引，避免把构建时间计入检索耗时
+        snapshot = self.vector_store.snapshot()
+        self.hierarchy.ensure_current(snapshot)
         
-        # 构建上下文
-        context_parts = []
-        for i, result in enumerate(results, 1):
-            source = result["metadata"].get("source", "未知来源")
-            context_parts.append(f"[文档 {i} (来源: {source})]\n{result['content']}\n")
+        recalls = []
+        flat_time = 0.0
+        hier_time = 0.0
+        for query_embedding in self.vector_store.get_embeddings(list(queries)):
+            start = time.perf_counter()
+            exact = self._search(query_embedding, top_k, "flat", snapshot)
+            flat_time += time.perf_counter() - start
+            
+            start = time.perf_counter()
+            approx = self._search(query_embedding, top_k, "hierarchical", snapshot)
+            hier_time += time.perf_counter() - start
+            
+            if exact:
+                exact_ids = {doc_id for doc_id, _ in exact}
+                approx_ids = {doc_id for doc_id, _ in approx}
+                recalls.append(len(exact_ids & approx_ids) / len(exact_ids))
         
-        return "\n".join(context_parts)
\ No newline at end of file
+        n = max(len(queries), 1)
+        return {
+            "queries": len(queries),
+            "top_k": top_k,
+            "beam_width": self.beam_width,
+            "recall": sum(recalls) / len(recalls) if recalls else 0.0,
+            "flat_ms": flat_time * 1000 / n,
+            "hierarchical_ms": hier_time * 1000 / n
+        }
@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple
+from .vectorstore import VectorStore
+
+
+class SemanticCache:
+    """语义回答缓存：问题的近义改写可以直接复用之前的回答
+
+    使用知识库的嵌入模型对问题编码，在一个独立的小型向量索引中查找相似的历史问题。
+    只有相似度超过阈值、上下文键（系统提示词、检索设置）相同且生成时的知识库版本与
+    当前版本一致的条目才会命中；知识库版本变化后旧条目被整体清除。
+    """
+
+    def __init__(self, vector_store: VectorStore, path: str, threshold: float = 0.92,
+                 max_entries: int = 500, ttl: float = 7 * 24 * 3600):
+        """
+        Args:
+            vector_store: 提供嵌入模型和知识库版本的向量存储
+            path: 缓存持久化文件路径（JSON）
+            threshold: 命中所需的最低余弦相似度
+            max_entries: 最大条目数，超出时淘汰最久未使用的条目
+            ttl: 条目存活时间（秒），小于等于0表示不过期
+        """
+        self.vector_store = vector_store
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = []        # 每个条目: query, answer, context_key, kb_version, created, last_used, hits
+        self.matrix = np.zeros((0, 0), dtype=np.float32)  # 条目问题的归一化嵌入，行与 entries 对应
+        self.lookups = 0
+        self.hits = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    @staticmethod
+    def context_key(system_prompt: str = "", **settings) -> str:
+        """影响回答内容的上下文（系统提示词、检索设置和模型设置）的摘要"""
+        raw = json.dumps({"system": system_prompt or "", **settings}, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            entries = data.get("entries", [])
+            embeddings = data.get("embeddings", [])
+            if len(entries) == len(embeddings) and entries:
+                self.entries = entries
+                self.matrix = np.array(embeddings, dtype=np.float32)
+        except Exception as e:
+            print(f"加载语义缓存失败: {e}")
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"entries": self.entries, "embeddings": self.matrix.tolist()}, f, ensure_ascii=False)
+
+    def _drop(self, keep: List[int]):
+        """只保留给定下标的条目"""
+        self.entries = [self.entries[i] for i in keep]
+        self.matrix = self.matrix[keep] if keep else np.zeros((0, 0), dtype=np.float32)
+
+    def _invalidate(self, now: float) -> bool:
+        """清除知识库版本过期和超过存活时间的条目，返回是否有变化"""
+        version = self.vector_store.version
+        keep = [i for i, entry in enumerate(self.entries)
+                if entry["kb_version"] == version and (self.ttl <= 0 or now - entry["created"] <= self.ttl)]
+        if len(keep) == len(self.entries):
+            return False
+        self.invalidations += len(self.entries) - len(keep)
+        self._drop(keep)
+        return True
+
+    def embed(self, query: str) -> np.ndarray:
+        """用知识库的嵌入模型对问题编码并归一化"""
+        embedding = np.asarray(self.vector_store.get_embedding(query), dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm > 0 else embedding
+
+    def lookup(self, query: str, context_key: str,
+               embedding: Optional[np.ndarray] = None) -> Optional[Tuple[str, float]]:
+        """查找语义相近的已缓存回答
+
+        Args:
+            query: 用户问题
+            context_key: context_key() 的结果
+            embedding: 已计算好的归一化问题嵌入，为None时现场计算
+
+        Returns:
+            (缓存的回答, 相似度)，未命中时返回None
+        """
+        if embedding is None:
+            embedding = self.embed(query)
+        now = time.time()
+        with self._lock:
+            self.lookups += 1
+            if self._invalidate(now):
+                self._save()
+            if not self.entries or self.matrix.shape[1] != embedding.shape[0]:
+                return None
+
+            scores = self.matrix @ embedding
+            # 上下文不同的条目不参与比较
+            for i, entry in enumerate(self.entries):
+                if entry["context_key"] != context_key:
+                    scores[i] = -1.0
+            best = int(np.argmax(scores))
+            score = float(scores[best])
+            if score < self.threshold:
+                return None
+
+            entry = self.entries[best]
+            entry["last_used"] = now
+            entry["hits"] += 1
+            self.hits += 1
+            return entry["answer"], score
+
+    def add(self, query: str, answer: str, context_key: str,
+            embedding: Optional[np.ndarray] = None, kb_version: Optional[int] = None):
+        """缓存一次问答
+
+        Args:
+            query: 用户问题
+            answer: 模型回答
+            context_key: context_key() 的结果
+            embedding: 已计算好的归一化问题嵌入
+            kb_version: 生成回答时的知识库版本，默认为当前版本；回答期间知识库已更新时不缓存
+        """
+        if not answer:
+            return
+        if embedding is None:
+            embedding = self.embed(query)
+        now = time.time()
+        with self._lock:
+            version = self.vector_store.version
+            if kb_version is not None and kb_version != version:
+                return
+            self._invalidate(now)
+            if self.entries and self.matrix.shape[1] != embedding.shape[0]:
+                # 嵌入模型更换后维度不同，旧条目无法比较
+                self._drop([])
+
+            self.entries.append({
+                "query": query,
+                "answer": answer,
+                "context_key": context_key,
+                "kb_version": version,
+                "created": now,
+                "last_used": now,
+                "hits": 0,
+            })
+            row = embedding.astype(np.float32)[None, :]
+            self.matrix = row if self.matrix.size == 0 else np.vstack([self.matrix, row])
+
+            # 超出容量时淘汰最久未使用的条目
+            if len(self.entries) > self.max_entries:
+                order = sorted(range(len(self.entries)), key=lambda i: self.entries[i]["last_used"])
+                keep = sorted(order[len(self.entries) - self.max_entries:])
+                self._drop(keep)
+            self._save()
+
+    def clear(self):
+        with self._lock:
+            self._drop([])
+            self._save()
+
+    def stats(self) -> Dict[str, Any]:
+        """命中率等统计信息"""
+        return {
+            "entries": len(self.entries),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            "invalidated": self.invalidations,
+            "kb_version": self.vector_store.version,
+        }
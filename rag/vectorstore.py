@@ -1,53 +1,247 @@
 import os
 import json
+import time
+import shutil
+import threading
 import numpy as np
+from contextlib import contextmanager
 from typing import List, Dict, Any, Tuple, Optional
-import openai
+
+from utils import metrics
+
+# 嵌入模型加载一次后在进程内复用（加载SentenceTransformer需要数秒到数十秒）
+_embedding_models = {}
+_embedding_lock = threading.Lock()
+
+# 嵌入计算的监控指标：文本数的增长率即嵌入吞吐量
+EMBEDDING_TEXTS = metrics.counter("marktreechat_embedding_texts_total", "已计算嵌入的文本数")
+EMBEDDING_DURATION = metrics.histogram("marktreechat_embedding_duration_seconds",
+                                       "每次调用嵌入模型的耗时（批量调用计一次）")
+EMBEDDING_ERRORS = metrics.counter("marktreechat_embedding_errors_total", "嵌入模型调用失败次数")
+
+
+@contextmanager
+def _observe_embedding(count: int):
+    """记录一次嵌入调用的文本数、耗时和失败"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        EMBEDDING_ERRORS.inc()
+        raise
+    EMBEDDING_DURATION.observe(time.perf_counter() - start)
+    EMBEDDING_TEXTS.inc(count)
+
+
+def _load_sentence_transformer(name: str):
+    model = _embedding_models.get(name)
+    if model is None:
+        with _embedding_lock:
+            model = _embedding_models.get(name)
+            if model is None:
+                from sentence_transformers import SentenceTransformer
+                model = SentenceTransformer(name)
+                _embedding_models[name] = model
+    return model
+
+
+def _load_openai_client():
+    client = _embedding_models.get("openai")
+    if client is None:
+        with _embedding_lock:
+            client = _embedding_models.get("openai")
+            if client is None:
+                import openai
+                client = openai.OpenAI()
+                _embedding_models["openai"] = client
+    return client
+
+
+class VectorSnapshot:
+    """向量存储在某个版本上的不可变快照
+
+    发布后 documents 和 embeddings 不再修改；读者持有快照即可在写入进行时
+    安全地遍历和检索。归一化矩阵在第一次使用时计算并随快照缓存。
+    """
+
+    __slots__ = ("version", "documents", "embeddings", "_matrix")
+
+    def __init__(self, version: int, documents: Dict[str, Dict[str, Any]], embeddings: Dict[str, np.ndarray]):
+        self.version = version
+        self.documents = documents
+        self.embeddings = embeddings
+        self._matrix = None
+
+    def matrix(self) -> Tuple[List[str], np.ndarray]:
+        """(文档ID列表, 按行归一化的嵌入矩阵)"""
+        cached = self._matrix
+        if cached is not None:
+            return cached
+
+        doc_ids = list(self.embeddings.keys())
+        if doc_ids:
+            matrix = np.stack([self.embeddings[doc_id] for doc_id in doc_ids]).astype(np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix = np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+
+        # 并发的读者可能重复计算一次，结果相同，无需加锁
+        self._matrix = (doc_ids, matrix)
+        return self._matrix
+
 
 class VectorStore:
-    """向量数据库，用于存储和检索文档嵌入"""
+    """向量数据库，用于存储和检索文档嵌入
+
+    采用写时复制：写入者在写锁内基于当前快照构造新的 documents / embeddings，
+    再一次性发布新快照；检索只读取发布时的快照，不加锁，因此不会被长时间的
+    索引任务阻塞，也不会看到写了一半的状态。
+    """
     
     def __init__(self, embedding_model: str, vector_dir: str):
         self.embedding_model = embedding_model
         self.vector_dir = vector_dir
-        self.documents = {}  # 文档内容
-        self.embeddings = {}  # 文档嵌入
+        self._snapshot = VectorSnapshot(0, {}, {})
+        # 串行化写入者（读者不需要）
+        self._write_lock = threading.RLock()
+        # 为False时写入只更新内存快照，需显式调用 save()（用于批量重建）
+        self.autosave = True
         
+        # 上次切换目录中途中断时，恢复原来的目录
+        swap_dir = vector_dir.rstrip("/\\") + ".swap"
+        if not os.path.exists(vector_dir) and os.path.exists(swap_dir):
+            os.rename(swap_dir, vector_dir)
+
         # 确保向量目录存在
         os.makedirs(vector_dir, exist_ok=True)
         
         # 加载已有的向量和文档
         self._load_from_disk()
+
+    @property
+    def documents(self) -> Dict[str, Dict[str, Any]]:
+        """当前快照的文档内容（只读）"""
+        return self._snapshot.documents
+
+    @property
+    def embeddings(self) -> Dict[str, np.ndarray]:
+        """当前快照的文档嵌入（只读）"""
+        return self._snapshot.embeddings
+
+    @property
+    def version(self) -> int:
+        """索引版本，每次增删文档后递增"""
+        return self._snapshot.version
+
+    def sibling(self, vector_dir: str) -> "VectorStore":
+        """在另一个目录创建使用相同嵌入模型的向量存储（用于影子重建）"""
+        return type(self)(self.embedding_model, vector_dir)
+
+    def snapshot(self) -> VectorSnapshot:
+        """获取当前快照，在一次检索中固定使用同一版本"""
+        return self._snapshot
+
+    def _publish(self, documents: Dict[str, Dict[str, Any]], embeddings: Dict[str, np.ndarray]):
+        """发布新快照并保存到磁盘（调用方须持有写锁）"""
+        self._snapshot = VectorSnapshot(self._snapshot.version + 1, documents, embeddings)
+        if self.autosave:
+            self._save_to_disk()
+
+    def save(self):
+        """把当前快照写入磁盘"""
+        with self._write_lock:
+            self._save_to_disk()
         
     def _load_from_disk(self):
         """从磁盘加载向量和文档"""
+        self._snapshot = self.read_snapshot(self.vector_dir)
+
+    @staticmethod
+    def read_snapshot(vector_dir: str) -> VectorSnapshot:
+        """从向量目录读取快照，不影响当前存储"""
+        documents = {}
+        embeddings = {}
+        version = 0
+
         # 加载文档内容
-        docs_path = os.path.join(self.vector_dir, "documents.json")
+        docs_path = os.path.join(vector_dir, "documents.json")
         if os.path.exists(docs_path):
             with open(docs_path, 'r', encoding='utf-8') as f:
-                self.documents = json.load(f)
+                documents = json.load(f)
         
         # 加载向量嵌入
-        embeddings_path = os.path.join(self.vector_dir, "embeddings.json")
+        embeddings_path = os.path.join(vector_dir, "embeddings.json")
         if os.path.exists(embeddings_path):
             with open(embeddings_path, 'r', encoding='utf-8') as f:
                 embeddings_dict = json.load(f)
                 # 将字符串列表转换回数值数组
                 for doc_id, embedding_list in embeddings_dict.items():
-                    self.embeddings[doc_id] = np.array(embedding_list, dtype=np.float32)
+                    embeddings[doc_id] = np.array(embedding_list, dtype=np.float32)
+
+        # 加载索引版本
+        meta_path = os.path.join(vector_dir, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                version = json.load(f).get("version", 0)
+
+        return VectorSnapshot(version, documents, embeddings)
     
     def _save_to_disk(self):
-        """将向量和文档保存到磁盘"""
+        """将当前快照的向量和文档保存到磁盘"""
+        snapshot = self._snapshot
+
         # 保存文档内容
         docs_path = os.path.join(self.vector_dir, "documents.json")
         with open(docs_path, 'w', encoding='utf-8') as f:
-            json.dump(self.documents, f, ensure_ascii=False, indent=2)
+            json.dump(snapshot.documents, f, ensure_ascii=False, indent=2)
         
         # 保存向量嵌入（转换为普通列表以便JSON序列化）
-        embeddings_dict = {doc_id: embedding.tolist() for doc_id, embedding in self.embeddings.items()}
+        embeddings_dict = {doc_id: embedding.tolist() for doc_id, embedding in snapshot.embeddings.items()}
         embeddings_path = os.path.join(self.vector_dir, "embeddings.json")
         with open(embeddings_path, 'w', encoding='utf-8') as f:
             json.dump(embeddings_dict, f)
+
+        self._save_meta()
+
+    def _save_meta(self):
+        """保存索引版本"""
+        meta_path = os.path.join(self.vector_dir, "meta.json")
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": self._snapshot.version}, f)
+
+    def swap_in(self, source_dir: str, keep_dir: str, snapshot: Optional[VectorSnapshot] = None) -> int:
+        """用另一个向量目录整体替换当前索引
+
+        内存中的快照一次性切换，检索不会看到空索引；磁盘上当前目录改名为 keep_dir 保留，
+        source_dir 改名为 vector_dir。keep_dir 与 source_dir 相同时相当于两者互换（用于回滚）。
+
+        Args:
+            source_dir: 新索引所在目录
+            keep_dir: 保留当前索引的目录，已存在时被覆盖
+            snapshot: 已从 source_dir 读取的快照，为None时重新读取
+
+        Returns:
+            切换后的索引版本
+        """
+        if snapshot is None:
+            snapshot = self.read_snapshot(source_dir)
+        with self._write_lock:
+            # 版本号保持单调递增，依赖版本失效的缓存才能正确工作
+            version = max(self._snapshot.version, snapshot.version) + 1
+
+            swap_dir = self.vector_dir.rstrip("/\\") + ".swap"
+            if os.path.exists(swap_dir):
+                shutil.rmtree(swap_dir)
+            os.rename(self.vector_dir, swap_dir)
+            os.rename(source_dir, self.vector_dir)
+            if os.path.exists(keep_dir):
+                shutil.rmtree(keep_dir)
+            os.rename(swap_dir, keep_dir)
+
+            self._snapshot = VectorSnapshot(version, snapshot.documents, snapshot.embeddings)
+            self._save_meta()
+            return version
     
     # def get_embedding(self, text: str) -> np.ndarray:
     #     """获取文本的嵌入向量"""
@@ -58,61 +252,173 @@ class VectorStore:
     #     return np.array(response['data'][0]['embedding'], dtype=np.float32)
     def get_embedding(self, text: str) -> np.ndarray:
         """获取文本的嵌入向量"""
+        with _observe_embedding(1):
+            if self.embedding_model.startswith("sentence-transformers/"):
+                model = _load_sentence_transformer(self.embedding_model)
+                embedding = model.encode(text)
+                # 转换为numpy数组
+                return np.array(embedding, dtype=np.float32)
+            else:
+                # 原有的OpenAI逻辑，但使用新版API
+                client = _load_openai_client()
+                embeddings = client.embeddings.create(input=[text], model=self.embedding_model)
+                return np.array(embeddings.data[0].embedding, dtype=np.float32)
+
+    def get_embeddings(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        """批量获取文本的嵌入向量
+
+        Args:
+            texts: 文本列表
+            batch_size: 每次送入嵌入模型的文本数
+
+        Returns:
+            形状为 [文本数, 维度] 的矩阵，行与 texts 一一对应
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
         if self.embedding_model.startswith("sentence-transformers/"):
-            from sentence_transformers import SentenceTransformer
-            model = SentenceTransformer(self.embedding_model)
-            embedding = model.encode(text)
-            # 转换为numpy数组
-            return np.array(embedding, dtype=np.float32)
-        else:
-            # 原有的OpenAI逻辑，但使用新版API
-            import openai
-            client = openai.OpenAI()
-            embeddings = client.embeddings.create(input=[text], model=self.embedding_model)
-            return np.array(embeddings.data[0].embedding, dtype=np.float32)
+            model = _load_sentence_transformer(self.embedding_model)
+            with _observe_embedding(len(texts)):
+                return np.asarray(model.encode(list(texts), batch_size=batch_size), dtype=np.float32)
+
+        client = _load_openai_client()
+        rows = []
+        for start in range(0, len(texts), batch_size):
+            batch = list(texts[start:start + batch_size])
+            with _observe_embedding(len(batch)):
+                response = client.embeddings.create(input=batch, model=self.embedding_model)
+            # 按 index 排序，保证与输入顺序一致
+            rows.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+        return np.array(rows, dtype=np.float32)
+
+    def warm_up(self):
+        """提前加载嵌入模型并完成一次编码，避免第一个请求承担加载耗时"""
+        self.get_embedding("warm up")
 
     def add_document(self, doc_id: str, content: str, metadata: Dict[str, Any]):
         """添加文档到向量数据库"""
-        # 存储文档内容和元数据
-        self.documents[doc_id] = {
-            "content": content,
-            "metadata": metadata
-        }
-        
-        # 获取并存储文档的嵌入向量
-        self.embeddings[doc_id] = self.get_embedding(content)
-        
-        # 保存到磁盘
-        self._save_to_disk()
+        self.add_documents([(doc_id, content, metadata)])
+
+    def add_documents(self, items: List[Tuple[str, str, Dict[str, Any]]]):
+        """批量添加文档，只发布一次新快照、写一次磁盘
+
+        Args:
+            items: (文档ID, 内容, 元数据) 列表
+        """
+        if not items:
+            return
+        # 嵌入计算耗时较长，在写锁之外批量完成
+        vectors = self.get_embeddings([content for _, content, _ in items])
+        embedded = [(doc_id, content, metadata, vectors[i])
+                    for i, (doc_id, content, metadata) in enumerate(items)]
+
+        with self._write_lock:
+            documents = dict(self._snapshot.documents)
+            embeddings = dict(self._snapshot.embeddings)
+            for doc_id, content, metadata, embedding in embedded:
+                # 存储文档内容和元数据
+                documents[doc_id] = {
+                    "content": content,
+                    "metadata": metadata
+                }
+                embeddings[doc_id] = embedding
+            self._publish(documents, embeddings)
     
     def get_document(self, doc_id: str) -> Optional[Dict[str, Any]]:
         """获取文档内容"""
-        return self.documents.get(doc_id)
+        return self._snapshot.documents.get(doc_id)
     
     def delete_document(self, doc_id: str) -> bool:
         """删除文档"""
-        if doc_id in self.documents:
-            del self.documents[doc_id]
-            del self.embeddings[doc_id]
-            self._save_to_disk()
-            return True
-        return False
+        return self.delete_documents([doc_id]) > 0
+
+    def delete_documents(self, doc_ids: List[str]) -> int:
+        """批量删除文档，返回实际删除的数量"""
+        with self._write_lock:
+            documents = dict(self._snapshot.documents)
+            embeddings = dict(self._snapshot.embeddings)
+            removed = 0
+            for doc_id in doc_ids:
+                if doc_id in documents:
+                    del documents[doc_id]
+                    embeddings.pop(doc_id, None)
+                    removed += 1
+            if removed:
+                self._publish(documents, embeddings)
+            return removed
+
+    def clear(self):
+        """清空全部文档"""
+        with self._write_lock:
+            self._publish({}, {})
     
-    def similarity_search(self, query_embedding: np.ndarray, top_k: int = 5) -> List[Tuple[str, float]]:
-        """基于余弦相似度搜索最相似的文档"""
+    def get_matrix(self) -> Tuple[List[str], np.ndarray]:
+        """获取按行归一化的嵌入矩阵
+
+        结果随快照缓存，文档未变化时直接复用。零向量对应的行保持为零。
+
+        Returns:
+            (文档ID列表, 形状为 [文档数, 维度] 的矩阵)
+        """
+        return self._snapshot.matrix()
+
+    def similarity_search(self, query_embedding: np.ndarray, top_k: int = 5,
+                          snapshot: Optional[VectorSnapshot] = None) -> List[Tuple[str, float]]:
+        """基于余弦相似度搜索最相似的文档，snapshot 指定检索的快照，默认为当前快照"""
+        doc_ids, matrix = (snapshot or self._snapshot).matrix()
+        query_norm = np.linalg.norm(query_embedding)
+        if not doc_ids or query_norm == 0 or top_k <= 0:
+            return []
+
+        # 一次矩阵向量乘法计算所有文档的余弦相似度
+        scores = matrix @ (query_embedding.astype(np.float32) / query_norm)
+
+        # 只对前top_k个候选排序
+        k = min(top_k, len(doc_ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(doc_ids[i], float(scores[i])) for i in top]
+
+    def similarity_search_batch(self, query_embeddings: np.ndarray, top_k: int = 5,
+                                max_block_bytes: int = 64 * 1024 * 1024,
+                                snapshot: Optional[VectorSnapshot] = None) -> List[List[Tuple[str, float]]]:
+        """一次矩阵乘法为多个查询计算余弦相似度并各自取前top_k个
+
+        Args:
+            query_embeddings: 形状为 [查询数, 维度] 的查询嵌入矩阵
+            top_k: 每个查询返回的文档数量
+            max_block_bytes: 每块得分矩阵的大小上限，查询很多时分块计算以限制内存
+            snapshot: 检索的快照，默认为当前快照
+
+        Returns:
+            每个查询的 (文档ID, 相似度) 列表，顺序与输入一致
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        doc_ids, matrix = (snapshot or self._snapshot).matrix()
+        if not doc_ids or top_k <= 0:
+            return [[] for _ in range(len(queries))]
+
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = np.divide(queries, norms, out=np.zeros_like(queries), where=norms > 0)
+        k = min(top_k, len(doc_ids))
+        block = max(1, max_block_bytes // (len(doc_ids) * 4))
+
         results = []
-        
-        # 计算每个文档与查询的余弦相似度
-        for doc_id, doc_embedding in self.embeddings.items():
-            # 归一化向量
-            query_norm = np.linalg.norm(query_embedding)
-            doc_norm = np.linalg.norm(doc_embedding)
-            
-            # 计算余弦相似度
-            if query_norm > 0 and doc_norm > 0:
-                similarity = np.dot(query_embedding, doc_embedding) / (query_norm * doc_norm)
-                results.append((doc_id, similarity))
-        
-        # 按相似度降序排序并返回top_k个结果
-        results.sort(key=lambda x: x[1], reverse=True)
-        return results[:top_k]
\ No newline at end of file
+        for start in range(0, len(queries), block):
+            # [块内查询数, 文档数] 的得分矩阵
+            scores = queries[start:start + block] @ matrix.T
+            # 每行先用 argpartition 选出前k个候选，再只对候选排序
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+            for row, query_norm in enumerate(norms[start:start + block, 0]):
+                if query_norm == 0:
+                    # 与单查询检索一致，零向量查询没有结果
+                    results.append([])
+                    continue
+                results.append([(doc_ids[i], float(score)) for i, score in zip(top[row], top_scores[row])])
+        return results
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# 以 python -m service 运行时保证能导入项目根目录下的各个包
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from service.cli import main
+
+sys.exit(main())
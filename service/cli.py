@@ -0,0 +1,263 @@
+"""无界面的命令行入口
+
+用法:
+    python -m service index [--dir DIR] [--full]
+    python -m service query "问题" | --file queries.txt [--top-k 5] [--json]
+    python -m service chat "问题" | --file questions.jsonl [--concurrency 4] [--output answers.jsonl]
+    python -m service chat            # 不带问题时进入交互式多轮对话
+    python -m service serve [--host 127.0.0.1] [--port 7861]
+
+批量文件每行一个问题：纯文本，或包含 message（或 query）字段的JSON对象，
+其余字段（id、system_prompt、top_k 等）原样用作该问题的参数。
+"""
+import sys
+import json
+import contextlib
+import time
+import asyncio
+import argparse
+from typing import Dict, Any, List, Iterator
+
+import yaml
+
+from .core import ChatService, ChatSession, start_background_warmup
+
+# 批量文件中每个问题可以覆盖的对话参数
+_CHAT_OPTIONS = ("system_prompt", "use_rag", "top_k", "temperature", "scope")
+
+
+def load_config(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+def read_batch(path: str) -> Iterator[Dict[str, Any]]:
+    """逐行读取批量问题文件，跳过空行"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                item = json.loads(line)
+                item["message"] = item.get("message", item.get("query", ""))
+            else:
+                item = {"message": line}
+            item.setdefault("id", line_no)
+            yield item
+
+
+def write_line(out, record: Dict[str, Any]):
+    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    out.flush()
+
+
+def cmd_index(service: ChatService, args) -> int:
+    start = time.perf_counter()
+    indexed = service.index(args.dir, full=args.full)
+    chunks = sum(len(ids) for ids in indexed.values())
+    print(f"索引完成: {len(indexed)} 个文件，{chunks} 个文档块，耗时 {time.perf_counter() - start:.1f} 秒，"
+          f"知识库版本 {service.vector_store.version}", file=args.out)
+    return 0
+
+
+def cmd_query(service: ChatService, args) -> int:
+    items = list(read_batch(args.file)) if args.file else [{"id": 1, "message": args.text}]
+    as_json = args.json or bool(args.file)
+
+    # 检索参数相同的问题分组批量检索（一次编码、一次矩阵乘法），输出仍按输入顺序
+    packed_by_index = {}
+    for start in range(0, len(items), args.batch_size):
+        groups = {}
+        for i in range(start, min(start + args.batch_size, len(items))):
+            item = items[i]
+            key = (int(item.get("top_k", args.top_k)), tuple(item.get("scope") or args.scope or ()))
+            groups.setdefault(key, []).append(i)
+        for (top_k, scope), indices in groups.items():
+            packed_list = service.build_context_batch([items[i]["message"] for i in indices],
+                                                      top_k=top_k, scope=list(scope))
+            packed_by_index.update(zip(indices, packed_list))
+
+        for i in range(start, min(start + args.batch_size, len(items))):
+            item, packed = items[i], packed_by_index.pop(i)
+            if as_json:
+                write_line(args.out, {
+                    "id": item["id"],
+                    "query": item["message"],
+                    "context": packed["context"],
+                    "sources": packed["sources"],
+                    "used_tokens": packed["used_tokens"],
+                    "retrieval": packed["retrieval"],
+                })
+            else:
+                print(packed["context"] or "没有相关文档通过阈值", file=args.out)
+                print(f"\n来源: {', '.join(packed['sources']) or '无'}；上下文 {packed['used_tokens']} tokens", file=args.out)
+    return 0
+
+
+def _chat_kwargs(args, item: Dict[str, Any] = None) -> Dict[str, Any]:
+    kwargs = {
+        "system_prompt": args.system,
+        "use_rag": not args.no_rag,
+        "top_k": args.top_k,
+        "temperature": args.temperature,
+        "scope": args.scope,
+    }
+    for key in _CHAT_OPTIONS:
+        if item and key in item:
+            kwargs[key] = item[key]
+    return kwargs
+
+
+async def _stream_reply(service: ChatService, out, message: str, history: List, session: ChatSession,
+                       kwargs: Dict[str, Any]) -> str:
+    """把一轮回复流式写到 out，返回完整回复"""
+    reply = ""
+    async for event in service.stream_chat(message, history, session=session, **kwargs):
+        if event["type"] == "delta":
+            out.write(event["text"])
+            out.flush()
+        elif event["type"] == "done":
+            if not reply and event["reply"] and "semantic_cache_hit" in event["retrieval"]:
+                # 语义缓存命中时没有流式片段，直接输出完整回复
+                out.write(event["reply"])
+            reply = event["reply"]
+    out.write("\n")
+    out.flush()
+    return reply
+
+
+async def _chat_batch(service: ChatService, args) -> int:
+    """并发处理批量问题，每完成一个就写出一行JSON"""
+    semaphore = asyncio.Semaphore(max(1, args.concurrency))
+    out = open(args.output, "w", encoding="utf-8") if args.output else args.out
+    failures = 0
+
+    async def run(item):
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                result = await service.chat(item["message"], **_chat_kwargs(args, item))
+                record = {"id": item["id"], "message": item["message"], **result}
+            except Exception as e:
+                failures += 1
+                record = {"id": item["id"], "message": item["message"], "error": str(e)}
+            record["seconds"] = round(time.perf_counter() - start, 3)
+            write_line(out, record)
+
+    try:
+        await asyncio.gather(*(run(item) for item in read_batch(args.file)))
+    finally:
+        if out is not args.out:
+            out.close()
+    return 1 if failures else 0
+
+
+async def _chat_interactive(service: ChatService, args) -> int:
+    """交互式多轮对话，空行或 Ctrl+D 退出"""
+    history = []
+    session = ChatSession()
+    kwargs = _chat_kwargs(args)
+    while True:
+        try:
+            args.out.write("用户> ")
+            args.out.flush()
+            message = await asyncio.to_thread(input)
+        except EOFError:
+            break
+        if not message.strip():
+            break
+        args.out.write("助手> ")
+        reply = await _stream_reply(service, args.out, message, history, session, kwargs)
+        history.append((message, reply))
+    return 0
+
+
+async def _cmd_chat(service: ChatService, args) -> int:
+    if args.file:
+        return await _chat_batch(service, args)
+    if args.text:
+        await _stream_reply(service, args.out, args.text, [], ChatSession(), _chat_kwargs(args))
+        return 0
+    return await _chat_interactive(service, args)
+
+
+def cmd_chat(service: ChatService, args) -> int:
+    return asyncio.run(_cmd_chat(service, args))
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m service", description="MarkTreeChat 无界面服务")
+    parser.add_argument("--config", default="config.yaml", help="配置文件路径")
+    parser.add_argument("--catch-up", action="store_true",
+                        help="执行前按配置自动索引新文档并重建知识树（serve 总是在后台执行）")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    index = commands.add_parser("index", help="索引文档目录")
+    index.add_argument("--dir", default=None, help="文档目录，默认为配置中的 documents_dir")
+    index.add_argument("--full", action="store_true", help="完整重建索引和知识树")
+
+    def add_retrieval_options(sub):
+        sub.add_argument("--top-k", type=int, default=5, help="检索文档数量上限")
+        sub.add_argument("--scope", nargs="*", default=None, help="限定检索范围的知识树节点ID")
+        sub.add_argument("--file", default=None, help="批量问题文件，每行一个问题")
+
+    query = commands.add_parser("query", help="只检索，输出组装好的上下文")
+    query.add_argument("text", nargs="?", default=None, help="问题")
+    add_retrieval_options(query)
+    query.add_argument("--json", action="store_true", help="以JSON行输出（批量时总是如此）")
+    query.add_argument("--batch-size", type=int, default=64, help="批量模式下一次编码和检索的问题数")
+
+    chat = commands.add_parser("chat", help="检索增强对话，流式输出回复")
+    chat.add_argument("text", nargs="?", default=None, help="问题，省略时进入交互模式")
+    add_retrieval_options(chat)
+    chat.add_argument("--system", default="", help="系统提示词")
+    chat.add_argument("--no-rag", action="store_true", help="不检索知识库")
+    chat.add_argument("--temperature", type=float, default=0.7, help="生成温度")
+    chat.add_argument("--concurrency", type=int, default=4, help="批量模式下同时进行的对话数")
+    chat.add_argument("--output", default=None, help="批量模式的输出文件，默认输出到标准输出")
+
+    serve = commands.add_parser("serve", help="启动JSON HTTP服务")
+    serve.add_argument("--host", default=None, help="监听地址，默认读取配置 service.host")
+    serve.add_argument("--port", type=int, default=None, help="监听端口，默认读取配置 service.port")
+    return parser
+
+
+def main(argv: List[str] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.command == "query" and not (args.text or args.file):
+        print("请提供问题或 --file", file=sys.stderr)
+        return 2
+
+    # 结果写到标准输出，各组件的运行日志转到标准错误，便于管道处理
+    args.out = sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        return _run(args)
+
+
+def _run(args) -> int:
+    config = load_config(args.config)
+    service = ChatService.from_config(config)
+
+    if args.command == "serve":
+        from .http_server import serve
+        service_config = config.get("service", {})
+        # 与图形界面一样，服务立即开始监听，嵌入模型和索引追赶在后台进行
+        start_background_warmup(config, service.kb)
+        serve(
+            service,
+            host=args.host or service_config.get("host", "127.0.0.1"),
+            port=args.port or int(service_config.get("port", 7861)),
+            max_sessions=int(service_config.get("max_sessions", 1000))
+        )
+        return 0
+
+    # 命令行任务需要嵌入模型，等待预热完成后再执行
+    if args.command != "index" and not getattr(args, "no_rag", False):
+        start_background_warmup(config, service.kb, catch_up=args.catch_up).join()
+    elif args.catch_up:
+        start_background_warmup(config, service.kb).join()
+
+    commands = {"index": cmd_index, "query": cmd_query, "chat": cmd_chat}
+    return commands[args.command](service, args)
@@ -0,0 +1,485 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, List, Any, Optional, AsyncIterator, Tuple
+
+from utils import metrics, tracing
+from utils.startup import StartupStatus, FAILED
+from models.cache import CACHE_LOOKUPS
+
+log = logging.getLogger(__name__)
+
+# 注入检索上下文和LaTeX渲染要求的系统提示
+CONTEXT_PROMPT = "以下是与用户问题相关的参考信息，请在回答时使用这些信息：\n"
+LATEX_PROMPT = "在回答涉及数学公式时，请使用LaTeX语法，请确保只能使用行内公式，不允许使用行间公式，这对于正确渲染非常重要。\n"
+
+# 对话请求的监控指标，各阶段耗时取自请求跟踪
+CHAT_REQUESTS = metrics.counter("marktreechat_chat_requests_total", "对话请求数", ["status"])
+CHAT_STAGE_DURATION = metrics.histogram("marktreechat_chat_stage_duration_seconds",
+                                        "对话各阶段的耗时，total 为整轮对话", ["stage"])
+
+
+def init_model(config: Dict[str, Any]):
+    """根据配置创建对话模型，配置了多个端点时返回路由模型"""
+    # 配置模型连接器共享的HTTP连接池和异步并发上限
+    from models.http_pool import configure as configure_http
+    from models.async_http import configure as configure_async
+    http_config = dict(config.get("http", {}))
+    configure_async(max_concurrency=http_config.pop("max_concurrency", None))
+    configure_http(**http_config)
+    return create_chat_model(config)
+
+
+def create_chat_model(config: Dict[str, Any]):
+    """按 model 和 router 配置创建模型实例，启动和设置页保存配置时共用"""
+    from models import create_model, create_router
+    model_config = config["model"]
+    # 配置了多个端点时按延迟路由，并在端点故障时自动切换
+    router_config = config.get("router", {})
+    if router_config.get("enabled") and router_config.get("endpoints"):
+        return create_router(router_config, model_config.get("temperature", 0.7))
+
+    return create_model(
+        provider=model_config["provider"],
+        model_name=model_config["name"],
+        api_key=model_config.get("api_key", ""),
+        api_base=model_config.get("api_base", ""),
+        temperature=model_config.get("temperature", 0.7)
+    )
+
+
+def wrap_response_cache(config: Dict[str, Any], model, kb: Dict[str, Any]):
+    """启用回复缓存时包装模型，知识库索引版本变化后旧回复自动失效"""
+    cache_config = config.get("cache", {})
+    if not cache_config.get("enabled", False):
+        return model
+
+    from models.cache import ResponseCache, CachedModel
+    cache = ResponseCache(
+        path=cache_config.get("path", "./knowledge/cache/responses.sqlite3"),
+        max_entries=int(cache_config.get("max_entries", 1000)),
+        max_bytes=int(cache_config.get("max_mb", 50)) * 1024 * 1024,
+        ttl=float(cache_config.get("ttl_hours", 168)) * 3600
+    )
+    return CachedModel(
+        model, cache,
+        max_temperature=float(cache_config.get("max_temperature", 0.3)),
+        index_version=lambda: kb["vector_store"].version
+    )
+
+
+def configure_tracing(config: Dict[str, Any]):
+    """按配置设置请求跟踪的环形缓冲区大小和JSON日志输出"""
+    tracing_config = config.get("tracing", {})
+    tracing.configure(
+        buffer_size=int(tracing_config.get("buffer_size", 500)),
+        json_log=tracing_config.get("json_log") or None
+    )
+
+
+def configure_logging(config: Dict[str, Any]):
+    """按配置设置日志级别和频率限制"""
+    from utils import log
+    log_config = config.get("log", {})
+    log.configure(
+        level=log_config.get("level", "info"),
+        rate_limit=int(log_config.get("rate_limit", 10)),
+        rate_interval=float(log_config.get("rate_interval", 60.0))
+    )
+
+
+def start_metrics_server(config: Dict[str, Any]):
+    """启用监控时在后台启动 Prometheus 指标服务（GET /metrics）
+
+    Returns:
+        HTTP服务对象，未启用或启动失败时为None
+    """
+    metrics_config = config.get("metrics", {})
+    if not metrics_config.get("enabled", False):
+        return None
+    host = metrics_config.get("host", "127.0.0.1")
+    port = int(metrics_config.get("port", 9464))
+    try:
+        server = metrics.start_http_server(host, port)
+    except OSError as e:
+        print(f"启动监控指标服务失败: {e}")
+        return None
+    print(f"监控指标: http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+def create_history_manager(config: Dict[str, Any], model):
+    """按模型上下文大小限制每轮发送的对话历史"""
+    from utils.history import HistoryManager
+    history_config = config.get("history", {})
+    return HistoryManager(
+        model,
+        context_window=int(history_config.get("context_window", 8192)),
+        history_ratio=float(history_config.get("history_ratio", 0.25)),
+        summary_max_tokens=int(history_config.get("summary_max_tokens", 300)),
+        summarize=history_config.get("summarize", True)
+    )
+
+
+def init_knowledge_base(config: Dict[str, Any]) -> Dict[str, Any]:
+    """创建知识库组件；嵌入模型加载、索引追赶和知识树重建由 start_background_warmup 完成"""
+    from rag.vectorstore import VectorStore
+    from rag.indexer import DocumentIndexer
+    from tree_kb.tree_builder import KnowledgeTreeBuilder
+
+    kb_config = config["knowledge_base"]
+    vector_store = VectorStore(
+        embedding_model=kb_config["embedding_model"],
+        vector_dir=kb_config["vector_dir"]
+    )
+    indexer = DocumentIndexer(vector_store)
+    indexer.retriever.mode = kb_config.get("retrieval_mode", "flat")
+    indexer.retriever.beam_width = int(kb_config.get("beam_width", 4))
+    indexer.retriever.context_packer.max_tokens = kb_config.get("context_max_tokens", 1500)
+    indexer.retriever.min_score = kb_config.get("min_score")
+    indexer.retriever.relative_cutoff = kb_config.get("relative_cutoff")
+
+    # 初始化树状知识库（加载已有的树，重建放到后台）
+    tree_builder = KnowledgeTreeBuilder(
+        documents_dir=kb_config["documents_dir"],
+        tree_index_path=kb_config["tree_index_path"],
+        max_workers=kb_config.get("tree_build_workers"),
+        executor=kb_config.get("tree_build_executor", "auto")
+    )
+
+    # 关联知识树，用于图扩展检索
+    indexer.retriever.attach_tree(tree_builder)
+    indexer.retriever.graph_expand_k = int(kb_config.get("graph_expand_k", 0))
+
+    # 语义回答缓存：近义问题复用之前的回答
+    semantic_cache = None
+    cache_config = config.get("semantic_cache", {})
+    if cache_config.get("enabled", False):
+        from rag.semantic_cache import SemanticCache
+        semantic_cache = SemanticCache(
+            vector_store,
+            path=cache_config.get("path", "./knowledge/cache/semantic_cache.json"),
+            threshold=float(cache_config.get("threshold", 0.92)),
+            max_entries=int(cache_config.get("max_entries", 500)),
+            ttl=float(cache_config.get("ttl_hours", 168)) * 3600
+        )
+
+    # 导出时读取当前索引规模
+    metrics.gauge("marktreechat_index_documents", "向量存储中的文档块数").set_function(
+        lambda: len(vector_store.documents))
+    metrics.gauge("marktreechat_index_version", "向量存储的索引版本").set_function(
+        lambda: vector_store.version)
+
+    return {
+        "vector_store": vector_store,
+        "indexer": indexer,
+        "tree_builder": tree_builder,
+        "semantic_cache": semantic_cache,
+        "status": StartupStatus([
+            ("embedding", "嵌入模型"),
+            ("index", "索引追赶"),
+            ("tree", "知识树构建"),
+        ])
+    }
+
+
+def start_background_warmup(config: Dict[str, Any], kb: Dict[str, Any], catch_up: bool = True):
+    """在后台依次加载嵌入模型、增量索引新文档、重建知识树
+
+    服务器无需等待这些工作即可开始响应；嵌入模型就绪前对话不使用知识库检索。
+
+    Args:
+        config: 应用配置
+        kb: init_knowledge_base 返回的知识库组件
+        catch_up: 为False时只加载嵌入模型，跳过配置中的自动索引和知识树重建
+
+    Returns:
+        执行预热的后台线程
+    """
+    kb_config = config["knowledge_base"]
+
+    def catch_up_index():
+        # 如果配置为自动索引，则索引文档目录
+        if catch_up and kb_config.get("auto_index", False):
+            # 使用增量索引
+            incremental = kb_config.get("incremental_index", True)
+            kb["indexer"].index_directory(kb_config["documents_dir"], incremental=incremental)
+
+    def build_tree():
+        if catch_up and kb_config.get("auto_build_tree", False):
+            kb["tree_builder"].build_tree()
+
+    # 嵌入模型加载失败时重试几次；索引需要计算嵌入，嵌入模型未就绪时跳过
+    return kb["status"].run([
+        ("embedding", kb["vector_store"].warm_up),
+        ("index", catch_up_index),
+        ("tree", build_tree),
+    ], requires={"index": ["embedding"]}, attempts={"embedding": 3})
+
+
+class ChatSession:
+    """单个会话的对话状态：界面中保存在 gr.State 里，无界面服务按会话ID保存"""
+
+    def __init__(self):
+        self.history_state = None   # HistoryManager 的摘要状态
+        self.last_retrieval = {}    # 最近一轮的检索决策信息
+        self.turns = 0              # 本会话已完成的对话轮数
+
+
+class ChatService:
+    """检索增强对话的处理流程，供Gradio界面、HTTP服务和命令行共用
+
+    流程依次为：语义缓存查找、知识库检索与上下文组装、按预算整理对话历史、
+    流式生成回复、写回语义缓存。不依赖任何界面组件。
+    """
+
+    def __init__(self, model_holder, kb: Dict[str, Any], history_manager=None, tracer=None):
+        """
+        Args:
+            model_holder: 当前对话模型的持有者（ModelHolder）
+            kb: 知识库组件
+            history_manager: 按token预算裁剪和摘要对话历史的 HistoryManager，为None时发送完整历史
+            tracer: 记录每轮对话各阶段耗时的 Tracer，默认使用进程内共享的跟踪器
+        """
+        self.model_holder = model_holder
+        self.kb = kb
+        self.history_manager = history_manager
+        self.vector_store = kb["vector_store"]
+        self.indexer = kb["indexer"]
+        self.retriever = kb["indexer"].retriever
+        self.semantic_cache = kb.get("semantic_cache")
+        self.startup_status = kb.get("status")
+        self.tracer = tracer or tracing.get_tracer()
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "ChatService":
+        """根据配置创建模型、知识库和历史管理器，不加载任何界面模块"""
+        from models.holder import ModelHolder
+        configure_logging(config)
+        configure_tracing(config)
+        kb = init_knowledge_base(config)
+        model = wrap_response_cache(config, init_model(config), kb)
+        model_holder = ModelHolder(model, event_concurrency=config.get("ui", {}).get("chat_concurrency", 4))
+        return cls(model_holder, kb, create_history_manager(config, model))
+
+    def embedding_ready(self) -> bool:
+        """后台加载嵌入模型完成之前，对话退化为不使用知识库
+
+        预热最终失败时，在使用时于后台重试失败的阶段（有最小间隔），重试完成前仍不使用知识库。
+        """
+        status = self.startup_status
+        if status is None or status.is_ready("embedding"):
+            return True
+        if status.state("embedding") == FAILED:
+            status.retry_failed()
+        return False
+
+    def build_context(self, query: str, top_k: int = 5, scope: Optional[List[str]] = None) -> Dict[str, Any]:
+        """检索并组装上下文，见 Retriever.build_context"""
+        return self.retriever.build_context(query, top_k=int(top_k), scope=scope or None)
+
+    def build_context_batch(self, queries: List[str], top_k: int = 5,
+                            scope: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """批量检索并组装上下文，见 Retriever.build_context_batch"""
+        return self.retriever.build_context_batch(queries, top_k=int(top_k), scope=scope or None)
+
+    @property
+    def documents_dir(self) -> str:
+        return self.kb["tree_builder"].documents_dir
+
+    def index(self, directory: Optional[str] = None, full: bool = False) -> Dict[str, List[str]]:
+        """索引文档目录并更新知识树
+
+        Args:
+            directory: 文档目录，默认为知识树的文档目录
+            full: 为True时在影子目录中完整重建索引，否则只索引新增或修改的文件
+
+        Returns:
+            {文件路径: 文档ID列表}
+        """
+        directory = directory or self.documents_dir
+        if not os.path.isdir(directory):
+            raise ValueError(f"目录不存在: {directory}")
+        tree_builder = self.kb["tree_builder"]
+        if full:
+            indexed = self.indexer.reindex(directory)
+        else:
+            indexed = self.indexer.index_directory(directory, incremental=True)
+        # 知识树总是按索引的目录重建；构建失败时抛出异常，不把过期的树当作成功
+        tree_builder.documents_dir = directory
+        tree_builder.build_tree()
+        return indexed
+
+    async def stream_chat(self, message: str, history: Optional[List[Tuple[str, str]]] = None,
+                          system_prompt: str = "", use_rag: bool = True, top_k: int = 3,
+                          temperature: float = 0.7, scope: Optional[List[str]] = None,
+                          session: Optional[ChatSession] = None) -> AsyncIterator[Dict[str, Any]]:
+        """处理一轮对话，以事件的形式流式返回
+
+        Args:
+            message: 用户消息
+            history: 之前的对话，[(用户消息, 助手回复), ...]
+            system_prompt: 系统提示词
+            use_rag: 是否检索知识库
+            top_k: 检索文档数量上限
+            temperature: 生成温度
+            scope: 限定检索范围的知识树节点ID列表，None表示全部
+            session: 会话状态，为None时使用临时会话
+
+        Yields:
+            事件字典：{"type": "retrieval", "retrieval": 检索信息}、
+            {"type": "delta", "text": 回复片段}，最后是
+            {"type": "done", "reply": 完整回复, "retrieval": 检索信息, "timings": 各阶段耗时（毫秒）}
+        """
+        # 各阶段耗时记入跟踪器，供诊断面板和JSON日志使用
+        trace = self.tracer.start("chat", rag=bool(use_rag), history_turns=len(history or []))
+        error = None
+        try:
+            async for event in self._stream_chat(message, history, system_prompt, use_rag, top_k,
+                                                 temperature, scope, session, trace):
+                if event["type"] == "done":
+                    event["timings"] = trace.durations()
+                yield event
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.tracer.finish(trace, error)
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug(trace.describe())
+            if error is None:
+                status = "ok"
+            elif isinstance(error, (GeneratorExit, asyncio.CancelledError)):
+                # 调用方提前停止读取，如客户端断开
+                status = "cancelled"
+            else:
+                status = "error"
+            CHAT_REQUESTS.inc(status=status)
+            for stage, ms in trace.durations().items():
+                CHAT_STAGE_DURATION.observe(ms / 1000, stage=stage)
+
+    async def _stream_chat(self, message: str, history: Optional[List[Tuple[str, str]]],
+                           system_prompt: str, use_rag: bool, top_k: int, temperature: float,
+                           scope: Optional[List[str]], session: Optional[ChatSession],
+                           trace: tracing.Trace) -> AsyncIterator[Dict[str, Any]]:
+        """stream_chat 的实现，各阶段耗时记入 trace"""
+        history = [tuple(turn) for turn in (history or [])]
+        session = session if session is not None else ChatSession()
+        scope = list(scope) if scope else None
+        # 整轮对话使用同一个模型实例，即使期间切换了模型
+        model = self.model_holder.get()
+        # 本轮检索的决策信息
+        retrieval_info = {"rag": bool(use_rag)}
+        trace.attrs["model"] = model.model_name
+        trace.attrs["api_base"] = getattr(model, "api_base", None)
+
+        # 语义缓存只用于对话的第一轮：后续轮次的回答依赖历史记录。
+        # 缓存会持久化且模型可以热切换，键中包含模型后端、模型名称和温度，避免跨模型命中
+        cache_key = None
+        if self.semantic_cache is not None and not history and self.embedding_ready():
+            cache_key = self.semantic_cache.context_key(
+                system_prompt, use_rag=bool(use_rag), top_k=int(top_k), scope=sorted(scope or []),
+                backend=self.model_holder.backend_key(model), model=model.model_name,
+                temperature=temperature
+            )
+            kb_version = self.vector_store.version
+            with trace.span("semantic_cache"):
+                query_embedding = await asyncio.to_thread(self.semantic_cache.embed, message)
+                # 查找要扫描全部缓存向量，版本失效时还会重写缓存文件，同样放到线程中执行
+                hit = await asyncio.to_thread(self.semantic_cache.lookup, message, cache_key,
+                                              embedding=query_embedding)
+            CACHE_LOOKUPS.inc(cache="semantic", result="miss" if hit is None else "hit")
+            if hit is not None:
+                log.debug("语义缓存命中，相似度: %.3f", hit[1])
+                retrieval_info["semantic_cache_hit"] = round(hit[1], 4)
+                trace.attrs["semantic_cache_hit"] = True
+                session.last_retrieval = retrieval_info
+                yield {"type": "done", "reply": hit[0], "retrieval": retrieval_info}
+                return
+
+        # 准备上下文（如果启用了RAG）
+        if use_rag and not self.embedding_ready():
+            retrieval_info["skipped_reason"] = "嵌入模型加载中，本轮未使用知识库"
+            log.info("嵌入模型尚未就绪，本轮不进行知识库检索")
+        elif use_rag:
+            # 检索涉及嵌入计算，放到线程中执行以免阻塞事件循环；检索器内部各步骤的耗时记入同一跟踪
+            with trace.span("retrieve"):
+                packed = await tracing.to_thread(trace, self.build_context, message, int(top_k), scope)
+            retrieval_info.update(packed["retrieval"])
+            retrieval_info.update({key: packed[key] for key in
+                                   ("used_tokens", "skipped_tokens", "included", "sources")})
+            if packed["retrieval"]["skipped"]:
+                # 没有结果通过相关度阈值，本轮不注入检索上下文
+                log.debug("没有相关文档通过阈值（最高分: %s），跳过检索上下文", packed["retrieval"]["top_score"])
+            else:
+                log.debug("检索上下文: %d tokens，装入 %d 块，因预算跳过 %d tokens",
+                          packed["used_tokens"], packed["included"], packed["skipped_tokens"])
+            if packed["context"]:
+                # 添加检索上下文到系统提示
+                system_prompt = (system_prompt + "\n\n" if system_prompt else "") + CONTEXT_PROMPT + packed["context"]
+        yield {"type": "retrieval", "retrieval": retrieval_info}
+
+        reply = ""
+        # 同一模型后端上同时进行的对话数受限，超出时在此排队等待
+        wait_start = time.perf_counter()
+        async with self.model_holder.event_slot(model):
+            trace.add("queue_wait", time.perf_counter() - wait_start, wait_start)
+            # 获取聊天历史：有历史管理器时只发送预算内的最近对话，更早的对话以摘要形式放入系统提示
+            messages = []
+            if self.history_manager is not None:
+                with trace.span("history"):
+                    summary, messages, session.history_state = await self.history_manager.prepare(
+                        history, session.history_state, model=model
+                    )
+                if summary:
+                    system_prompt = (system_prompt + "\n\n" if system_prompt else "") + "以下是之前对话的摘要：\n" + summary
+            else:
+                for user_msg, assistant_msg in history:
+                    messages.append({"role": "user", "content": user_msg})
+                    messages.append({"role": "assistant", "content": assistant_msg})
+
+            # 添加用户最新消息
+            messages.append({"role": "user", "content": message})
+
+            # 添加LaTeX渲染提示到系统提示中
+            system_prompt = (system_prompt + "\n\n" if system_prompt else "") + LATEX_PROMPT
+
+            # 流式获取模型回复
+            start_time = time.perf_counter()
+            first_token = True
+            with trace.span("llm_total"):
+                async for delta in model.astream_chat(
+                    messages=messages,
+                    system_prompt=system_prompt,
+                    temperature=float(temperature)
+                ):
+                    # 确保片段是字符串
+                    if not isinstance(delta, str):
+                        delta = str(delta)
+                    if first_token and delta:
+                        first_token = False
+                        trace.add("llm_first_token", time.perf_counter() - start_time, start_time)
+                    reply += delta
+                    yield {"type": "delta", "text": delta}
+
+        if cache_key is not None:
+            with trace.span("cache_write"):
+                await asyncio.to_thread(self.semantic_cache.add, message, reply, cache_key,
+                                        embedding=query_embedding, kb_version=kb_version)
+
+        session.turns += 1
+        session.last_retrieval = retrieval_info
+        yield {"type": "done", "reply": reply, "retrieval": retrieval_info}
+
+    async def chat(self, message: str, **kwargs) -> Dict[str, Any]:
+        """非流式地处理一轮对话，参数同 stream_chat
+
+        Returns:
+            {"reply": 完整回复, "retrieval": 检索信息, "timings": 各阶段耗时（毫秒）}
+        """
+        result = {"reply": "", "retrieval": {}, "timings": {}}
+        async for event in self.stream_chat(message, **kwargs):
+            if event["type"] == "done":
+                result = {"reply": event["reply"], "retrieval": event["retrieval"], "timings": event["timings"]}
+        return result
@@ -0,0 +1,285 @@
+import os
+import json
+import queue
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+from typing import Dict, Any, List, Optional, Tuple
+
+from utils import metrics
+from .core import ChatService, ChatSession
+
+log = logging.getLogger(__name__)
+
+
+class _LoopThread:
+    """在后台线程中运行的事件循环
+
+    所有对话协程都提交到同一个事件循环，模型后端的并发上限和异步HTTP客户端
+    因此在各请求线程之间共享。
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="service-loop", daemon=True)
+        self.thread.start()
+
+    def run(self, coro):
+        """在事件循环中执行协程并等待结果"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def iterate(self, agen):
+        """在事件循环中驱动异步生成器，在调用线程中逐项返回
+
+        调用方提前停止迭代（例如客户端断开）时取消事件循环中的任务。
+        """
+        items = queue.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                async for item in agen:
+                    items.put((item, None))
+            except BaseException as e:
+                items.put((None, e))
+            else:
+                items.put((done, None))
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while True:
+                item, error = items.get()
+                if error is not None:
+                    raise error
+                if item is done:
+                    return
+                yield item
+        finally:
+            future.cancel()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+class ServiceHTTPServer(ThreadingHTTPServer):
+    """无界面的JSON HTTP服务
+
+    接口：
+        GET  /health         启动阶段状态和知识库版本
+        GET  /v1/traces      最近对话请求的各阶段耗时分位数和明细，?limit=N 限制明细条数
+        GET  /metrics        Prometheus 文本格式的监控指标
+        POST /v1/retrieve    {"query", "top_k", "scope"} -> 检索上下文和检索信息
+        POST /v1/chat        {"message", "history", "session_id", "system_prompt", "use_rag",
+                              "top_k", "temperature", "scope", "stream"}
+                             stream 为 true 时以 NDJSON 逐行返回 ChatService.stream_chat 的事件
+        POST /v1/index       {"directory", "full"} -> 各文件的文档块数
+                             directory 只能是配置的文档目录，省略时即为该目录
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], service: ChatService,
+                 max_sessions: int = 1000, max_body_bytes: int = 1024 * 1024):
+        """
+        Args:
+            address: (主机, 端口)
+            service: 对话服务
+            max_sessions: 服务端保存的会话数上限，超出时淘汰最久未使用的会话
+            max_body_bytes: 请求体大小上限
+        """
+        super().__init__(address, ServiceRequestHandler)
+        self.service = service
+        self.max_sessions = max_sessions
+        self.max_body_bytes = max_body_bytes
+        self.loop_thread = _LoopThread()
+        # 会话ID -> (ChatSession, 对话历史)
+        self._sessions = OrderedDict()
+        self._sessions_lock = threading.Lock()
+
+    def get_session(self, session_id: str) -> Tuple[ChatSession, list]:
+        with self._sessions_lock:
+            if session_id not in self._sessions:
+                self._sessions[session_id] = (ChatSession(), [])
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            self._sessions.move_to_end(session_id)
+            return self._sessions[session_id]
+
+    def server_close(self):
+        super().server_close()
+        self.loop_thread.stop()
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    server_version = "MarkTreeChatService"
+
+    def log_message(self, format, *args):
+        log.debug("%s - %s", self.address_string(), format % args)
+
+    def _send_json(self, status: int, payload: Dict[str, Any]):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Optional[Dict[str, Any]]:
+        """读取JSON请求体，出错时已发送错误响应并返回None"""
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > self.server.max_body_bytes:
+            self._send_json(413, {"error": "请求体过大"})
+            return None
+        try:
+            data = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as e:
+            self._send_json(400, {"error": f"无效的JSON: {e}"})
+            return None
+        if not isinstance(data, dict):
+            self._send_json(400, {"error": "请求体必须是JSON对象"})
+            return None
+        return data
+
+    def do_GET(self):
+        path, _, query = self.path.partition("?")
+        if path == "/v1/traces":
+            self._traces(parse_qs(query))
+            return
+        if path == "/metrics":
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", metrics.CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if path != "/health":
+            self._send_json(404, {"error": f"未知路径: {self.path}"})
+            return
+        service = self.server.service
+        status = service.startup_status
+        self._send_json(200, {
+            "stages": status.snapshot() if status else {},
+            "embedding_ready": service.embedding_ready(),
+            "kb_version": service.vector_store.version,
+            "documents": len(service.vector_store.documents),
+        })
+
+    def _traces(self, params: Dict[str, List[str]]):
+        tracer = self.server.service.tracer
+        try:
+            limit = int(params.get("limit", ["50"])[0])
+        except ValueError:
+            self._send_json(400, {"error": "limit 必须是整数"})
+            return
+        self._send_json(200, {
+            "summary": tracer.summary("chat"),
+            "recent": [trace.to_dict() for trace in tracer.recent(limit, "chat")],
+        })
+
+    def do_POST(self):
+        routes = {
+            "/v1/retrieve": self._retrieve,
+            "/v1/chat": self._chat,
+            "/v1/index": self._index,
+        }
+        handler = routes.get(self.path)
+        if handler is None:
+            self._send_json(404, {"error": f"未知路径: {self.path}"})
+            return
+        data = self._read_json()
+        if data is None:
+            return
+        try:
+            handler(data)
+        except (KeyError, TypeError, ValueError) as e:
+            self._send_json(400, {"error": f"参数错误: {e}"})
+        except Exception as e:
+            log.error("处理 %s 失败: %s", self.path, e)
+            self._send_json(500, {"error": str(e)})
+
+    def _retrieve(self, data: Dict[str, Any]):
+        service = self.server.service
+        if not service.embedding_ready():
+            self._send_json(503, {"error": "嵌入模型加载中"})
+            return
+        packed = service.build_context(data["query"], top_k=int(data.get("top_k", 5)), scope=data.get("scope"))
+        self._send_json(200, packed)
+
+    def _index(self, data: Dict[str, Any]):
+        service = self.server.service
+        directory = data.get("directory")
+        # 完整重建会替换在线索引并改变知识树的文档目录，不允许通过接口指向其他目录
+        if directory and os.path.realpath(directory) != os.path.realpath(service.documents_dir):
+            self._send_json(403, {"error": f"只能索引配置的文档目录: {service.documents_dir}"})
+            return
+        indexed = service.index(service.documents_dir, full=bool(data.get("full", False)))
+        self._send_json(200, {
+            "files": {path: len(ids) for path, ids in indexed.items()},
+            "kb_version": service.vector_store.version,
+        })
+
+    def _chat(self, data: Dict[str, Any]):
+        server = self.server
+        message = data["message"]
+        session_id = data.get("session_id")
+        session, stored_history = server.get_session(session_id) if session_id else (None, [])
+        history = data.get("history")
+        history = [tuple(turn) for turn in history] if history is not None else list(stored_history)
+        agen = server.service.stream_chat(
+            message, history,
+            system_prompt=data.get("system_prompt", ""),
+            use_rag=bool(data.get("use_rag", True)),
+            top_k=int(data.get("top_k", 3)),
+            temperature=float(data.get("temperature", 0.7)),
+            scope=data.get("scope"),
+            session=session
+        )
+
+        def remember(reply: str):
+            if session_id:
+                stored_history[:] = history + [(message, reply)]
+
+        if not data.get("stream", False):
+            result = {"reply": "", "retrieval": {}, "timings": {}}
+            for event in server.loop_thread.iterate(agen):
+                if event["type"] == "done":
+                    result = {"reply": event["reply"], "retrieval": event["retrieval"], "timings": event["timings"]}
+            remember(result["reply"])
+            self._send_json(200, result)
+            return
+
+        # 流式响应：每行一个JSON事件，写完后关闭连接
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            for event in server.loop_thread.iterate(agen):
+                self.wfile.write((json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8"))
+                self.wfile.flush()
+                if event["type"] == "done":
+                    remember(event["reply"])
+        except (BrokenPipeError, ConnectionResetError):
+            log.info("客户端已断开，停止生成")
+        except Exception as e:
+            # 响应头已发送，错误作为最后一个事件返回
+            log.error("流式对话失败: %s", e)
+            self.wfile.write((json.dumps({"type": "error", "error": str(e)}, ensure_ascii=False) + "\n").encode("utf-8"))
+
+
+def serve(service: ChatService, host: str = "127.0.0.1", port: int = 7861, max_sessions: int = 1000):
+    """启动HTTP服务并阻塞运行，Ctrl+C退出"""
+    server = ServiceHTTPServer((host, port), service, max_sessions=max_sessions)
+    print(f"HTTP服务已启动: http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+import asyncio
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.base import BaseModel
+from models.router import RouterModel, ROUTER_FAILOVERS
+
+
+class BadModel(BaseModel):
+    def __init__(self):
+        super().__init__("bad")
+
+    def chat(self, messages, system_prompt=None, temperature=None):
+        raise Exception("down")
+
+    def stream_chat(self, messages, system_prompt=None, temperature=None):
+        raise Exception("down")
+        yield
+
+
+class GoodModel(BaseModel):
+    def __init__(self):
+        super().__init__("good")
+        self.calls = 0
+
+    def chat(self, messages, system_prompt=None, temperature=None):
+        self.calls += 1
+        return "ok"
+
+    def stream_chat(self, messages, system_prompt=None, temperature=None):
+        self.calls += 1
+        yield "o"
+        yield "k"
+
+
+class SlowModel(GoodModel):
+    """首个片段迟迟不来的端点"""
+
+    def stream_chat(self, messages, system_prompt=None, temperature=None):
+        self.calls += 1
+        time.sleep(0.5)
+        yield "slow"
+
+    async def _astream_chat(self, messages, system_prompt, temperature):
+        self.calls += 1
+        await asyncio.sleep(0.5)
+        yield "slow"
+
+
+async def _collect(stream):
+    return "".join([delta async for delta in stream])
+
+
+class HedgedRouterTest(unittest.TestCase):
+    messages = [{"role": "user", "content": "hi"}]
+
+    def setUp(self):
+        self.bad = BadModel()
+        self.good = GoodModel()
+        # 对冲延迟设得很长：主端点提前失败时必须立即转向备份端点，而不是等待或跳过它
+        self.router = RouterModel([self.bad, self.good], names=["bad", "good"],
+                                  hedge=True, hedge_min_delay=30.0)
+        self.failovers = ROUTER_FAILOVERS.value(endpoint="bad")
+
+    def assert_failed_over(self):
+        self.assertEqual(self.good.calls, 1)
+        self.assertEqual(ROUTER_FAILOVERS.value(endpoint="bad"), self.failovers + 1)
+        self.assertEqual(self.router.health[0].consecutive_failures, 1)
+
+    def test_chat_uses_backup_when_primary_fails_early(self):
+        self.assertEqual(self.router.chat(self.messages), "ok")
+        self.assert_failed_over()
+
+    def test_achat_uses_backup_when_primary_fails_early(self):
+        self.assertEqual(asyncio.run(self.router.achat(self.messages)), "ok")
+        self.assert_failed_over()
+
+    def test_stream_chat_uses_backup_when_primary_fails_early(self):
+        self.assertEqual("".join(self.router.stream_chat(self.messages)), "ok")
+        self.assert_failed_over()
+
+    def test_astream_chat_uses_backup_when_primary_fails_early(self):
+        self.assertEqual(asyncio.run(_collect(self.router.astream_chat(self.messages))), "ok")
+        self.assert_failed_over()
+
+    def test_stream_hedges_on_first_token(self):
+        slow = SlowModel()
+        router = RouterModel([slow, self.good], hedge=True, hedge_min_delay=0.05)
+        start = time.perf_counter()
+        self.assertEqual("".join(router.stream_chat(self.messages)), "ok")
+        self.assertLess(time.perf_counter() - start, 0.4)
+        self.assertEqual(self.good.calls, 1)
+
+    def test_astream_hedges_on_first_token(self):
+        slow = SlowModel()
+        router = RouterModel([slow, self.good], hedge=True, hedge_min_delay=0.05)
+        start = time.perf_counter()
+        self.assertEqual(asyncio.run(_collect(router.astream_chat(self.messages))), "ok")
+        self.assertLess(time.perf_counter() - start, 0.4)
+        self.assertEqual(self.good.calls, 1)
+
+    def test_all_endpoints_down(self):
+        router = RouterModel([BadModel(), BadModel()], hedge=True, hedge_min_delay=30.0)
+        with self.assertRaises(Exception) as ctx:
+            router.chat(self.messages)
+        self.assertIn("down", str(ctx.exception))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import mmap
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+class SectionReader:
+    """基于内存映射的节点内容读取器
+
+    树构建时为每个文件和标题段落记录了字节区间，这里按区间对映射后的文件切片，
+    读取开销只与返回的字节数有关，与文件大小无关。读取结果放在一个小型LRU中，
+    以文件修改时间校验是否失效。映射在每次读取后立即关闭，避免在Windows上锁住
+    正在编辑的文档。
+    """
+
+    def __init__(self, max_entries: int = 64, max_read_bytes: int = 256 * 1024):
+        self.max_entries = max_entries
+        self.max_read_bytes = max_read_bytes
+        # (路径, 起始, 结束) -> (mtime, 文本)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _slice(self, file_path: str, start: int, end: Optional[int]) -> Tuple[bytes, bool]:
+        """映射文件并截取字节区间，返回 (字节数据, 是否截断)"""
+        with open(file_path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            end = size if end is None else min(end, size)
+            start = max(0, min(start, end))
+            truncated = end - start > self.max_read_bytes
+            if truncated:
+                end = start + self.max_read_bytes
+            # 空文件无法映射
+            if end <= start:
+                return b"", False
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return mm[start:end], truncated
+
+    def read_range(self, file_path: str, start: int = 0, end: Optional[int] = None,
+                   expected_mtime: Optional[float] = None) -> Optional[str]:
+        """读取文件中 [start, end) 字节区间的文本
+
+        Args:
+            file_path: 文件路径
+            start: 起始字节偏移
+            end: 结束字节偏移，None表示到文件末尾
+            expected_mtime: 构建索引时记录的修改时间，不一致时返回None表示偏移已失效
+
+        Returns:
+            区间内的文本，超过 max_read_bytes 时截断并附加提示
+        """
+        mtime = os.path.getmtime(file_path)
+        if expected_mtime is not None and abs(mtime - expected_mtime) > 1e-3:
+            return None
+
+        key = (file_path, start, end)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry and entry[0] == mtime:
+                self._cache.move_to_end(key)
+                return entry[1]
+
+        data, truncated = self._slice(file_path, start, end)
+
+        # 截断位置可能落在多字节字符中间，忽略不完整的尾部字节
+        text = data.decode("utf-8", errors="ignore")
+        if truncated:
+            text += f"\n\n……（内容过长，仅显示前 {self.max_read_bytes // 1024} KB）"
+
+        with self._lock:
+            self._cache[key] = (mtime, text)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+        return text
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._cache.clear()
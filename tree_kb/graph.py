@@ -0,0 +1,135 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+
+class LinkGraph:
+    """知识库的稀疏关联图，用于个性化PageRank检索扩展
+
+    节点为目录、文件和标题，边包括树中的包含关系和文档间的链接，均按无向边处理。
+    邻接矩阵以CSR形式（indptr / indices / weights 三个列表）存储，且按行归一化为
+    转移概率，不依赖NumPy/SciPy。
+    """
+
+    def __init__(self, tree_builder, link_weight: float = 2.0, cache_size: int = 256):
+        self.tree_builder = tree_builder
+        self.link_weight = link_weight
+        self.cache_size = cache_size
+        self.version = None
+        self.node_ids = []
+        self.node_index = {}
+        self.indptr = [0]
+        self.indices = []
+        self.weights = []
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def build(self):
+        """根据知识树构建稀疏邻接矩阵"""
+        tree = self.tree_builder.get_tree()
+
+        # 根节点连接了所有内容，会让概率均匀扩散，因此不参与图
+        node_ids = [n for n, data in tree.nodes(data=True) if data.get("type") != "root"]
+        node_index = {node_id: i for i, node_id in enumerate(node_ids)}
+        adjacency = [dict() for _ in node_ids]
+
+        def connect(u, v, weight):
+            if u == v:
+                return
+            adjacency[u][v] = adjacency[u].get(v, 0.0) + weight
+            adjacency[v][u] = adjacency[v].get(u, 0.0) + weight
+
+        for parent, child in tree.edges():
+            if parent in node_index and child in node_index:
+                connect(node_index[parent], node_index[child], 1.0)
+
+        for node_id, data in tree.nodes(data=True):
+            for target in data.get("links", []):
+                target_id = f"file:{target}"
+                if node_id in node_index and target_id in node_index:
+                    connect(node_index[node_id], node_index[target_id], self.link_weight)
+
+        # 转为按行归一化的CSR
+        indptr = [0]
+        indices = []
+        weights = []
+        for row in adjacency:
+            total = sum(row.values())
+            for col in sorted(row):
+                indices.append(col)
+                weights.append(row[col] / total)
+            indptr.append(len(indices))
+
+        with self._lock:
+            self.node_ids = node_ids
+            self.node_index = node_index
+            self.indptr = indptr
+            self.indices = indices
+            self.weights = weights
+            self._cache.clear()
+            self.version = self.tree_builder.version
+
+    def ensure_current(self):
+        """知识树版本变化时重建"""
+        if self.version != self.tree_builder.version:
+            self.build()
+
+    def personalized_pagerank(self, seeds: Dict[str, float], damping: float = 0.85,
+                              iterations: int = 10, tolerance: float = 1e-6) -> List[Tuple[str, float]]:
+        """从种子节点出发运行个性化PageRank
+
+        只在非零分量上做稀疏幂迭代，迭代次数固定为 iterations，低于 tolerance 的
+        概率质量会被丢弃以保持向量稀疏。结果按知识树版本和种子缓存。
+
+        Args:
+            seeds: 节点ID -> 种子权重
+            damping: 沿边游走的概率，1 - damping 为回到种子的概率
+            iterations: 幂迭代次数
+            tolerance: 丢弃的最小概率质量
+
+        Returns:
+            (节点ID, 得分) 列表，按得分降序排列
+        """
+        self.ensure_current()
+        personalization = {}
+        for node_id, weight in seeds.items():
+            idx = self.node_index.get(node_id)
+            if idx is not None and weight > 0:
+                personalization[idx] = personalization.get(idx, 0.0) + weight
+        total = sum(personalization.values())
+        if not total:
+            return []
+        personalization = {k: v / total for k, v in personalization.items()}
+
+        cache_key = (self.version, damping, iterations,
+                     tuple(sorted((k, round(v, 4)) for k, v in personalization.items())))
+        with self._lock:
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                self._cache.move_to_end(cache_key)
+                return cached
+
+        indptr, indices, weights = self.indptr, self.indices, self.weights
+        scores = dict(personalization)
+        for _ in range(iterations):
+            updated = {k: (1 - damping) * v for k, v in personalization.items()}
+            for u, mass in scores.items():
+                start, end = indptr[u], indptr[u + 1]
+                if start == end:
+                    # 孤立节点的概率质量回到种子
+                    for k, v in personalization.items():
+                        updated[k] += damping * mass * v
+                    continue
+                push = damping * mass
+                for j in range(start, end):
+                    v = indices[j]
+                    updated[v] = updated.get(v, 0.0) + push * weights[j]
+            scores = {k: v for k, v in updated.items() if v >= tolerance}
+
+        ranked = sorted(((self.node_ids[k], v) for k, v in scores.items()), key=lambda x: x[1], reverse=True)
+
+        with self._lock:
+            self._cache[cache_key] = ranked
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return ranked
@@ -1,17 +1,20 @@
 import os
 import networkx as nx
 from typing import Dict, List, Any, Optional, Tuple
+from .content_reader import SectionReader
 
 class KnowledgeNavigator:
     """知识树导航器，用于在树状知识库中导航"""
     
-    def __init__(self, tree_builder):
+    def __init__(self, tree_builder, reader: Optional[SectionReader] = None):
         self.tree_builder = tree_builder
         self.tree = tree_builder.get_tree()
+        self.reader = reader or SectionReader()
     
     def refresh(self):
         """刷新知识树"""
         self.tree = self.tree_builder.get_tree()
+        self.reader.clear()
     
     def get_node(self, node_id: str) -> Optional[Dict[str, Any]]:
         """获取节点信息
@@ -150,16 +153,30 @@ class KnowledgeNavigator:
         node_type = node.get("type")
         
         if node_type == "header":
-            # 对于标题节点，直接返回其内容
+            # 对于标题节点，按字节区间读取整个段落
+            rel_path = node.get("file_path")
+            if rel_path and "byte_start" in node:
+                file_node = self.get_node(f"file:{rel_path}") or {}
+                try:
+                    section = self.reader.read_range(
+                        os.path.join(self.tree_builder.documents_dir, rel_path),
+                        node["byte_start"],
+                        node.get("byte_end"),
+                        expected_mtime=file_node.get("mtime")
+                    )
+                    if section is not None:
+                        return section
+                except Exception as e:
+                    print(f"读取段落内容失败: {e}")
+            # 旧索引或文件已修改，偏移不可用时退回到标题行
             return node.get("content", "")
         elif node_type == "file":
-            # 对于文件节点，尝试读取文件内容
+            # 对于文件节点，通过内存映射读取文件内容
             path = node.get("path")
             if path:
                 try:
                     file_path = os.path.join(self.tree_builder.documents_dir, path)
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        return f.read()
+                    return self.reader.read_range(file_path, 0, None)
                 except Exception as e:
                     return f"无法读取文件内容: {str(e)}"
             return "文件路径不可用"
@@ -1,11 +1,18 @@
 import gradio as gr
 import time
 from typing import Dict, List, Any
-from models.base import BaseModel
+from models.holder import ModelHolder
+from service.core import ChatService, ChatSession
 import re
 
-def create_chat_ui(model: BaseModel, kb: Dict[str, Any]):
-    """创建聊天界面"""
+def create_chat_ui(model_holder: ModelHolder, kb: Dict[str, Any], history_manager=None):
+    """创建聊天界面
+
+    Args:
+        model_holder: 当前对话模型的持有者，设置页切换模型后下一轮对话即生效
+        kb: 知识库组件
+        history_manager: 按token预算裁剪和摘要对话历史的 HistoryManager，为None时发送完整历史
+    """
 
     # 使用Gradio的事件机制实现复制功能
     def copy_last_response(history):
@@ -16,13 +23,21 @@ def create_chat_ui(model: BaseModel, kb: Dict[str, Any]):
         last_response = history[-1][1]
         return last_response
 
-    # 获取知识库组件
-    vector_store = kb["vector_store"]
-    retriever = kb["indexer"].retriever
+    # 获取知识库组件；对话流程与HTTP服务、命令行共用 ChatService
     tree_builder = kb["tree_builder"]
+    startup_status = kb.get("status")
+    service = ChatService(model_holder, kb, history_manager)
 
-    # 全局聊天历史记录
-    chat_history = []
+    # 获取可选的检索范围（目录和文件节点）
+    def get_scope_choices():
+        choices = []
+        tree = tree_builder.get_tree()
+        for node_id, node_data in tree.nodes(data=True):
+            node_type = node_data.get("type")
+            if node_type in ("directory", "file"):
+                icon = "📁" if node_type == "directory" else "📄"
+                choices.append(f"{icon} {node_data.get('path', '')}|{node_id}")
+        return sorted(choices, key=lambda c: c.split("|", 1)[1].split(":", 1)[1])
 
     # # 处理LaTeX公式的函数，确保行间公式能正确显示
     # def process_latex_formulas(text):
@@ -64,69 +79,46 @@ def create_chat_ui(model: BaseModel, kb: Dict[str, Any]):
     #
     #     return result
 
-    # 处理用户消息
-    def respond(message, history, system_prompt, use_rag, top_k, temperature):
+    # 处理用户消息（异步生成器，流式更新聊天记录，等待模型时不占用工作线程）
+    async def respond(message, history, system_prompt, use_rag, top_k, temperature, scope, session):
+        reply = ""
+        # 本轮检索的决策信息，显示在“检索信息”面板中
+        retrieval_info = {"rag": bool(use_rag)}
         try:
-            # 打印当前模型配置进行调试
-            print(f"使用模型: {model.model_name}")
-            print(f"API基础URL: {getattr(model, 'api_base', 'N/A')}")
-
-            # 准备上下文（如果启用了RAG）
-            context = ""
-            if use_rag:
-                context = retriever.get_retrieval_context(message, top_k=int(top_k))
-                if context:
-                    # 添加检索上下文到系统提示
-                    if system_prompt:
-                        system_prompt += "\n\n以下是与用户问题相关的参考信息，请在回答时使用这些信息：\n" + context
-                    else:
-                        system_prompt = "以下是与用户问题相关的参考信息，请在回答时使用这些信息：\n" + context
-
-            # 获取聊天历史
-            current_chat_history = []
-            if history:
-                for entry in history:
-                    # 正确映射角色名称
-                    user_msg = {"role": "user", "content": entry[0]}
-                    assistant_msg = {"role": "assistant", "content": entry[1]}
-                    current_chat_history.append(user_msg)
-                    current_chat_history.append(assistant_msg)
-
-            # 添加用户最新消息
-            current_chat_history.append({"role": "user", "content": message})
-
-            # 添加LaTeX渲染提示到系统提示中
-            if system_prompt:
-                system_prompt += "\n\n" + "在回答涉及数学公式时，请使用LaTeX语法，请确保只能使用行内公式，不允许使用行间公式，这对于正确渲染非常重要。\n"
-            else:
-                system_prompt = "在回答涉及数学公式时，请使用LaTeX语法，请确保只能使用行内公式，不允许使用行间公式，这对于正确渲染非常重要。\n"
-
-            # 获取模型回复
-            reply = model.chat(
-                messages=current_chat_history,
+            # 解析检索范围，未选择时检索整个知识库
+            scope_ids = [item.split("|")[-1] for item in scope] if scope else None
+            async for event in service.stream_chat(
+                message, history,
                 system_prompt=system_prompt,
-                temperature=float(temperature)
-            )
-
-            # 确保reply是字符串
-            if not isinstance(reply, str):
-                reply = str(reply)
-
-            # # 处理回复中的LaTeX公式，确保正确渲染
-            # reply = process_latex_formulas(reply)
-
-            # 更新聊天历史
-            history = history + [(message, reply)]
+                use_rag=use_rag,
+                top_k=int(top_k),
+                temperature=float(temperature),
+                scope=scope_ids,
+                session=session
+            ):
+                if event["type"] == "delta":
+                    # 流式更新最后一条消息
+                    reply += event["text"]
+                    yield "", history + [(message, reply)], session, retrieval_info
+                else:
+                    retrieval_info = event["retrieval"]
+                    if event["type"] == "done":
+                        reply = event["reply"]
 
             # 关键修复：返回空字符串和更新的历史记录
-            return "", history
+            yield "", history + [(message, reply)], session, retrieval_info
         except Exception as e:
             error_msg = f"发生错误: {str(e)}"
-            # 添加错误信息到历史记录
+            # 添加错误信息到历史记录（保留已经流式输出的部分）
+            if reply:
+                error_msg = reply + "\n\n" + error_msg
             history = history + [(message, error_msg)]
-            return "", history
+            yield "", history, session, retrieval_info
 
     # 创建界面组件
+    # 每个会话独立的对话状态（Gradio为每个会话复制一份初始值）
+    session_state = gr.State(ChatSession())
+
     with gr.Row():
         with gr.Column(scale=3):
             # 主聊天区域 - 启用Markdown和LaTeX渲染
@@ -208,8 +200,14 @@ def create_chat_ui(model: BaseModel, kb: Dict[str, Any]):
                     maximum=10,
                     value=3,
                     step=1,
-                    label="检索文档数量"
+                    label="检索文档数量上限"
                 )
+                scope = gr.Dropdown(
+                    choices=get_scope_choices(),
+                    multiselect=True,
+                    label="检索范围（留空则检索整个知识库）"
+                )
+                refresh_scope_btn = gr.Button("刷新检索范围")
                 temperature = gr.Slider(
                     minimum=0.0,
                     maximum=1.0,
@@ -218,6 +216,19 @@ def create_chat_ui(model: BaseModel, kb: Dict[str, Any]):
                     label="温度参数"
                 )
 
+            with gr.Accordion("知识库状态", open=False):
+                # 后台启动任务的进度，定时刷新
+                gr.Markdown(startup_status.summary if startup_status else "已就绪",
+                            every=5 if startup_status else None)
+
+            with gr.Accordion("检索信息", open=False):
+                # 最近一轮的检索决策：候选数、过滤掉的结果、使用的token数等
+                retrieval_info = gr.JSON(label="最近一次检索")
+
+            with gr.Accordion("性能诊断", open=False):
+                # 最近对话各阶段（检索、排队、模型首字等）耗时的分位数，定时刷新
+                gr.Markdown(lambda: service.tracer.report("chat"), every=10)
+
     # 添加复制按钮功能
     copy_btn.click(
         copy_last_response,
@@ -229,8 +240,13 @@ def create_chat_ui(model: BaseModel, kb: Dict[str, Any]):
     # 设置事件处理
     submit_btn.click(
         respond,
-        inputs=[msg, chatbot, system_prompt, use_rag, top_k, temperature],
-        outputs=[msg, chatbot]
+        inputs=[msg, chatbot, system_prompt, use_rag, top_k, temperature, scope, session_state],
+        outputs=[msg, chatbot, session_state, retrieval_info]
+    )
+
+    refresh_scope_btn.click(
+        lambda: gr.update(choices=get_scope_choices()),
+        outputs=[scope]
     )
 
     # msg.submit(
@@ -240,6 +256,6 @@ def create_chat_ui(model: BaseModel, kb: Dict[str, Any]):
     # )
 
     clear_btn.click(
-        lambda: (None, []),
-        outputs=[msg, chatbot]
+        lambda: (None, [], ChatSession(), {}),
+        outputs=[msg, chatbot, session_state, retrieval_info]
     )
\ No newline at end of file
@@ -99,10 +99,19 @@ def create_kb_manager_ui(kb: Dict[str, Any]):
             # 刷新导航器
             navigator.refresh()
             
-            return f"成功重建索引，共处理了 {len(indexed)} 个文件"
+            return f"成功重建索引（重建期间检索使用旧索引），共处理了 {len(indexed)} 个文件"
         except Exception as e:
             return f"重建索引失败: {str(e)}"
 
+    # 回滚到上一代向量索引
+    def rollback_index():
+        try:
+            if indexer.rollback():
+                return f"已回滚到上一代索引，当前共 {indexer.get_document_count()} 个文档块"
+            return "没有可回滚的上一代索引"
+        except Exception as e:
+            return f"回滚索引失败: {str(e)}"
+
     # 增量索引函数
     def incremental_index(documents_dir):
         try:
@@ -164,7 +173,14 @@ def create_kb_manager_ui(kb: Dict[str, Any]):
     def get_stats():
         doc_count = indexer.get_document_count()
         node_count = len(tree_builder.tree.nodes)
-        return f"已索引 {doc_count} 个文档块, 知识树包含 {node_count} 个节点"
+        stats = f"已索引 {doc_count} 个文档块, 知识树包含 {node_count} 个节点"
+        semantic_cache = kb.get("semantic_cache")
+        if semantic_cache is not None:
+            cache_stats = semantic_cache.stats()
+            stats += (f"\n\n语义缓存: {cache_stats['entries']} 条, "
+                      f"命中 {cache_stats['hits']}/{cache_stats['lookups']} ({cache_stats['hit_rate']:.0%}), "
+                      f"因知识库更新失效 {cache_stats['invalidated']} 条")
+        return stats
     
     # 创建UI
     with gr.Row():
@@ -196,6 +212,7 @@ def create_kb_manager_ui(kb: Dict[str, Any]):
                 with gr.Row():
                     rebuild_btn = gr.Button("重建索引")
                     incremental_btn = gr.Button("增量索引")  # 新增的增量索引按钮
+                    rollback_btn = gr.Button("回滚到上一代索引")
                 rebuild_status = gr.Markdown("")
                 
                 with gr.Row():
@@ -259,6 +276,14 @@ def create_kb_manager_ui(kb: Dict[str, Any]):
         outputs=[path_display, content_display, tree_items]
     )
 
+    rollback_btn.click(
+        rollback_index,
+        outputs=[rebuild_status]
+    ).then(
+        get_stats,
+        outputs=[stats_text]
+    )
+
     # 增量索引按钮的点击事件
     incremental_btn.click(
         incremental_index,
@@ -2,70 +2,59 @@ import gradio as gr
 import yaml
 import os
 from typing import Dict, Any
-from models.base import BaseModel
+from models.holder import ModelHolder
+from models.http_pool import get_pool_stats
 
-def create_settings_ui(config: Dict[str, Any], model: BaseModel):
+def create_settings_ui(config: Dict[str, Any], model_holder: ModelHolder):
     """创建设置界面"""
 
-    # 声明model为非本地变量，以便可以修改它
-    global_model = model
-
     # 保存配置
     def save_config(provider, model_name, api_key, api_base, temperature,
                   embedding_model, documents_dir, vector_dir, tree_index_path,
                   auto_index, incremental_index, auto_build_tree):
         try:
-            from models import create_model
-
-            # 更新配置
-            new_config = {
-                "model": {
-                    "provider": provider,
-                    "name": model_name,
-                    "api_key": api_key,
-                    "api_base": api_base,
-                    "temperature": float(temperature)
-                },
-                "knowledge_base": {
-                    "embedding_model": embedding_model,
-                    "documents_dir": documents_dir,
-                    "vector_dir": vector_dir,
-                    "tree_index_path": tree_index_path,
-                    "auto_index": bool(auto_index),
-                    "incremental_index": bool(incremental_index),
-                    "auto_build_tree": bool(auto_build_tree)
-                },
-                "ui": config.get("ui", {"theme": "soft", "title": "AI助手", "max_history": 10})
-            }
+            from service.core import create_chat_model
+
+            # 更新配置（保留界面上未展示的其他配置项）
+            new_config = dict(config)
+            new_config["model"] = dict(config.get("model", {}))
+            new_config["model"].update({
+                "provider": provider,
+                "name": model_name,
+                "api_key": api_key,
+                "api_base": api_base,
+                "temperature": float(temperature)
+            })
+            new_config["knowledge_base"] = dict(config.get("knowledge_base", {}))
+            new_config["knowledge_base"].update({
+                "embedding_model": embedding_model,
+                "documents_dir": documents_dir,
+                "vector_dir": vector_dir,
+                "tree_index_path": tree_index_path,
+                "auto_index": bool(auto_index),
+                "incremental_index": bool(incremental_index),
+                "auto_build_tree": bool(auto_build_tree)
+            })
+            new_config["ui"] = config.get("ui", {"theme": "soft", "title": "AI助手", "max_history": 10})
 
             # 写入配置文件
             with open("config.yaml", "w", encoding="utf-8") as f:
                 yaml.dump(new_config, f, default_flow_style=False, allow_unicode=True)
 
-            # 重要：重新创建模型实例
+            # 重要：重新创建模型实例，并整体替换当前模型（进行中的对话继续使用旧实例）
             try:
-                nonlocal global_model
-                # 创建新的模型实例
-                new_model = create_model(
-                    provider=provider,
-                    model_name=model_name,
-                    api_key=api_key,
-                    api_base=api_base,
-                    temperature=float(temperature)
-                )
-
-                # 替换全局模型实例的属性
-                global_model.model_name = new_model.model_name
-                global_model.temperature = new_model.temperature
-
-                # 复制所有属性
-                for attr_name in dir(new_model):
-                    if not attr_name.startswith('__'):
-                        try:
-                            setattr(global_model, attr_name, getattr(new_model, attr_name))
-                        except:
-                            pass
-
+                # 与启动时使用同一个工厂，启用了路由时仍创建多端点路由模型
+                new_model = create_chat_model(new_config)
+
+                # 当前模型带有回复缓存时，新模型沿用同一个缓存
+                from models.cache import CachedModel
+                current_model = model_holder.get()
+                if isinstance(current_model, CachedModel):
+                    new_model = current_model.wrap(new_model)
+                model_holder.swap(new_model)
+
+                if new_config.get("router", {}).get("enabled"):
+                    return "配置已保存并应用。已启用多端点路由，模型端点仍按 config.yaml 的 router 配置生效。"
                 return "配置已保存并应用，模型已更新！您可以直接使用新模型。"
             except Exception as e:
                 return f"配置已保存，但更新模型实例失败: {str(e)}。请重启应用以应用更改。"
@@ -241,6 +230,11 @@ def create_settings_ui(config: Dict[str, Any], model: BaseModel):
                         label="自动构建树状结构"
                     )
 
+            # 连接池统计
+            with gr.Accordion("连接池统计", open=False):
+                pool_stats = gr.JSON(label="各主机的连接复用与请求延迟")
+                refresh_pool_btn = gr.Button("刷新统计")
+
             # 保存按钮
             save_btn = gr.Button("保存配置")
             save_result = gr.Markdown("")
@@ -258,6 +252,11 @@ def create_settings_ui(config: Dict[str, Any], model: BaseModel):
         outputs=[test_result]
     )
 
+    refresh_pool_btn.click(
+        get_pool_stats,
+        outputs=[pool_stats]
+    )
+
     save_btn.click(
         save_config,
         inputs=[
@@ -0,0 +1,141 @@
+import json
+import hashlib
+import logging
+from typing import List, Dict, Any, Optional, Tuple
+from .tokens import count_tokens, count_message_tokens, truncate_to_tokens, MESSAGE_OVERHEAD
+
+log = logging.getLogger(__name__)
+
+SUMMARY_SYSTEM_PROMPT = "你是对话摘要助手。请用简洁的中文总结对话要点，保留用户的需求、已确认的事实和结论，不要添加新内容。"
+
+
+class HistoryManager:
+    """按token预算管理对话历史
+
+    最近的若干轮对话原样发送，总量不超过历史预算；超出预算时把最早的若干轮
+    折叠进一段增量更新的摘要。摘要自身也有长度上限，因此无论对话多长，
+    发送给模型的历史部分始终有界。
+
+    每个会话的状态是一个普通字典，保存在 gr.State 中：
+        {"summary": 摘要文本, "summarized": 已折叠进摘要的轮数, "prefix": 已折叠对话的哈希}
+    聊天记录的开头与已折叠的对话不一致时（例如清空后开始了新对话）摘要作废。
+    """
+
+    def __init__(self, model, context_window: int = 8192, history_ratio: float = 0.25,
+                 summary_max_tokens: int = 300, summarize: bool = True, fold_ratio: float = 0.6):
+        """
+        Args:
+            model: 用于生成摘要的模型
+            context_window: 模型上下文窗口大小（token）
+            history_ratio: 历史消息可占用上下文窗口的比例
+            summary_max_tokens: 摘要的最大token数
+            summarize: 为False时直接丢弃超出预算的旧对话
+            fold_ratio: 触发折叠后，保留的最近对话降到预算的该比例以下，避免每轮都生成摘要
+        """
+        self.model = model
+        self.context_window = context_window
+        self.history_ratio = history_ratio
+        self.summary_max_tokens = summary_max_tokens
+        self.summarize = summarize
+        self.fold_ratio = fold_ratio
+
+    @property
+    def budget(self) -> int:
+        """最近对话原文可使用的token数"""
+        return int(self.context_window * self.history_ratio)
+
+    @staticmethod
+    def new_state() -> Dict[str, Any]:
+        return {"summary": "", "summarized": 0, "prefix": HistoryManager._prefix_hash([])}
+
+    @staticmethod
+    def _prefix_hash(turns) -> str:
+        """已折叠对话的摘要哈希，用于判断聊天记录是否仍是同一个对话"""
+        raw = json.dumps([list(turn) for turn in turns], ensure_ascii=False)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _turn_tokens(turn: Tuple[str, str]) -> int:
+        return count_tokens(turn[0] or "") + count_tokens(turn[1] or "") + 2 * MESSAGE_OVERHEAD
+
+    @staticmethod
+    def _turn_messages(turns) -> List[Dict[str, str]]:
+        messages = []
+        for user_msg, assistant_msg in turns:
+            messages.append({"role": "user", "content": user_msg})
+            messages.append({"role": "assistant", "content": assistant_msg})
+        return messages
+
+    def _fold_point(self, turns, start: int) -> int:
+        """返回需要折叠到的位置；未超出预算时返回 start"""
+        sizes = [self._turn_tokens(turn) for turn in turns[start:]]
+        total = sum(sizes)
+        if total <= self.budget:
+            return start
+
+        # 从最早的一轮开始折叠，直到剩余部分降到预算的 fold_ratio 以下
+        target = self.budget * self.fold_ratio
+        cut = start
+        for size in sizes:
+            if total <= target:
+                break
+            total -= size
+            cut += 1
+        return cut
+
+    async def _update_summary(self, summary: str, turns, model=None) -> str:
+        """把新折叠的对话合并进已有摘要"""
+        transcript = "\n".join(f"用户: {u}\n助手: {a}" for u, a in turns)
+        head = f"已有的对话摘要：\n{summary}\n\n" if summary else ""
+        instruction = f"\n\n请输出合并后的完整摘要，不超过{self.summary_max_tokens}个token。"
+        # 摘要输入本身也要限制长度：只从开头截断新对话，已有摘要、最近的对话和指令始终保留
+        limit = max(self.budget, self.summary_max_tokens * 2)
+        transcript = truncate_to_tokens(transcript, limit - count_tokens(head + "新的对话内容：\n" + instruction),
+                                        keep_end=True)
+        prompt = f"{head}新的对话内容：\n{transcript}{instruction}"
+
+        new_summary = await (model or self.model).achat(
+            messages=[{"role": "user", "content": prompt}],
+            system_prompt=SUMMARY_SYSTEM_PROMPT,
+            temperature=0.2
+        )
+        return truncate_to_tokens((new_summary or "").strip(), self.summary_max_tokens)
+
+    async def prepare(self, history: List[Tuple[str, str]],
+                      state: Optional[Dict[str, Any]],
+                      model=None) -> Tuple[str, List[Dict[str, str]], Dict[str, Any]]:
+        """根据预算整理要发送的历史
+
+        Args:
+            history: Gradio聊天记录，[(用户消息, 助手回复), ...]
+            state: 会话状态，为None或与聊天记录不一致（例如对话已清空）时重新开始
+            model: 生成摘要使用的模型，默认为构造时传入的模型
+
+        Returns:
+            (摘要文本, 最近对话的消息列表, 更新后的会话状态)
+        """
+        history = [tuple(turn) for turn in (history or [])]
+        if (not state or state.get("summarized", 0) > len(history)
+                or state.get("prefix") != self._prefix_hash(history[:state.get("summarized", 0)])):
+            state = self.new_state()
+        summary = state.get("summary", "")
+        summarized = state.get("summarized", 0)
+
+        cut = self._fold_point(history, summarized)
+        if cut > summarized:
+            folded = history[summarized:cut]
+            if self.summarize:
+                try:
+                    summary = await self._update_summary(summary, folded, model)
+                    log.info("已将 %d 轮对话折叠进摘要，摘要 %d tokens", len(folded), count_tokens(summary))
+                except Exception as e:
+                    # 摘要失败时旧对话直接丢弃，仍保证不超出预算
+                    log.warning("生成对话摘要失败，丢弃较早的对话: %s", e)
+            summarized = cut
+
+        messages = self._turn_messages(history[summarized:])
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("历史消息: %d tokens（预算 %d），摘要 %d tokens",
+                      count_message_tokens(messages), self.budget, count_tokens(summary))
+        return summary, messages, {"summary": summary, "summarized": summarized,
+                                   "prefix": self._prefix_hash(history[:summarized])}
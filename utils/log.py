@@ -0,0 +1,80 @@
+import sys
+import time
+import logging
+import threading
+from typing import Optional
+
+# 日志输出格式，与项目其他控制台输出保持简短
+LOG_FORMAT = "[%(levelname)s] %(name)s: %(message)s"
+
+_handler = None
+_filter = None
+_lock = threading.Lock()
+
+
+class RateLimitFilter(logging.Filter):
+    """限制同一条日志的输出频率
+
+    同一条日志在 interval 秒内最多输出 limit 次，limit 为0表示不限制。默认以日志器名称和
+    消息模板区分日志，调用时可以用 extra={"rate_key": ...} 指定；被省略的次数附在下一个
+    时间窗口的第一条日志之后。
+    """
+
+    def __init__(self, limit: int = 10, interval: float = 60.0):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self._lock = threading.Lock()
+        # key -> [窗口开始时间, 窗口内次数, 被省略的次数]
+        self._windows = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not self.limit:
+            return True
+        key = (record.name, getattr(record, "rate_key", None) or str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                window = self._windows[key] = [now, 0, 0]
+                if len(self._windows) > 1000:
+                    # 过期窗口太多时清理，避免动态文本的日志无限占用内存
+                    for stale in [k for k, w in self._windows.items() if now - w[0] >= self.interval]:
+                        del self._windows[stale]
+                if suppressed:
+                    record.msg = f"{record.msg}（此前 {suppressed} 条相同日志已省略）"
+            if window[1] >= self.limit:
+                window[2] += 1
+                return False
+            window[1] += 1
+        return True
+
+
+def configure(level: Optional[str] = None, rate_limit: Optional[int] = None,
+              rate_interval: Optional[float] = None):
+    """为根日志器配置输出到标准输出的处理器、级别和频率限制，重复调用只修改设置
+
+    Args:
+        level: 最低输出级别，debug / info / warning / error
+        rate_limit: 同一条日志在一个时间窗口内的最多输出次数，0表示不限制
+        rate_interval: 频率限制的时间窗口（秒）
+    """
+    global _handler, _filter
+    root = logging.getLogger()
+    with _lock:
+        if _handler is None:
+            _filter = RateLimitFilter()
+            _handler = logging.StreamHandler(sys.stdout)
+            _handler.setFormatter(logging.Formatter(LOG_FORMAT))
+            _handler.addFilter(_filter)
+            root.addHandler(_handler)
+        if level is not None:
+            numeric = logging.getLevelName(str(level).upper())
+            if not isinstance(numeric, int):
+                raise ValueError(f"未知的日志级别: {level}")
+            root.setLevel(numeric)
+        if rate_limit is not None:
+            _filter.limit = max(0, int(rate_limit))
+        if rate_interval is not None:
+            _filter.interval = float(rate_interval)
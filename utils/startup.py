@@ -0,0 +1,187 @@
+import sys
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+# 阶段状态
+PENDING = "pending"
+RUNNING = "running"
+READY = "ready"
+FAILED = "failed"
+
+_STATE_LABELS = {
+    PENDING: "等待中",
+    RUNNING: "进行中",
+    READY: "已就绪",
+    FAILED: "失败",
+}
+
+
+class StartupStatus:
+    """后台启动任务的就绪状态
+
+    服务器启动后立即对外提供服务，嵌入模型加载、索引追赶、知识树构建等耗时
+    工作在后台线程中按顺序执行，每个阶段的状态可在界面上查看。
+    """
+
+    def __init__(self, stages: List[Tuple[str, str]]):
+        """
+        Args:
+            stages: (阶段键, 显示名称) 列表，按执行顺序排列
+        """
+        self._lock = threading.Lock()
+        self.labels = dict(stages)
+        self.stages = {key: {"state": PENDING, "seconds": None, "error": None} for key, _ in stages}
+        self.started_at = time.time()
+        # run 传入的任务和执行设置，retry_failed 据此重新执行失败的阶段
+        self._tasks = []
+        self._requires = {}
+        self._attempts = {}
+        self._retry_delay = 5.0
+        self._worker = None
+        self._last_run = 0.0
+
+    def set(self, key: str, state: str, seconds: float = None, error: str = None):
+        with self._lock:
+            self.stages[key] = {"state": state, "seconds": seconds, "error": error}
+
+    def state(self, key: str) -> str:
+        with self._lock:
+            return self.stages[key]["state"]
+
+    def is_ready(self, *keys: str) -> bool:
+        with self._lock:
+            return all(self.stages[key]["state"] == READY for key in keys)
+
+    def run(self, tasks: List[Tuple[str, Callable[[], Any]]],
+            requires: Optional[Dict[str, List[str]]] = None,
+            attempts: Optional[Dict[str, int]] = None,
+            retry_delay: float = 5.0) -> threading.Thread:
+        """在后台线程中依次执行各阶段的任务
+
+        某个阶段失败不会阻止无关的后续阶段执行，失败信息记录在状态中；
+        失败的阶段可以之后通过 retry_failed 重新执行。
+
+        Args:
+            tasks: (阶段键, 任务函数) 列表；跳过的阶段直接标记为就绪即可
+            requires: {阶段键: 依赖的阶段键列表}，依赖未就绪时该阶段标记为失败并跳过
+            attempts: {阶段键: 最多尝试次数}，默认只执行一次
+            retry_delay: 两次尝试之间的等待时间（秒），每次失败后加倍
+
+        Returns:
+            后台线程
+        """
+        self._tasks = list(tasks)
+        self._requires = dict(requires or {})
+        self._attempts = dict(attempts or {})
+        self._retry_delay = retry_delay
+        with self._lock:
+            return self._start(self._tasks)
+
+    def retry_failed(self, min_interval: float = 60.0) -> bool:
+        """在后台重新执行失败的阶段，立即返回
+
+        用于预热失败后在首次使用时重试。仍有阶段在执行，或距上次执行不足 min_interval 秒时不做任何事。
+
+        Returns:
+            是否开始了重试
+        """
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return False
+            if time.monotonic() - self._last_run < min_interval:
+                return False
+            failed = [(key, task) for key, task in self._tasks if self.stages[key]["state"] == FAILED]
+            if not failed:
+                return False
+            self._start(failed)
+            return True
+
+    def _start(self, tasks: List[Tuple[str, Callable[[], Any]]]) -> threading.Thread:
+        """启动执行 tasks 的后台线程（调用方须持有 _lock）"""
+        def worker():
+            for key, task in tasks:
+                self._run_stage(key, task)
+
+        self._last_run = time.monotonic()
+        self._worker = threading.Thread(target=worker, name="startup-warmup", daemon=True)
+        self._worker.start()
+        return self._worker
+
+    def _run_stage(self, key: str, task: Callable[[], Any]):
+        label = self.labels.get(key, key)
+        missing = [dep for dep in self._requires.get(key, []) if not self.is_ready(dep)]
+        if missing:
+            reason = "、".join(self.labels.get(dep, dep) for dep in missing) + " 未就绪，已跳过"
+            print(f"启动任务 {label}: {reason}")
+            self.set(key, FAILED, error=reason)
+            return
+
+        attempts = max(1, self._attempts.get(key, 1))
+        delay = self._retry_delay
+        for attempt in range(1, attempts + 1):
+            self.set(key, RUNNING)
+            start = time.perf_counter()
+            try:
+                task()
+            except Exception as e:
+                print(f"启动任务 {label} 失败（第 {attempt}/{attempts} 次）: {e}")
+                self.set(key, FAILED, time.perf_counter() - start, str(e))
+                if attempt < attempts:
+                    time.sleep(delay)
+                    delay *= 2
+                continue
+            elapsed = time.perf_counter() - start
+            print(f"启动任务 {label} 完成，耗时 {elapsed:.1f} 秒")
+            self.set(key, READY, elapsed)
+            return
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {key: dict(value) for key, value in self.stages.items()}
+
+    def summary(self) -> str:
+        """以Markdown列出各阶段状态，供界面显示"""
+        lines = []
+        for key, stage in self.snapshot().items():
+            text = f"- {self.labels.get(key, key)}: {_STATE_LABELS[stage['state']]}"
+            if stage["seconds"] is not None:
+                text += f"（{stage['seconds']:.1f} 秒）"
+            if stage["error"]:
+                text += f" — {stage['error']}"
+            lines.append(text)
+        return "\n".join(lines)
+
+
+class StartupProfiler:
+    """记录启动过程中各阶段的耗时，供 --profile-startup 输出
+
+    除耗时外还记录每个阶段新导入的模块数量，便于发现被提前导入的重型依赖。
+    """
+
+    def __init__(self):
+        self.phases = []  # (阶段名称, 耗时秒数, 新导入模块数)
+
+    def record(self, name: str, seconds: float, modules: int = 0):
+        self.phases.append((name, seconds, modules))
+
+    @contextmanager
+    def phase(self, name: str):
+        """以上下文管理器的方式计时一个阶段"""
+        modules = len(sys.modules)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, len(sys.modules) - modules)
+
+    def report(self) -> str:
+        """各阶段耗时的文本表格"""
+        total = sum(seconds for _, seconds, _ in self.phases)
+        lines = [f"{'阶段':<16}{'耗时(毫秒)':>12}{'占比':>8}{'新模块':>8}"]
+        for name, seconds, modules in self.phases:
+            share = seconds / total * 100 if total else 0.0
+            lines.append(f"{name:<16}{seconds * 1000:>12.1f}{share:>7.1f}%{modules:>8}")
+        lines.append(f"{'合计':<16}{total * 1000:>12.1f}")
+        return "\n".join(lines)
@@ -0,0 +1,84 @@
+import re
+from functools import lru_cache
+from typing import List, Dict
+
+# 中日韩字符在常见分词器中通常各占约一个token
+_CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+# 每条聊天消息的格式开销（角色标记等）
+MESSAGE_OVERHEAD = 4
+
+_encoder = None
+_encoder_loaded = False
+
+
+def _get_encoder():
+    """加载tiktoken编码器；未安装或无法下载词表时返回None，退回估算"""
+    global _encoder, _encoder_loaded
+    if not _encoder_loaded:
+        _encoder_loaded = True
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            print(f"tiktoken不可用，使用估算的token数: {e}")
+            _encoder = None
+    return _encoder
+
+
+def estimate_tokens(text: str) -> int:
+    """不依赖分词器的token数估算：中日韩字符按1个，其余字符按4个一token"""
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    """计算文本的token数，结果按文本缓存，历史消息不会被重复计数
+
+    Args:
+        text: 文本内容
+
+    Returns:
+        token数
+    """
+    if not text:
+        return 0
+    encoder = _get_encoder()
+    if encoder is None:
+        return estimate_tokens(text)
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: List[Dict[str, str]]) -> int:
+    """计算聊天消息列表的token数（含每条消息的格式开销）"""
+    return sum(count_tokens(m.get("content") or "") + MESSAGE_OVERHEAD for m in messages)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, keep_end: bool = False) -> str:
+    """把文本截断到不超过 max_tokens 个token
+
+    Args:
+        text: 文本内容
+        max_tokens: token数上限
+        keep_end: 为True时保留文本末尾、从开头截断，否则保留开头
+    """
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoder = _get_encoder()
+    if encoder is not None:
+        tokens = encoder.encode(text, disallowed_special=())
+        return encoder.decode(tokens[-max_tokens:] if keep_end else tokens[:max_tokens])
+
+    # 估算模式下二分查找最长的满足预算的前缀（或后缀）
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        part = text[len(text) - mid:] if keep_end else text[:mid]
+        if estimate_tokens(part) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[len(text) - low:] if keep_end else text[:low]
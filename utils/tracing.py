@@ -0,0 +1,254 @@
+import json
+import time
+import uuid
+import asyncio
+import threading
+import contextvars
+import functools
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, List, Optional
+
+# 各阶段在诊断面板和日志摘要中的显示名称，未列出的阶段直接显示键名
+STAGE_LABELS = {
+    "semantic_cache": "语义缓存查找",
+    "retrieve": "知识库检索",
+    "embed_query": "查询嵌入",
+    "similarity_search": "向量检索",
+    "format_results": "结果整理",
+    "pack_context": "上下文组装",
+    "queue_wait": "等待模型名额",
+    "history": "历史整理",
+    "llm_first_token": "模型首字",
+    "llm_total": "模型生成",
+    "cache_write": "写入缓存",
+    "total": "总耗时",
+}
+
+# 当前线程或协程所属的请求跟踪，由 activate 设置，span 据此记录阶段耗时
+_current = contextvars.ContextVar("trace", default=None)
+
+
+class Trace:
+    """一次请求的各阶段耗时"""
+
+    def __init__(self, name: str, **attrs):
+        """
+        Args:
+            name: 请求类型，如 chat
+            attrs: 附加信息，如模型名称，随跟踪一起记录
+        """
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.error = None
+        self.seconds = None
+        self._start = time.perf_counter()
+        # [(阶段, 相对请求开始的时间, 耗时)]，单位秒
+        self.spans = []
+
+    def add(self, stage: str, seconds: float, start: Optional[float] = None):
+        """记录一个阶段的耗时，start 为该阶段开始时的 perf_counter 读数"""
+        offset = (start if start is not None else time.perf_counter() - seconds) - self._start
+        self.spans.append((stage, offset, seconds))
+
+    @contextmanager
+    def span(self, stage: str):
+        """计时一个阶段，异常同样记录耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start, start)
+
+    def elapsed(self) -> float:
+        return self.seconds if self.seconds is not None else time.perf_counter() - self._start
+
+    def durations(self) -> Dict[str, float]:
+        """各阶段的耗时（毫秒），按开始时间排列，同名阶段累加，total 为整个请求的耗时"""
+        result = {}
+        for stage, _, seconds in sorted(self.spans, key=lambda span: span[1]):
+            result[stage] = result.get(stage, 0.0) + seconds * 1000
+        result["total"] = self.elapsed() * 1000
+        return {stage: round(ms, 2) for stage, ms in result.items()}
+
+    def describe(self) -> str:
+        """一行文字摘要，用于控制台输出"""
+        durations = self.durations()
+        total = durations.pop("total")
+        parts = [f"{STAGE_LABELS.get(stage, stage)} {ms:.0f}ms" for stage, ms in durations.items()]
+        line = f"[{self.name}] 总耗时 {total:.0f}ms"
+        if parts:
+            line += "：" + "，".join(parts)
+        if self.error:
+            line += f"（失败: {self.error}）"
+        return line
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "attrs": self.attrs,
+            "error": self.error,
+            "durations_ms": self.durations(),
+            "spans": [{"stage": stage, "offset_ms": round(offset * 1000, 2), "ms": round(seconds * 1000, 2)}
+                      for stage, offset, seconds in sorted(self.spans, key=lambda span: span[1])],
+        }
+
+
+def _percentile(ordered: List[float], pct: float) -> float:
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class Tracer:
+    """收集请求跟踪：最近的请求保存在内存环形缓冲区中，可选逐条写入JSON日志"""
+
+    def __init__(self, buffer_size: int = 500, json_log: Optional[str] = None):
+        """
+        Args:
+            buffer_size: 保留最近多少个请求的跟踪
+            json_log: JSON日志文件路径，每个完成的请求写一行；"-" 表示标准输出，None表示不写
+        """
+        self._lock = threading.Lock()
+        self._traces = deque(maxlen=max(1, int(buffer_size)))
+        self.json_log = json_log
+
+    def configure(self, buffer_size: Optional[int] = None, json_log: Optional[str] = None):
+        """修改缓冲区大小和日志输出，已有的跟踪保留最近的部分"""
+        with self._lock:
+            if buffer_size is not None:
+                self._traces = deque(self._traces, maxlen=max(1, int(buffer_size)))
+            self.json_log = json_log
+
+    def start(self, name: str, **attrs) -> Trace:
+        return Trace(name, **attrs)
+
+    def finish(self, trace: Trace, error: Optional[BaseException] = None):
+        """结束跟踪并放入缓冲区，同一跟踪只记录一次"""
+        if trace.seconds is not None:
+            return
+        trace.seconds = time.perf_counter() - trace._start
+        if error is not None:
+            trace.error = str(error) or type(error).__name__
+        with self._lock:
+            self._traces.append(trace)
+            json_log = self.json_log
+        if json_log:
+            self._write_log(json_log, trace)
+
+    @contextmanager
+    def trace(self, name: str, **attrs):
+        """同步代码中跟踪一个请求，期间调用的 span 自动记入该请求"""
+        trace = self.start(name, **attrs)
+        try:
+            with activate(trace):
+                yield trace
+        except BaseException as e:
+            self.finish(trace, e)
+            raise
+        self.finish(trace)
+
+    def _write_log(self, path: str, trace: Trace):
+        line = json.dumps(trace.to_dict(), ensure_ascii=False)
+        try:
+            if path == "-":
+                print(line)
+                return
+            with self._lock, open(path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            print(f"写入跟踪日志失败: {e}")
+
+    def recent(self, limit: Optional[int] = None, name: Optional[str] = None) -> List[Trace]:
+        """最近的跟踪，新的在前"""
+        with self._lock:
+            traces = list(self._traces)
+        traces = [t for t in reversed(traces) if name is None or t.name == name]
+        return traces[:limit] if limit is not None else traces
+
+    def summary(self, name: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+        """缓冲区内各阶段耗时的分位数（毫秒），阶段按首次出现的顺序排列"""
+        samples = {}
+        for trace in reversed(self.recent(name=name)):
+            for stage, ms in trace.durations().items():
+                samples.setdefault(stage, []).append(ms)
+        result = {}
+        for stage, values in samples.items():
+            ordered = sorted(values)
+            result[stage] = {
+                "count": len(ordered),
+                "mean_ms": round(sum(ordered) / len(ordered), 2),
+                "p50_ms": _percentile(ordered, 50),
+                "p95_ms": _percentile(ordered, 95),
+                "p99_ms": _percentile(ordered, 99),
+                "max_ms": ordered[-1],
+            }
+        return result
+
+    def report(self, name: Optional[str] = None, recent: int = 10) -> str:
+        """Markdown 格式的诊断报告：各阶段分位数和最近几次请求"""
+        summary = self.summary(name)
+        if not summary:
+            return "暂无请求记录"
+        # 总耗时放在最后一行
+        stages = [stage for stage in summary if stage != "total"] + ["total"]
+        lines = ["| 阶段 | 次数 | p50 (ms) | p95 (ms) | p99 (ms) | 最大 (ms) |",
+                 "| --- | ---: | ---: | ---: | ---: | ---: |"]
+        for stage in stages:
+            s = summary[stage]
+            lines.append(f"| {STAGE_LABELS.get(stage, stage)} | {s['count']} | {s['p50_ms']:.1f} | "
+                         f"{s['p95_ms']:.1f} | {s['p99_ms']:.1f} | {s['max_ms']:.1f} |")
+
+        lines += ["", f"最近 {recent} 次请求：", ""]
+        for trace in self.recent(recent, name):
+            when = time.strftime("%H:%M:%S", time.localtime(trace.started_at))
+            lines.append(f"- {when} {trace.describe()}")
+        return "\n".join(lines)
+
+
+@contextmanager
+def activate(trace: Optional[Trace]):
+    """在当前上下文中设置请求跟踪，span 记入该跟踪"""
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def span(stage: str):
+    """在当前请求跟踪中计时一个阶段，没有活动的跟踪时不做任何事"""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(stage):
+        yield
+
+
+async def to_thread(trace: Optional[Trace], func: Callable, *args, **kwargs):
+    """同 asyncio.to_thread，线程中调用的 span 记入 trace"""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    context.run(_current.set, trace)
+    return await loop.run_in_executor(None, functools.partial(context.run, func, *args, **kwargs))
+
+
+# 进程内共享的跟踪器，界面、HTTP服务和命令行都记录到这里
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+def configure(buffer_size: Optional[int] = None, json_log: Optional[str] = None):
+    """修改共享跟踪器的设置"""
+    _tracer.configure(buffer_size=buffer_size, json_log=json_log)